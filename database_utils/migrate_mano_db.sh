@@ -36,7 +36,7 @@ QUIET_MODE=""
 BACKUP_DIR=""
 BACKUP_FILE=""
 #TODO update it with the last database version
-LAST_DB_VERSION=39
+LAST_DB_VERSION=40
 
 # Detect paths
 MYSQL=$(which mysql)
@@ -56,6 +56,8 @@ function usage(){
     echo -e "     -b DIR   backup folder where to create rollback backup file"
     echo -e "     -q --quiet: Do not prompt for credentials and exit if cannot access to database"
     echo -e "     --help   shows this help"
+    echo -e "  Migrating through version 40 needs python with the MySQLdb and yaml modules"\
+            "(packages python-mysqldb and python-yaml)"
 }
 
 while getopts ":u:p:b:P:h:d:q-:" o; do
@@ -1461,6 +1463,21 @@ function downgrade_from_39(){
 
     sql "DELETE FROM schema_version WHERE version_int='39';"
 }
+function upgrade_to_40(){
+    echo "      Encode 'extra' of vim_wim_actions as json"
+    python "${DBUTILS}/migrations/40_vim_wim_actions_extra.py" up "$TEMPFILE" "$DBNAME" || rollback_db
+    sql "ALTER TABLE vim_wim_actions CHANGE COLUMN extra extra TEXT NULL DEFAULT NULL " \
+        "COMMENT 'versioned json with params:, depends_on: for the task. yaml for old rows';"
+    sql "INSERT INTO schema_version (version_int, version, openmano_ver, comments, date) " \
+        "VALUES (40, '0.40', '0.6.20', 'Encode vim_wim_actions extra as json', '2019-06-03');"
+}
+function downgrade_from_40(){
+    echo "      Encode 'extra' of vim_wim_actions as yaml"
+    python "${DBUTILS}/migrations/40_vim_wim_actions_extra.py" down "$TEMPFILE" "$DBNAME" || rollback_db
+    sql "ALTER TABLE vim_wim_actions CHANGE COLUMN extra extra TEXT NULL DEFAULT NULL " \
+        "COMMENT 'json with params:, depends_on: for the task';"
+    sql "DELETE FROM schema_version WHERE version_int='40';"
+}
 #TODO ... put functions here
 
 
@@ -1537,6 +1554,19 @@ function check_migration_needed()
     [[ "$DATABASE_VER_NUM" -gt "$LAST_DB_VERSION" ]] &&
         echo "Database has been upgraded with a newer version of this script. Use this version to downgrade" >&2 &&
         exit 1
+    check_python_requirements
+    return 0
+}
+
+# check the python modules needed by the migrations done with python scripts, before touching the database
+function check_python_requirements()
+{
+    if [[ $DB_VERSION -ge 40 && $DATABASE_VER_NUM -lt 40 ]] || [[ $DB_VERSION -lt 40 && $DATABASE_VER_NUM -ge 40 ]]
+    then
+        python -c "import MySQLdb, yaml" 2>/dev/null ||
+            ! echo "    ERROR migration through version 40 needs python with the MySQLdb and yaml modules." \
+                "Install packages python-mysqldb and python-yaml" >&2 || exit 1
+    fi
     return 0
 }
 
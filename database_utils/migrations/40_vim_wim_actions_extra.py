@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openmano
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+"""
+Encode the 'extra' column of vim_wim_actions from yaml to the versioned json of osm_ro/action_extra.py (up), or back to
+yaml (down). Called by migrate_mano_db.sh for database version 40. It does not import osm_ro, that can be not installed
+where the database is migrated, so the encoding is repeated here. It needs the python MySQLdb and yaml modules, that
+migrate_mano_db.sh checks before starting the migration.
+Usage: 40_vim_wim_actions_extra.py up|down MYSQL_DEFAULTS_FILE DATABASE
+"""
+
+import json
+import sys
+
+import MySQLdb
+import yaml
+
+__author__ = "Alfonso Tierno"
+
+HEADER = "#json1\n"  # same as osm_ro.action_extra.HEADER
+CHUNK = 1000
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def to_json(text):
+    if text.startswith(HEADER):
+        return None
+    try:
+        return HEADER + json.dumps(yaml.load(text, Loader=_YamlLoader), separators=(',', ':'), sort_keys=True)
+    except (TypeError, ValueError):
+        return None  # not json serializable. It is kept as yaml, that is read also by the new version
+
+
+def to_yaml(text):
+    if not text.startswith(HEADER):
+        return None
+    return yaml.safe_dump(json.loads(text[len(HEADER):]), default_flow_style=True, width=256)
+
+
+def main(direction, defaults_file, database):
+    convert = to_json if direction == "up" else to_yaml
+    db = MySQLdb.connect(read_default_file=defaults_file, db=database)
+    cursor = db.cursor()
+    last_action_id, last_task_index = "", -1
+    converted = 0
+    while True:
+        cursor.execute("SELECT instance_action_id, task_index, extra FROM vim_wim_actions "
+                       "WHERE instance_action_id>%s OR (instance_action_id=%s AND task_index>%s) "
+                       "ORDER BY instance_action_id, task_index LIMIT %s",
+                       (last_action_id, last_action_id, last_task_index, CHUNK))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        for action_id, task_index, extra in rows:
+            new_extra = convert(extra) if extra else None
+            if new_extra is not None:
+                cursor.execute("UPDATE vim_wim_actions SET extra=%s WHERE instance_action_id=%s AND task_index=%s",
+                               (new_extra, action_id, task_index))
+                converted += 1
+        db.commit()
+        last_action_id, last_task_index = rows[-1][0], rows[-1][1]
+    db.close()
+    print("      {} vim_wim_actions converted".format(converted))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] not in ("up", "down"):
+        sys.stderr.write(__doc__)
+        sys.exit(1)
+    try:
+        main(*sys.argv[1:])
+    except (MySQLdb.Error, yaml.YAMLError, ValueError) as e:
+        sys.stderr.write("Cannot convert vim_wim_actions extra: {}\n".format(e))
+        sys.exit(1)
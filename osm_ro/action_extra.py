@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openmano
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+"""
+Encoding of the 'extra' column of vim_wim_actions.
+It is stored as compact json preceded by a version header. The header is a yaml comment, so the content is still valid
+yaml for any reader that uses yaml. Content without header (rows written by previous versions) is read as yaml.
+"""
+
+import json
+
+import six
+import yaml
+
+__author__ = "Alfonso Tierno"
+
+HEADER = "#json1\n"
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def _to_str(value):
+    """json returns unicode strings at python 2, while yaml returns str for the ascii ones, that are the ones expected
+    by the vim connectors"""
+    if isinstance(value, dict):
+        return {_to_str(k): _to_str(v) for k, v in value.items()}
+    elif isinstance(value, list):
+        return [_to_str(v) for v in value]
+    elif isinstance(value, six.text_type):
+        try:
+            return value.encode("ascii")
+        except UnicodeEncodeError:
+            return value
+    return value
+
+
+def dumps(extra):
+    """
+    Encode the content of 'extra' to be stored at database
+    :param extra: dictionary
+    :return: text. Keys are sorted, so that the same content gives always the same text and can be compared with the
+        one stored at database. Contents that cannot be encoded as json (e.g. with dates) are encoded as yaml
+    """
+    try:
+        return HEADER + json.dumps(extra, separators=(',', ':'), sort_keys=True)
+    except (TypeError, ValueError):
+        return yaml.safe_dump(extra, default_flow_style=True, width=256)
+
+
+def loads(text):
+    """
+    Decode the content of 'extra' read from database
+    :param text: text encoded with dumps, or with yaml by previous versions
+    :return: the decoded content. None if text is empty
+    """
+    if not text:
+        return None
+    if text.startswith(HEADER):
+        extra = json.loads(text[len(HEADER):])
+        return _to_str(extra) if six.PY2 else extra
+    return yaml.load(text, Loader=_YamlLoader)
@@ -23,166 +23,329 @@
 
 '''
 Implement like a proxy for TCP/IP in a separated thread.
-It creates two sockets to bypass the TCP/IP packets among the fix console 
-server specified at class construction (console_host, console_port)
-and a client that connect against the (host, port) specified also at construction
+A single thread with an event loop (epoll, or poll where not available) serves all the listening ports and all the
+sessions. Each listening port (host, port) bypasses the TCP/IP packets to a fix console server (console_host,
+console_port) of the VIM. Sessions without traffic during idle_timeout seconds are closed.
 
                 ---------------------           -------------------------------
                 |       OPENMANO     |          |         VIM                  |
-client 1  ----> | ConsoleProxyThread | ------>  |  Console server              |
-client 2  ----> |  (host, port)      | ------>  |(console_host, console_server)|
+client 1  ----> |   ConsoleProxy     | ------>  |  Console server 1            |
+client 2  ----> |  (host, port1)     | ------>  |(console_host, console_port)  |
+client 3  ----> |  (host, port2)     | ------>  |  Console server 2            |
    ...           --------------------            ------------------------------
 '''
 __author__="Alfonso Tierno"
 __date__ ="$19-nov-2015 09:07:15$"
 
-import socket
+import errno
+import logging
+import os
 import select
+import socket
 import threading
-import logging
+import time
 
 
 class ConsoleProxyException(Exception):
-    '''raise when an exception has found''' 
+    '''raise when an exception has found'''
 class ConsoleProxyExceptionPortUsed(ConsoleProxyException):
-    '''raise when the port is used''' 
+    '''raise when the port is used'''
 
-class ConsoleProxyThread(threading.Thread):
-    buffer_size = 4096
-    check_finish = 1 #frequency to check if requested to end in seconds
 
-    def __init__(self, host, port, console_host, console_port, log_level=None):
-        try:
-            threading.Thread.__init__(self)
-            self.console_host = console_host
-            self.console_port = console_port
-            self.host = host
-            self.port = port
-            self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server.bind((host, port))
-            self.server.listen(200)
-            #TODO timeout in a lock section can be used to autoterminate the thread
-            #when inactivity and timeout<time : set timeout=0 and terminate
-            #from outside, close class when timeout==0; set timeout=time+120 when adding a new console on this thread
-            #set self.timeout = time.time() + 120 at init
-            self.name = "ConsoleProxy " + console_host + ":" + str(console_port)
-            self.input_list = [self.server]
-            self.channel = {}
-            self.terminate = False #put at True from outside to force termination
-            self.logger = logging.getLogger('openmano.console')
-            if log_level:
-                self.logger.setLevel( getattr(logging, log_level) )
+if hasattr(select, "epoll"):
+    _Poller = select.epoll
+    _POLL_TIMEOUT_FACTOR = 1  # epoll timeout is in seconds
+    _READ, _WRITE, _ERROR = select.EPOLLIN, select.EPOLLOUT, select.EPOLLERR | select.EPOLLHUP
+else:
+    _Poller = select.poll
+    _POLL_TIMEOUT_FACTOR = 1000  # poll timeout is in milliseconds
+    _READ, _WRITE, _ERROR = select.POLLIN, select.POLLOUT, select.POLLERR | select.POLLHUP
+_RETRY_ERRNOS = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+
+
+class _Listener(object):
+    def __init__(self, sock, port, console_host, console_port):
+        self.sock = sock
+        self.port = port
+        self.console_host = console_host
+        self.console_port = console_port
+
 
+class _Session(object):
+    '''Connection of a client with a console server. Data is received on a fixed buffer for each direction; when the
+    destination cannot take it all, the rest is kept pending and the source is not read until it is sent'''
+
+    def __init__(self, client, client_address, server, listener, buffer_size):
+        self.client = client
+        self.server = server
+        self.fds = (client.fileno(), server.fileno())  # kept to unregister them once closed
+        self.name = "{}:{} -> {}:{}".format(client_address[0], client_address[1], listener.console_host,
+                                            listener.console_port)
+        self.port = listener.port
+        self.connected = False  # connection with the console server is in progress until it is writable
+        self.created_at = self.last_activity = time.time()
+        self.bytes_in = 0  # from client to console server
+        self.bytes_out = 0  # from console server to client
+        self.buffers = {client: bytearray(buffer_size), server: bytearray(buffer_size)}
+        self.pending = {client: None, server: None}  # data read from a socket pending to be sent to the peer
+        self.peer = {client: server, server: client}
+
+    def get_stats(self):
+        return {"name": self.name, "port": self.port, "bytes_in": self.bytes_in, "bytes_out": self.bytes_out,
+                "created_at": self.created_at, "last_activity": self.last_activity}
+
+
+class ConsoleProxy(threading.Thread):
+    buffer_size = 65536  # bytes read each time from a socket
+    check_finish = 1  # frequency to check if requested to end and for idle sessions, in seconds
+    idle_timeout = 3600  # sessions without traffic in any direction during this time, in seconds, are closed
+
+    def __init__(self, host, idle_timeout=None, log_level=None):
+        '''
+        :param host: IP address where the ports are listening
+        :param idle_timeout: to override the class default
+        :param log_level: to override the level of the 'openmano.console' logger
+        '''
+        threading.Thread.__init__(self)
+        self.name = "ConsoleProxy"
+        self.daemon = True
+        self.host = host
+        if idle_timeout:
+            self.idle_timeout = idle_timeout
+        self.logger = logging.getLogger('openmano.console')
+        if log_level:
+            self.logger.setLevel(getattr(logging, log_level))
+        self.poller = _Poller()
+        self.lock = threading.Lock()  # listeners are added, and the loop is woken up, from other threads
+        self.listeners = {}  # fileno: _Listener
+        self.sessions = {}  # fileno of client and console server sockets: _Session
+        self.consoles = {}  # (console_host, console_port): listening port
+        self.stats = {"sessions": 0, "sessions_reaped": 0, "bytes_in": 0, "bytes_out": 0}
+        self.terminate_event = threading.Event()
+        # the loop is woken up by writing to this pipe
+        self.wakeup_read, self.wakeup_write = os.pipe()
+        self.poller.register(self.wakeup_read, _READ)
+
+    def get_port(self, console_host, console_port):
+        '''Return the listening port that bypasses to this console server, or None if not added'''
+        return self.consoles.get((console_host, console_port))
+
+    def add_console(self, port, console_host, console_port):
+        '''
+        Listen at a new port that bypasses to a console server
+        :param port: listening port
+        :param console_host, console_port: console server of the VIM
+        :return: None. Raises ConsoleProxyExceptionPortUsed if port is already in use, or ConsoleProxyException
+        '''
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                sock.bind((self.host, port))
+                sock.listen(200)
+                sock.setblocking(0)
+            except Exception:
+                sock.close()
+                raise
         except (socket.error, socket.herror, socket.gaierror, socket.timeout) as e:
-            if e is socket.error and e.errno==98:
+            if isinstance(e, socket.error) and e.errno == errno.EADDRINUSE:
                 raise ConsoleProxyExceptionPortUsed("socket.error " + str(e))
-            raise ConsoleProxyException(type(e).__name__ + ": "+  (str(e) if len(e.args)==0 else str(e.args[0])) )
-        
+            raise ConsoleProxyException(type(e).__name__ + ": " + (str(e) if len(e.args) == 0 else str(e.args[0])))
+        with self.lock:
+            self.listeners[sock.fileno()] = _Listener(sock, port, console_host, console_port)
+            self.consoles[(console_host, console_port)] = port
+            self.poller.register(sock.fileno(), _READ)
+        self.logger.debug("Listening at %s:%d for console %s:%s", self.host, port, console_host, console_port)
+
+    def get_stats(self):
+        '''Return the global counters, and the ones of each opened session'''
+        stats = self.stats.copy()
+        stats["consoles"] = len(self.listeners)
+        stats["sessions_opened"] = [session.get_stats() for session in set(self.sessions.values())]
+        return stats
+
+    def terminate(self):
+        self.terminate_event.set()
+        self._wakeup()
+
+    def _wakeup(self):
+        with self.lock:
+            if self.wakeup_write is not None:
+                os.write(self.wakeup_write, b"x")
+
     def run(self):
-        while 1:
+        next_check = time.time() + self.check_finish
+        while not self.terminate_event.is_set():
             try:
-                inputready, _, _ = select.select(self.input_list, [], [], self.check_finish)
-            except select.error as e:
-                self.logger.error("Exception on select %s: %s", type(e).__name__, str(e) )
-                self.on_terminate()
-
-            if self.terminate:
-                self.on_terminate()
-                self.logger.debug("Terminate because commanded")
+                events = self.poller.poll(self.check_finish * _POLL_TIMEOUT_FACTOR)
+            except (IOError, OSError, select.error) as e:
+                if e.args and e.args[0] == errno.EINTR:
+                    continue
+                self.logger.error("Exception on poll %s: %s", type(e).__name__, str(e))
                 break
-            
-            for sock in inputready:
-                if sock == self.server:
-                    self.on_accept()
-                else:
-                    self.on_recv(sock)
-                    
-    def on_terminate(self):
-        while self.input_list:
-            if self.input_list[0] is self.server:
-                self.server.close()
-                del self.input_list[0]
-            else:
-                self.on_close(self.input_list[0], "Terminating thread")
+            for fd, event in events:
+                try:
+                    self._on_event(fd, event)
+                except Exception as e:
+                    self.logger.critical("Unexpected exception at console proxy: %s", str(e), exc_info=True)
+                    session = self.sessions.get(fd)
+                    if session:
+                        self._close(session, "Unexpected exception")
+            now = time.time()
+            if now >= next_check:
+                next_check = now + self.check_finish
+                self._reap_idle(now)
+        self.logger.debug("Terminate because commanded")
+        self._on_terminate()
 
-    def on_accept(self):
-        #accept
-        try:
-            clientsock, clientaddr = self.server.accept()
-        except (socket.error, socket.herror, socket.gaierror, socket.timeout) as e:
-            self.logger.error("Exception on_accept %s: %s", type(e).__name__, str(e) )
-            return False
-        #print self.name, ": Accept new client ", clientaddr
+    def _on_event(self, fd, event):
+        if fd == self.wakeup_read:
+            os.read(self.wakeup_read, 4096)
+            return
+        listener = self.listeners.get(fd)
+        if listener:
+            self._on_accept(listener)
+            return
+        session = self.sessions.get(fd)
+        if not session:
+            return
+        sock = session.client if session.fds[0] == fd else session.server
+        if not session.connected:
+            if sock is session.server:
+                self._on_connect(session, event)
+            elif event & _ERROR:
+                self._close(session, "Hang up")
+            return
+        if event & _ERROR and (not event & _READ or session.pending[sock] is not None):
+            self._close(session, "Hang up")
+            return
+        if event & _WRITE:
+            source = session.peer[sock]  # data pending to be written at sock is the one read from its peer
+            if session.pending[source] is not None:
+                if not self._send_pending(session, source):
+                    return
+                if session.pending[source] is None:
+                    self._update_events(session)
+        if event & _READ and session.pending[sock] is None:
+            self._on_recv(session, sock)
 
-        #connect
+    def _on_accept(self, listener):
         try:
-            forward = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            forward.connect((self.console_host, self.console_port))
-            name = "%s:%d => (%s:%d => %s:%d) => %s:%d" %\
-                (clientsock.getpeername() + clientsock.getsockname()  + forward.getsockname() + forward.getpeername() )
-            self.logger.warn("new connection " + name)
-                
-            self.input_list.append(clientsock)
-            self.input_list.append(forward)
-            info = { "name": name,
-                    "clientsock" : clientsock,
-                    "serversock" : forward
-                    }
-            self.channel[clientsock] = info
-            self.channel[forward] = info
-            return True
-        except (socket.error, socket.herror, socket.gaierror, socket.timeout) as e:
-            self.logger.error("Exception on_connect to server %s:%d; %s: %s  Close client side %s",
-                self.console_host, self.console_port, type(e).__name__, str(e), str(clientaddr) )
-            clientsock.close()
-            return False
-
-    def on_close(self, sock, cause):
-        if sock not in self.channel:
-            return  #can happen if there is data ready to received at both sides and the channel has been deleted. QUITE IMPROBABLE but just in case
-        info = self.channel[sock]
-        #debug info
-        sockname = "client" if sock is info["clientsock"] else "server"
-        self.logger.warn("del connection %s %s at %s side", info["name"], str(cause), str(sockname) )
-        #close sockets
+            client, client_address = listener.sock.accept()
+        except socket.error as e:
+            if e.errno not in _RETRY_ERRNOS:
+                self.logger.error("Exception on_accept %s: %s", type(e).__name__, str(e))
+            return
+        # connect to the console server without blocking the rest of sessions
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        client.setblocking(0)
+        server.setblocking(0)
+        for sock in (client, server):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        session = _Session(client, client_address, server, listener, self.buffer_size)
         try:
-            # close the connection with client
-            info["clientsock"].close()  # equivalent to do self.s.close()
+            error = server.connect_ex((listener.console_host, listener.console_port))
         except (socket.error, socket.herror, socket.gaierror, socket.timeout) as e:
-            self.logger.error("Exception on_close client socket %s: %s", type(e).__name__, str(e) )
+            error = e.args[0] if e.args else -1
+        if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            self.logger.error("Cannot connect to %s:%s: %s", listener.console_host, listener.console_port,
+                              os.strerror(error) if error > 0 else error)
+            client.close()
+            server.close()
+            return
+        self.sessions[client.fileno()] = session
+        self.sessions[server.fileno()] = session
+        self.poller.register(client.fileno(), 0)  # not read until connected with the console server
+        self.poller.register(server.fileno(), _WRITE)
+        self.stats["sessions"] += 1
+        self.logger.debug("New session %s", session.name)
+
+    def _on_connect(self, session, event):
+        error = session.server.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error or event & _ERROR:
+            self._close(session, "Cannot connect: " + (os.strerror(error) if error else "hang up"))
+            return
+        session.connected = True
+        session.last_activity = time.time()
+        self._update_events(session)
+
+    def _update_events(self, session):
+        '''Read a socket only when there is not data from it pending to be sent. Wait for writing when there is'''
+        for sock in (session.client, session.server):
+            events = 0 if session.pending[sock] is not None else _READ
+            if session.pending[session.peer[sock]] is not None:
+                events |= _WRITE
+            self.poller.modify(sock.fileno(), events)
+
+    def _on_recv(self, session, sock):
+        buffer = session.buffers[sock]
         try:
-            # close the connection with remote server
-            info["serversock"].close()
-        except (socket.error, socket.herror, socket.gaierror, socket.timeout) as e:
-            self.logger.error("Exception on_close server socket %s: %s", type(e).__name__, str(e) )
-        
-        #remove objects from input_list
-        self.input_list.remove(info["clientsock"])
-        self.input_list.remove(info["serversock"])
-        # delete both objects from channel dict
-        del self.channel[info["clientsock"]]
-        del self.channel[info["serversock"]]
-
-    def on_recv(self, sock):
-        if sock not in self.channel:
-            return  #can happen if there is data ready to received at both sides and the channel has been deleted. QUITE IMPROBABLE but just in case
-        info = self.channel[sock]
-        peersock = info["serversock"] if sock is info["clientsock"] else info["clientsock"]
+            size = sock.recv_into(buffer)
+        except socket.error as e:
+            if e.errno in _RETRY_ERRNOS:
+                return
+            self._close(session, "Exception on recv: " + str(e))
+            return
+        if not size:
+            self._close(session, "Peer closed")
+            return
+        session.last_activity = time.time()
+        if sock is session.client:
+            session.bytes_in += size
+            self.stats["bytes_in"] += size
+        else:
+            session.bytes_out += size
+            self.stats["bytes_out"] += size
+        session.pending[sock] = memoryview(buffer)[:size]
+        if self._send_pending(session, sock) and session.pending[sock] is not None:
+            # the destination could not take all; wait until it is writable
+            self._update_events(session)
+
+    def _send_pending(self, session, sock):
+        '''
+        Send the data pending from sock to its peer
+        :return: False if the session is closed
+        '''
+        pending = session.pending[sock]
         try:
-            data = sock.recv(self.buffer_size)
-            if len(data) == 0:
-                self.on_close(sock, "peer closed")
+            sent = session.peer[sock].send(pending)
+        except socket.error as e:
+            if e.errno in _RETRY_ERRNOS:
+                sent = 0
             else:
-                #print self.data
-                sock = peersock
-                peersock.send(data)
-        except (socket.error, socket.herror, socket.gaierror, socket.timeout) as e:
-            #print self.name, ": Exception %s: %s" % (type(e).__name__, str(e) )
-            self.on_close(sock, "Exception %s: %s" % (type(e).__name__, str(e) ))
+                self._close(session, "Exception on send: " + str(e))
+                return False
+        session.pending[sock] = pending[sent:] if sent < len(pending) else None
+        return True
+
+    def _reap_idle(self, now):
+        for session in set(self.sessions.values()):
+            if now - session.last_activity > self.idle_timeout:
+                self.stats["sessions_reaped"] += 1
+                self._close(session, "Idle for more than {} seconds".format(self.idle_timeout))
 
-        
+    def _close(self, session, cause):
+        for fd in session.fds:
+            if self.sessions.pop(fd, None):
+                try:
+                    self.poller.unregister(fd)
+                except (IOError, OSError, KeyError, ValueError):
+                    pass
+        session.client.close()
+        session.server.close()
+        self.logger.debug("Close session %s: %s. Bytes in %d, out %d", session.name, cause, session.bytes_in,
+                          session.bytes_out)
 
-    #def start_timeout(self):
-    #    self.timeout = time.time() + 120
-        
+    def _on_terminate(self):
+        for session in set(self.sessions.values()):
+            self._close(session, "Terminating thread")
+        with self.lock:
+            for listener in self.listeners.values():
+                listener.sock.close()
+            self.listeners = {}
+            self.consoles = {}
+            os.close(self.wakeup_read)
+            os.close(self.wakeup_write)
+            self.wakeup_write = None
+        if hasattr(self.poller, "close"):  # poll objects have not close
+            self.poller.close()
@@ -32,19 +32,25 @@ import uuid as myUuid
 import  utils as af
 import json
 #import yaml
+import sys
 import time
 import logging
 import datetime
+import six
+from collections import OrderedDict
 from contextlib import contextmanager
 from functools import wraps, partial
-from threading import Lock
-from jsonschema import validate as js_v, exceptions as js_e
+from threading import Lock, Condition, local
+from jsonschema import exceptions as js_e
 
 from .http_tools import errors as httperrors
+from .openmano_schemas import validate as js_v
 from .utils import Attempt, get_arg, inject_args
 
 
 RECOVERY_TIME = 3
+POOL_PING_TIME = 10  # idle connections of the pool are checked with ping after this time in seconds
+STATEMENT_CACHE_SIZE = 1000  # maximum number of SQL templates kept by the query builder
 
 _ATTEMPT = Attempt()
 
@@ -210,21 +216,257 @@ class db_base_Exception(httperrors.HttpMappedError):
     def __init__(self, message, http_code=httperrors.Bad_Request):
         super(db_base_Exception, self).__init__(message, http_code)
 
-class db_base():
+# Query builder. SQL commands are composed as a template with %s placeholders plus the list of values bound to them by
+# the MySQLdb cursor, instead of quoting the values inside the text. The template only depends on the 'shape' of the
+# query (table, columns, WHERE keys and number of items of each list), that is obtained while collecting the values,
+# so the template of a repeated query (as the polling of the vim_threads) is composed once and taken from a cache.
+_statement_cache = {}
+
+
+def _db_value(value):
+    """Value to bind to a placeholder. Non string values are converted to text, as done when quoting them at the SQL"""
+    if isinstance(value, (str, unicode)):
+        return value
+    return str(value)
+
+
+def _where_shape(data, params, use_or=None):
+    """
+    Walk a WHERE clause appending its values to params in the same order as the placeholders of its template.
+    See db_base.get_rows for the WHERE format
+    :param data: dict or list of dicts
+    :param params: list where the values are appended
+    :param use_or: Can be None (use default behaviour), True (use OR) or False (use AND)
+    :return: hashable shape of the WHERE clause, used by _where_template and as key of the statement cache
+    """
+    if isinstance(data, dict):
+        shape = []
+        for k, v in data.items():
+            if k == "OR" or k == "AND":
+                shape.append((k, _where_shape(v, params, use_or=(k == "OR"))))
+            elif v is None:
+                shape.append((k, None))
+            elif isinstance(v, (tuple, list)):
+                items = []
+                for v2 in v:
+                    if v2 is None:
+                        items.append(False)
+                    else:
+                        items.append(True)
+                        params.append(_db_value(v2))
+                shape.append((k, tuple(items)))
+            else:
+                shape.append((k, True))
+                params.append(_db_value(v))
+        return "dict", use_or, tuple(shape)
+    elif isinstance(data, (tuple, list)):
+        return "list", use_or, tuple(_where_shape(k, params) for k in data)
+    else:
+        raise db_base_Exception("invalid WHERE clause at '{}'".format(data))
+
+
+def _where_template(shape):
+    """Compose the SQL WHERE text of a shape obtained with _where_shape"""
+    kind, use_or, items = shape
+    cmd = []
+    if kind == "dict":
+        for k, v in items:
+            if k == "OR" or k == "AND":
+                cmd.append("(" + _where_template(v) + ")")
+                continue
+            k = k.replace("%", "%%")
+            if not (k.endswith(">") or k.endswith("<") or k.endswith("=") or k.endswith(" LIKE ")):
+                k += "="
+            if v is None:
+                cmd.append(k.replace("=", " is").replace("<>", " is not") + " Null")
+            elif v is True:
+                cmd.append(k + "%s")
+            else:
+                null = k.replace("=", " is").replace("<>", " is not") + " Null"
+                cmd.append("(" + " OR ".join(k + "%s" if v2 else null for v2 in v) + ")")
+    else:
+        if use_or is None:
+            use_or = True
+        for k in items:
+            cmd.append("(" + _where_template(k) + ")")
+    if use_or:
+        return " OR ".join(cmd)
+    return " AND ".join(cmd)
+
+
+def _sql_text(data):
+    """Literal SQL text of a SELECT or ORDER_BY entry, a string or a list of strings, escaping the '%' character"""
+    if isinstance(data, (tuple, list)):
+        data = ",".join(map(str, data))
+    return str(data).replace("%", "%%")
+
+
+def _get_statement(shape, compose):
+    """Return the template of a statement shape, composing it with the compose function if it is not cached"""
+    statement = _statement_cache.get(shape)
+    if statement is None:
+        if len(_statement_cache) >= STATEMENT_CACHE_SIZE:
+            _statement_cache.clear()
+        statement = _statement_cache[shape] = compose(shape)
+    return statement
+
+
+def _compose_select(shape):
+    _, select, table, where, order_by, limit = shape
+    cmd = "SELECT " + select + " FROM " + table
+    if where:
+        cmd += " WHERE " + _where_template(where)
+    if order_by is not None:
+        cmd += " ORDER BY " + order_by
+    if limit is not None:
+        cmd += " LIMIT " + limit
+    return cmd
+
+
+def _compose_update(shape):
+    _, table, values, modified_time, where = shape
+    sets = []
+    for k, v in values:
+        if v is None:
+            sets.append(k + "=Null")
+        elif v is True:
+            sets.append(k + "=%s")
+        else:
+            sets.append("{A}={A}{N:+d}".format(A=k, N=v[1]))
+    if modified_time:
+        sets.append("modified_at=%s")
+    return "UPDATE " + table + " SET " + ",".join(sets) + " WHERE " + _where_template(where)
+
+
+def _compose_delete(shape):
+    _, table, where, limit = shape
+    cmd = "DELETE FROM " + table
+    if where:
+        cmd += " WHERE " + _where_template(where)
+    if limit is not None:
+        cmd += " LIMIT " + limit
+    return cmd
+
+
+def _compose_insert(shape):
+    _, table, columns, created_time = shape
+    if created_time:
+        columns += ("created_at", "modified_at")
+    return "INSERT INTO " + table + " (" + ",".join(columns) + ") VALUES (" + ",".join(("%s",) * len(columns)) + ")"
+
+
+def build_insert(table, INSERT, created_time=0):
+    """
+    Compose a parameterized SQL INSERT of one row. Rows with the same columns get the same template (the same object),
+    so that they can be inserted together with cursor.executemany. See db_base._new_row_internal for the meaning of
+    the parameters
+    :return: tuple with the SQL template and the tuple of values to be bound to it
+    """
+    columns = []
+    params = []
+    for k in sorted(INSERT):
+        v = INSERT[k]
+        if isinstance(v, dict):
+            raise db_base_Exception("Format error for INSERT field: {!r}".format(k))
+        columns.append(_sql_text(k))
+        params.append(None if v is None else _db_value(v))
+    if created_time:
+        params += ["{:.9f}".format(created_time)] * 2
+    shape = ("INSERT", _sql_text(table), tuple(columns), bool(created_time))
+    return _get_statement(shape, _compose_insert), tuple(params)
+
+
+def build_select(SELECT="*", FROM=None, WHERE=None, ORDER_BY=None, LIMIT=None):
+    """
+    Compose a parameterized SQL SELECT. See db_base.get_rows for the meaning of the parameters
+    :return: tuple with the SQL template and the tuple of values to be bound to it
+    """
+    params = []
+    where = _where_shape(WHERE, params) if WHERE else None
+    shape = ("SELECT", _sql_text(SELECT), _sql_text(FROM), where,
+             _sql_text(ORDER_BY) if ORDER_BY is not None else None, str(LIMIT) if LIMIT is not None else None)
+    return _get_statement(shape, _compose_select), tuple(params)
+
+
+def build_update(table, UPDATE, WHERE, modified_time=0):
+    """
+    Compose a parameterized SQL UPDATE. See db_base.update_rows for the meaning of the parameters
+    :return: tuple with the SQL template and the tuple of values to be bound to it
+    """
+    params = []
+    values = []
+    for k, v in UPDATE.iteritems():
+        k = _sql_text(k)
+        if v is None:
+            values.append((k, None))
+        elif isinstance(v, dict):
+            if "INCREMENT" not in v:
+                raise db_base_Exception("Format error for UPDATE field: {!r}".format(k))
+            values.append((k, ("INCREMENT", v["INCREMENT"])))
+        else:
+            values.append((k, True))
+            params.append(_db_value(v))
+    if modified_time:
+        params.append("{:f}".format(modified_time))
+    shape = ("UPDATE", _sql_text(table), tuple(values), bool(modified_time), _where_shape(WHERE, params))
+    return _get_statement(shape, _compose_update), tuple(params)
+
+
+def build_delete(FROM=None, WHERE=None, LIMIT=None):
+    """
+    Compose a parameterized SQL DELETE. See db_base.delete_row for the meaning of the parameters
+    :return: tuple with the SQL template and the tuple of values to be bound to it
+    """
+    params = []
+    where = _where_shape(WHERE, params) if WHERE else None
+    shape = ("DELETE", _sql_text(FROM), where, str(LIMIT) if LIMIT is not None else None)
+    return _get_statement(shape, _compose_delete), tuple(params)
+
+
+class db_base(object):
     tables_with_created_field=()
 
     def __init__(self, host=None, user=None, passwd=None, database=None,
-                 log_name='db', log_level=None, lock=None):
+                 log_name='db', log_level=None, lock=None, pool_size=1):
+        """
+        :param lock: kept for backward compatibility. Transactions are synchronized by the connection pool
+        :param pool_size: maximum number of connections to the database. Each transaction takes one connection from
+            the pool, so that up to pool_size transactions can be executed concurrently by different threads
+        """
         self.host = host
         self.user = user
         self.passwd = passwd
         self.database = database
-        self.con = None
         self.log_level=log_level
         self.logger = logging.getLogger(log_name)
         if self.log_level:
             self.logger.setLevel( getattr(logging, log_level) )
         self.lock = lock or Lock()
+        self._con = None  # connection used outside transactions. It is also part of the pool
+        self._local = local()  # connection and cursor of the transaction in course of each thread
+        self.pool_size = pool_size or 1
+        self.pool_idle = []  # (connection, time it was returned) not used by any transaction
+        self.pool_total = 0  # number of opened connections, idle or in use
+        self.pool_condition = Condition(Lock())
+        self.pool_stats = {"checkouts": 0, "waits": 0, "wait_time": 0.0, "max_wait_time": 0.0, "max_in_use": 0}
+
+    @property
+    def con(self):
+        """Connection of the transaction in course of this thread, or the main connection outside transactions"""
+        return getattr(self._local, "con", None) or self._con
+
+    @con.setter
+    def con(self, value):
+        self._con = value
+
+    @property
+    def cur(self):
+        """Cursor of the transaction in course of this thread"""
+        return self._local.cur
+
+    @cur.setter
+    def cur(self, value):
+        self._local.cur = value
 
     def connect(self, host=None, user=None, passwd=None, database=None):
         '''Connect to specific data base.
@@ -239,6 +481,7 @@ class db_base():
 
             self.con = mdb.connect(self.host, self.user, self.passwd, self.database)
             self.logger.debug("DB: connected to '%s' at '%s@%s'", self.database, self.user, self.host)
+            self._pool_reset(self.con)
         except mdb.Error as e:
             raise db_base_Exception("Cannot connect to DataBase '{}' at '{}@{}' Error {}: {}".format(
                                     self.database, self.user, self.host, e.args[0], e.args[1]),
@@ -272,6 +515,7 @@ class db_base():
 
     def disconnect(self):
         '''disconnect from specific data base'''
+        self._pool_reset()
         try:
             self.con.close()
             self.con = None
@@ -296,6 +540,16 @@ class db_base():
             self.con = None
             self.connect()
 
+    def reset_after_fork(self):
+        """To be called at a child process after os.fork. The inherited connections are shared with the parent
+        process, so they are forgotten, not closed, and a new connection is opened"""
+        self._local = local()
+        self.pool_condition = Condition(Lock())
+        self.pool_idle = []
+        self.pool_total = 0
+        self._con = None
+        self.connect()
+
     def fork_connection(self):
         """Return a new database object, with a separated connection to the
         database (and lock), so it can act independently
@@ -307,7 +561,8 @@ class db_base():
             database=self.database,
             log_name=self.logger.name,
             log_level=self.log_level,
-            lock=Lock()
+            lock=Lock(),
+            pool_size=self.pool_size
         )
 
         obj.connect()
@@ -319,8 +574,10 @@ class db_base():
         """DB changes that are executed inside this context will be
         automatically rolled back in case of error.
 
-        This implementation also adds a lock, so threads sharing the same
-        connection object are synchronized.
+        Each transaction takes a connection from the pool, so threads sharing
+        the same object are executed concurrently up to the pool size.
+        Transactions nested inside a transaction of the same thread are part
+        of the outer one.
 
         Arguments:
             cursor_type: default: MySQLdb.cursors.DictCursor
@@ -336,18 +593,121 @@ class db_base():
         # API for the connection object.
         # This support was removed in version 1.40
         # https://github.com/PyMySQL/mysqlclient-python/blob/master/HISTORY.rst#whats-new-in-140
-        with self.lock:
-            try:
-                if self.con.get_autocommit():
-                    self.con.query("BEGIN")
+        con = getattr(self._local, "con", None)
+        if con:
+            self.cur = con.cursor(cursor_type)
+            yield self.cur
+            return
 
-                self.cur = self.con.cursor(cursor_type)
-                yield self.cur
-            except:  # noqa
-                self.con.rollback()
-                raise
+        con = self._pool_checkout()
+        self._local.con = con
+        broken = False
+        try:
+            if con.get_autocommit():
+                con.query("BEGIN")
+
+            self.cur = con.cursor(cursor_type)
+            yield self.cur
+        except:  # noqa
+            exc_info = sys.exc_info()
+            try:
+                con.rollback()
+            except mdb.Error:
+                broken = True  # probably the connection is lost. It is not returned to the pool
+            six.reraise(*exc_info)
+        else:
+            con.commit()
+        finally:
+            self._local.con = None
+            self._pool_checkin(con, broken)
+
+    def _pool_reset(self, con=None):
+        """Close the idle connections of the pool, and use con as the only idle one. Connections in use by other
+        threads are closed when they are returned to the pool if it is full
+        """
+        with self.pool_condition:
+            in_use = self.pool_total - len(self.pool_idle)
+            for idle_con, _ in self.pool_idle:
+                if idle_con is not con and idle_con is not self._con:
+                    try:
+                        idle_con.close()
+                    except mdb.Error:
+                        pass
+            self.pool_idle = [(con, time.time())] if con else []
+            self.pool_total = in_use + len(self.pool_idle)
+            self.pool_condition.notify_all()
+
+    def _pool_checkout(self):
+        """Take an idle connection from the pool, opening a new one if the pool is not full, or waiting until other
+        thread returns a connection. Idle connections are checked with ping and replaced if not valid
+        :return: the connection
+        """
+        start = time.time()
+        con = None
+        with self.pool_condition:
+            while not self.pool_idle and self.pool_total >= self.pool_size:
+                self.pool_condition.wait()
+            if self.pool_idle:
+                con, idle_since = self.pool_idle.pop()
+            else:
+                self.pool_total += 1
+            now = time.time()
+            wait_time = now - start
+            self.pool_stats["checkouts"] += 1
+            if wait_time > 0.001:
+                self.pool_stats["waits"] += 1
+                self.pool_stats["wait_time"] += wait_time
+                self.pool_stats["max_wait_time"] = max(self.pool_stats["max_wait_time"], wait_time)
+            self.pool_stats["max_in_use"] = max(self.pool_stats["max_in_use"], self.pool_total - len(self.pool_idle))
+        if wait_time > 1:
+            self.logger.debug("DB: waited %.3f seconds for a connection, pool saturated with %d connections",
+                              wait_time, self.pool_size)
+        if con:
+            try:
+                if now - idle_since > POOL_PING_TIME:
+                    con.ping()
+                return con
+            except mdb.Error:
+                self.logger.debug("DB: replacing a not valid connection of the pool")
+                try:
+                    con.close()
+                except mdb.Error:
+                    pass
+        try:
+            new_con = mdb.connect(self.host, self.user, self.passwd, self.database)
+        except mdb.Error:
+            with self.pool_condition:
+                self.pool_total -= 1
+                self.pool_condition.notify()
+            raise
+        if con and con is self._con:
+            self._con = new_con
+        return new_con
+
+    def _pool_checkin(self, con, broken=False):
+        """Return a connection to the pool. It is closed if broken or the pool is full"""
+        with self.pool_condition:
+            if broken or self.pool_total > self.pool_size or len(self.pool_idle) >= self.pool_size:
+                self.pool_total -= 1
+                try:
+                    con.close()
+                except mdb.Error:
+                    pass
             else:
-                self.con.commit()
+                self.pool_idle.append((con, time.time()))
+            self.pool_condition.notify()
+
+    def get_pool_stats(self):
+        """Get the usage and contention metrics of the connection pool
+        :return: dictionary with size, in_use, idle, checkouts, waits (number of checkouts that have waited for a
+            free connection), wait_time (total seconds waited), max_wait_time and max_in_use
+        """
+        with self.pool_condition:
+            stats = dict(self.pool_stats)
+            stats["size"] = self.pool_size
+            stats["idle"] = len(self.pool_idle)
+            stats["in_use"] = self.pool_total - len(self.pool_idle)
+        return stats
 
 
     def _format_error(self, e, tries=1, command=None,
@@ -523,13 +883,9 @@ class db_base():
             If a list, each item will be a dictionary that will be concatenated with OR
         :return: the number of updated rows, raises exception upon error
         """
-        # gettting uuid
-        values = ",".join(map(self.__tuple2db_format_set, UPDATE.iteritems() ))
-        if modified_time:
-            values += ",modified_at={:f}".format(modified_time)
-        cmd= "UPDATE " + table + " SET " + values + " WHERE " + self.__create_where(WHERE)
-        self.logger.debug(cmd)
-        self.cur.execute(cmd)
+        cmd, params = build_update(table, UPDATE, WHERE, modified_time)
+        self.logger.debug("%s %s", cmd, params)
+        self.cur.execute(cmd, params)
         return self.cur.rowcount
 
     def _new_uuid(self, root_uuid=None, used_table=None, created_time=0):
@@ -602,6 +958,30 @@ class db_base():
         self.cur.rowcount
         return uuid
 
+    def _new_rows_internal(self, table, rows, created_times=None, confidential_data=False):
+        """ Add several rows into a table. Rows with the same columns are inserted together with a single multi-row
+        INSERT. It DOES NOT begin or end the transaction, so self.con.cursor must be created
+        :param table: table where to insert
+        :param rows: list of dictionaries with the key:value to insert
+        :param created_times: list with the time to add to the created_at column of each row, 0 for not adding it.
+            None for not adding it at any row
+        :param confidential_data: if True, the inserted values are not logged
+        :return: number of inserted rows
+        """
+        groups = OrderedDict()  # statement template: list of params. Ordered by the first row of each template
+        for index, row in enumerate(rows):
+            cmd, params = build_insert(table, row, created_times[index] if created_times else 0)
+            groups.setdefault(cmd, []).append(params)
+        inserted = 0
+        for cmd, params_list in groups.items():
+            if confidential_data:
+                self.logger.debug("%s; %d rows", cmd[:cmd.find("(")], len(params_list))
+            else:
+                self.logger.debug("%s %s", cmd, params_list)
+            self.cur.executemany(cmd, params_list)
+            inserted += len(params_list)
+        return inserted
+
     def _get_rows(self,table,uuid):
         cmd = "SELECT * FROM {} WHERE uuid='{}'".format(str(table), str(uuid))
         self.logger.debug(cmd)
@@ -647,6 +1027,23 @@ class db_base():
 
         return self._update_rows(table, UPDATE, WHERE, modified_time)
 
+    @retry
+    @with_transaction
+    def update_rows_list(self, update_list, attempt=_ATTEMPT):
+        """ Make several updates, at the same or different tables, inside a single transaction.
+        :param update_list: list of dictionaries with the update_rows parameters: 'table', 'UPDATE', 'WHERE' and
+            optionally 'modified_time'
+        :return: the total number of updated rows, raises exception upon error
+        """
+        updated = 0
+        for update in update_list:
+            attempt.info['table'] = update["table"]
+            modified_time = update.get("modified_time")
+            if update["table"] in self.tables_with_created_field and modified_time is None:
+                modified_time = time.time()
+            updated += self._update_rows(update["table"], update["UPDATE"], update["WHERE"], modified_time)
+        return updated
+
     def _delete_row_by_id_internal(self, table, uuid):
         cmd = "DELETE FROM {} WHERE uuid = '{}'".format(table, uuid)
         self.logger.debug(cmd)
@@ -678,18 +1075,13 @@ class db_base():
             If a list, each item will be a dictionary that will be concatenated with OR
         :return: the number of deleted rows, raises exception upon error
         """
-        # print sql_dict
-        cmd = "DELETE FROM " + str(sql_dict['FROM'])
-        if sql_dict.get('WHERE'):
-            cmd += " WHERE " + self.__create_where(sql_dict['WHERE'])
-        if sql_dict.get('LIMIT'):
-            cmd += " LIMIT " + str(sql_dict['LIMIT'])
-
+        cmd, params = build_delete(FROM=sql_dict['FROM'], WHERE=sql_dict.get('WHERE'),
+                                   LIMIT=sql_dict.get('LIMIT') or None)
         attempt.info['cmd'] = cmd
 
         with self.transaction():
-            self.logger.debug(cmd)
-            self.cur.execute(cmd)
+            self.logger.debug("%s %s", cmd, params)
+            self.cur.execute(cmd, params)
             deleted = self.cur.rowcount
         return deleted
 
@@ -720,35 +1112,14 @@ class db_base():
         :param ORDER_BY:  list or tuple of fields to order, add ' DESC' to each item if inverse order is required
         :return: a list with dictionaries at each row, raises exception upon error
         """
-        # print sql_dict
-        cmd = "SELECT "
-        if 'SELECT' in sql_dict:
-            if isinstance(sql_dict['SELECT'], (tuple, list)):
-                cmd += ",".join(map(str, sql_dict['SELECT']))
-            else:
-                cmd += sql_dict['SELECT']
-        else:
-            cmd += "*"
-
-        cmd += " FROM " + str(sql_dict['FROM'])
-        if sql_dict.get('WHERE'):
-            cmd += " WHERE " + self.__create_where(sql_dict['WHERE'])
-
-        if 'ORDER_BY' in sql_dict:
-            cmd += " ORDER BY "
-            if isinstance(sql_dict['ORDER_BY'], (tuple, list)):
-                cmd += ",".join(map(str, sql_dict['ORDER_BY']))
-            else:
-                cmd += str(sql_dict['ORDER_BY'])
-
-        if 'LIMIT' in sql_dict:
-            cmd += " LIMIT " + str(sql_dict['LIMIT'])
-
+        cmd, params = build_select(SELECT=sql_dict.get('SELECT', "*"), FROM=sql_dict['FROM'],
+                                   WHERE=sql_dict.get('WHERE'), ORDER_BY=sql_dict.get('ORDER_BY'),
+                                   LIMIT=sql_dict.get('LIMIT'))
         attempt.info['cmd'] = cmd
 
         with self.transaction(mdb.cursors.DictCursor):
-            self.logger.debug(cmd)
-            self.cur.execute(cmd)
+            self.logger.debug("%s %s", cmd, params)
+            self.cur.execute(cmd, params)
             rows = self.cur.fetchall()
             return rows
 
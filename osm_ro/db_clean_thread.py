@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openmano
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+"""
+Thread that periodically removes from database the vim_wim_actions (and their instance_actions) that are not needed
+any more, to avoid unlimited growing of these tables. At startup it also releases the locks ('worker' column) of
+vim_wim_actions taken by the workers of a previous execution.
+Deletions are done in chunks of instance_actions ordered by primary key, pausing between chunks in proportion to the
+time spent by the database, so that it does not interfere with the normal operation.
+"""
+
+import logging
+import threading
+import time
+
+from db_base import db_base_Exception
+
+__author__ = "Alfonso Tierno"
+
+
+class DbCleanThread(threading.Thread):
+    RETENTION = 3600 * 24 * 7  # time in seconds that finished DELETE actions of removed instances are kept
+    PERIOD = 3600  # time in seconds between two cleaning passes
+    CHUNK = 500  # maximum number of instance_actions deleted at each database command
+    THROTTLE = 1.0  # pause after each chunk, as a factor of the time spent by the database deleting it
+    SLOW_CHUNK = 1.0  # the chunk size is halved when the database takes longer than this, in seconds
+
+    def __init__(self, db, retention=None, period=None, chunk=None, throttle=None):
+        """
+        :param db: database class to use
+        :param retention, period, chunk, throttle: to override the class defaults
+        """
+        threading.Thread.__init__(self)
+        self.name = "db_clean"
+        self.daemon = True
+        self.db = db
+        self.retention = retention or self.RETENTION
+        self.period = period or self.PERIOD
+        self.chunk = chunk or self.CHUNK
+        self.throttle = self.THROTTLE if throttle is None else throttle
+        self.logger = logging.getLogger('openmano.db_clean')
+        self.terminate_event = threading.Event()
+        self.stats = {"passes": 0, "actions_deleted": 0, "instance_actions_deleted": 0, "locks_released": 0,
+                      "time_spent": 0.0, "last_pass_time": 0.0, "last_pass_at": None}
+
+    def get_stats(self):
+        return self.stats.copy()
+
+    def terminate(self):
+        self.terminate_event.set()
+
+    def run(self):
+        self.logger.debug("Starting")
+        while not self.terminate_event.is_set():
+            try:
+                self.clean()
+            except db_base_Exception as e:
+                self.logger.error("Cannot clean database: {}".format(e))
+            except Exception as e:
+                self.logger.critical("Unexpected exception at cleaning database: {}".format(e), exc_info=True)
+            self.terminate_event.wait(self.period)
+        self.logger.debug("Finishing")
+
+    def clean(self):
+        """
+        Execute a cleaning pass: remove old unused vim_wim_actions
+        :return: number of deleted vim_wim_actions
+        """
+        start = time.time()
+        actions_deleted = self._delete_old_actions(start - self.retention)
+        elapsed = time.time() - start
+
+        self.stats["passes"] += 1
+        self.stats["time_spent"] += elapsed
+        self.stats["last_pass_time"] = elapsed
+        self.stats["last_pass_at"] = start
+        if actions_deleted:
+            self.logger.info("Removed {} unused vim_wim_actions in {:.3f}s".format(actions_deleted, elapsed))
+        return actions_deleted
+
+    def _delete_old_actions(self, older_than):
+        """
+        Delete the instance_actions, together with all their vim_wim_actions, that contain a finished DELETE
+        vim_wim_action modified before 'older_than' of an instance that does not exist any more
+        :return: number of deleted vim_wim_actions
+        """
+        actions_deleted = 0
+        chunk = self.chunk
+        last_instance_action_id = ""
+        while not self.terminate_event.is_set():
+            start = time.time()
+            rows = self.db.get_rows(
+                SELECT=("DISTINCT va.instance_action_id as instance_action_id", ),
+                FROM="vim_wim_actions as va join instance_actions as ia on va.instance_action_id=ia.uuid "
+                     "left join instance_scenarios as i on ia.instance_id=i.uuid",
+                WHERE={"va.action": "DELETE", "va.modified_at<": older_than, "i.uuid": None,
+                       "va.status": ("DONE", "SUPERSEDED"), "va.instance_action_id>": last_instance_action_id},
+                ORDER_BY=("va.instance_action_id", ),
+                LIMIT=chunk)
+            if not rows:
+                break
+            instance_action_ids = [row["instance_action_id"] for row in rows]
+            last_instance_action_id = instance_action_ids[-1]
+            deleted = self.db.delete_row(FROM="vim_wim_actions", WHERE={"instance_action_id": instance_action_ids})
+            self.db.delete_row(FROM="instance_actions", WHERE={"uuid": instance_action_ids})
+            actions_deleted += deleted
+            self.stats["actions_deleted"] += deleted
+            self.stats["instance_actions_deleted"] += len(instance_action_ids)
+            if len(rows) < chunk:
+                break
+
+            # throttle: pause in proportion to the database time, and reduce the chunk when the database is slow
+            elapsed = time.time() - start
+            if elapsed > self.SLOW_CHUNK and chunk > 1:
+                chunk //= 2
+            elif chunk < self.chunk:
+                chunk = min(chunk * 2, self.chunk)
+            if self.throttle:
+                self.terminate_event.wait(elapsed * self.throttle)
+        return actions_deleted
+
+    def release_all_locks(self):
+        """
+        Release all the locks of vim_wim_actions. It is called at startup, before any worker is running, so that the
+        tasks locked by workers of a previous execution (that can have a different name now) are taken immediately.
+        It is not repeated periodically: worker ids do not identify the openmanod that runs them, and other openmanod
+        sharing the database would lose the locks of their running workers
+        :return: number of released locks
+        """
+        released = self.db.update_rows("vim_wim_actions", UPDATE={"worker": None}, modified_time=0,
+                                       WHERE={"worker<>": None})
+        self.stats["locks_released"] += released
+        if released:
+            self.logger.info("Released {} locks of previous workers".format(released))
+        return released
@@ -8,16 +8,100 @@ __author__ = "Alfonso Tierno, Gerardo Garcia"
 
 import json
 import logging
+import random
 
 import bottle
 import yaml
 from jsonschema import exceptions as js_e
-from jsonschema import validate as js_v
-
 from . import errors as httperrors
+from ..openmano_schemas import validate as js_v
 
 logger = logging.getLogger('openmano.http')
 
+# logging of request and response bodies at DEBUG level. Change them with configure_body_logging
+log_body_sample = 1.0  # fraction of the requests whose body is logged
+log_body_max_size = 16384  # logged bodies are truncated to this number of characters. 0 for no limit
+
+
+def configure_body_logging(sample=None, max_size=None):
+    """
+    Set how the request and response bodies are logged at DEBUG level
+    :param sample: fraction, from 0 to 1, of the requests whose body is logged. None to keep the current value
+    :param max_size: maximum number of characters of each logged body. 0 for no limit. None to keep the current value
+    """
+    global log_body_sample, log_body_max_size
+    if sample is not None:
+        log_body_sample = sample
+    if max_size is not None:
+        log_body_max_size = max_size
+
+
+_YamlDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)  # libyaml emitter when available
+
+
+class _BodyTruncated(Exception):
+    """Raised by _BoundedStream to stop the serialization of a body bigger than log_body_max_size"""
+
+
+class _BoundedStream(object):
+    """File-like object that keeps the written text until max_size is reached"""
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.chunks = []
+
+    def write(self, text):
+        self.chunks.append(text)
+        self.size += len(text)
+        if self.max_size and self.size > self.max_size:
+            raise _BodyTruncated()
+
+    def getvalue(self):
+        return "".join(self.chunks)
+
+
+class _BodyDump(object):
+    """Log argument that serializes the body only if the log record is emitted. The yaml output is stopped once
+    log_body_max_size is reached"""
+    __slots__ = ("data", "confidential_data")
+
+    def __init__(self, data, confidential_data=False):
+        self.data = data
+        self.confidential_data = confidential_data
+
+    def __str__(self):
+        stream = _BoundedStream(log_body_max_size)
+        truncated = False
+        try:
+            yaml.dump(self.data, stream, Dumper=_YamlDumper, explicit_start=True, indent=4,
+                      default_flow_style=False, tags=False, encoding='utf-8', allow_unicode=True)
+        except _BodyTruncated:
+            truncated = True
+        text = stream.getvalue()
+        if truncated:
+            text = text[:log_body_max_size] + "\n... (truncated to {} characters)".format(log_body_max_size)
+        if self.confidential_data:
+            text = remove_clear_passwd(text)
+        return text
+
+
+def log_body(direction, data, confidential_data=False):
+    """
+    Log at DEBUG level the body of a request (direction 'IN') or response ('OUT'). It costs nothing when DEBUG is not
+    enabled, and only a sample of the bodies are serialized, see configure_body_logging
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    if log_body_sample < 1 and random.random() >= log_body_sample:
+        return
+    logger.debug('%s: %s', direction, _BodyDump(data, confidential_data))
+
+
+def pretty_requested():
+    """Check if the client asks for an indented output with the query string 'pretty' (without value or not false)"""
+    pretty = bottle.request.query.get('pretty')
+    return pretty is not None and pretty.lower() not in ("0", "false", "no")
+
 
 def remove_clear_passwd(data):
     """
@@ -62,9 +146,9 @@ def change_keys_http2db(data, http_db, reverse=False):
 
 def format_out(data):
     '''Return string of dictionary data according to requested json, yaml, xml.
-    By default json
+    By default json, compact unless the query string 'pretty' is present
     '''
-    logger.debug("OUT: " + yaml.safe_dump(data, explicit_start=True, indent=4, default_flow_style=False, tags=False, encoding='utf-8', allow_unicode=True) )
+    log_body("OUT", data)
     accept = bottle.request.headers.get('Accept')
     if accept and 'application/yaml' in accept:
         bottle.response.content_type='application/yaml'
@@ -73,8 +157,9 @@ def format_out(data):
                 tags=False, encoding='utf-8', allow_unicode=True) #, canonical=True, default_style='"'
     else: #by default json
         bottle.response.content_type='application/json'
-        #return data #json no style
-        return json.dumps(data, indent=4) + "\n"
+        if pretty_requested():
+            return json.dumps(data, indent=4) + "\n"
+        return json.dumps(data, separators=(',', ':')) + "\n"
 
 
 def format_in(default_schema, version_fields=None, version_dict_schema=None, confidential_data=False):
@@ -116,12 +201,7 @@ def format_in(default_schema, version_fields=None, version_dict_schema=None, con
         # if client_data == None:
         #    bottle.abort(httperrors.Bad_Request, "Content error, empty")
         #    return
-        if confidential_data:
-            logger.debug('IN: %s', remove_clear_passwd (yaml.safe_dump(client_data, explicit_start=True, indent=4, default_flow_style=False,
-                                              tags=False, encoding='utf-8', allow_unicode=True)))
-        else:
-            logger.debug('IN: %s', yaml.safe_dump(client_data, explicit_start=True, indent=4, default_flow_style=False,
-                                              tags=False, encoding='utf-8', allow_unicode=True) )
+        log_body('IN', client_data, confidential_data)
         # look for the client provider version
         error_text = "Invalid content "
         if not default_schema and not version_fields:
@@ -181,7 +261,9 @@ def filter_query_string(qs, http2db, allowed):
     #    bottle.abort(httperrors.Internal_Server_Error, '!!!!!!!!!!!!!!invalid query string not a dictionary')
     #    #bottle.abort(httperrors.Internal_Server_Error, "call programmer")
     for k in qs:
-        if k=='field':
+        if k=='pretty':  # output format, see format_out
+            continue
+        elif k=='field':
             select += qs.getall(k)
             for v in select:
                 if v not in allowed:
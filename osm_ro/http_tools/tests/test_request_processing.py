@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import unittest
+
+import bottle
+from mock import patch
+from webtest import TestApp
+
+from .. import request_processing
+from ..request_processing import format_out
+
+
+class TestFormatOut(unittest.TestCase):
+    def setUp(self):
+        self.app = bottle.Bottle()
+        self.data = {"instance": {"name": "ns", "vnfs": [{"name": "vnf1"}]}}
+
+        @self.app.get('/instance')
+        def callback():
+            return format_out(self.data)
+
+        self.client = TestApp(self.app)
+
+    def test_json_compact_by_default(self):
+        response = self.client.get('/instance')
+        self.assertEqual(response.content_type, 'application/json')
+        self.assertNotIn(' ', response.text.strip())
+        self.assertEqual(json.loads(response.text), self.data)
+
+    def test_json_pretty_if_requested(self):
+        response = self.client.get('/instance?pretty')
+        self.assertEqual(response.text, json.dumps(self.data, indent=4) + "\n")
+
+    def test_body_not_serialized_without_debug(self):
+        with patch.object(request_processing.logger, 'isEnabledFor', return_value=False), \
+                patch.object(request_processing.yaml, 'dump') as dump:
+            self.client.get('/instance')
+        dump.assert_not_called()
+
+
+class TestLogBody(unittest.TestCase):
+    def setUp(self):
+        self.sample = request_processing.log_body_sample
+        self.max_size = request_processing.log_body_max_size
+
+    def tearDown(self):
+        request_processing.configure_body_logging(self.sample, self.max_size)
+
+    def test_truncated_and_sampled(self):
+        request_processing.configure_body_logging(sample=1, max_size=20)
+        with patch.object(request_processing.logger, 'isEnabledFor', return_value=True), \
+                patch.object(request_processing.logger, 'debug') as debug:
+            request_processing.log_body('OUT', {"key": "x" * 100})
+            text = str(debug.call_args[0][2])
+            self.assertTrue(text.startswith("---\nkey: xxx"))
+            self.assertIn("truncated to 20 characters", text)
+
+            request_processing.configure_body_logging(sample=0)
+            request_processing.log_body('OUT', {"key": "value"})
+            self.assertEqual(debug.call_count, 1)
+
+    def test_clear_passwords_removed(self):
+        with patch.object(request_processing.logger, 'isEnabledFor', return_value=True), \
+                patch.object(request_processing.logger, 'debug') as debug:
+            request_processing.log_body('IN', {"password": "secret"}, confidential_data=True)
+        self.assertNotIn("secret", str(debug.call_args[0][2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
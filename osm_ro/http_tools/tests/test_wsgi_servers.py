@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import threading
+import unittest
+import urllib2
+from wsgiref.simple_server import make_server
+
+from ..wsgi_servers import ThreadPoolWSGIServer, _RequestHandler
+
+
+class TestThreadPoolWSGIServer(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+
+        def app(environ, start_response):
+            if environ['PATH_INFO'] == '/slow':
+                self.release.wait(5)
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [environ['PATH_INFO']]
+
+        self.server = make_server('127.0.0.1', 0, app, ThreadPoolWSGIServer, _RequestHandler)
+        self.server.start_workers()
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+
+    def tearDown(self):
+        self.release.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_slow_request_does_not_block_others(self):
+        slow_response = []
+        slow_client = threading.Thread(target=lambda: slow_response.append(urllib2.urlopen(self.url + '/slow').read()))
+        slow_client.start()
+
+        # a fast request is answered while the slow one is in course
+        self.assertEqual(urllib2.urlopen(self.url + '/fast', timeout=2).read(), '/fast')
+        self.assertFalse(slow_response)
+
+        self.release.set()
+        slow_client.join(5)
+        self.assertEqual(slow_response, ['/slow'])
+
+
+if __name__ == '__main__':
+    unittest.main()
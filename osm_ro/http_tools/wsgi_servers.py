@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+#
+# Production servers for bottle applications, based on wsgiref, so that no
+# other dependency is needed
+#
+
+__author__ = "Alfonso Tierno"
+
+import logging
+import os
+import signal
+import threading
+import time
+from Queue import Queue
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import bottle
+
+logger = logging.getLogger('openmano.http')
+
+
+class _RequestHandler(WSGIRequestHandler):
+    quiet = True
+
+    def address_string(self):  # avoid reverse DNS lookups
+        return self.client_address[0]
+
+    def log_request(self, *args, **kwargs):
+        if not self.quiet:
+            WSGIRequestHandler.log_request(self, *args, **kwargs)
+
+
+class ThreadPoolWSGIServer(WSGIServer):
+    """WSGIServer that processes the requests with a fixed number of threads. Connections accepted while all the
+    threads are busy wait at a queue"""
+    workers = 10
+    daemon_threads = True
+
+    def server_activate(self):
+        WSGIServer.server_activate(self)
+        self.request_queue = Queue()
+        self.worker_threads = []
+
+    def start_workers(self):
+        """Start the worker threads. It must be called at the process that serves the requests"""
+        self.worker_threads = []
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._process_requests, name="http_worker_{}".format(index))
+            thread.daemon = self.daemon_threads
+            thread.start()
+            self.worker_threads.append(thread)
+
+    def _process_requests(self):
+        while True:
+            request, client_address = self.request_queue.get()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def process_request(self, request, client_address):
+        self.request_queue.put((request, client_address))
+
+
+class ThreadPoolServer(bottle.ServerAdapter):
+    """bottle server adapter for a ThreadPoolWSGIServer. Options:
+        workers: number of threads processing requests (10 by default)
+    """
+    def _make_server(self, app, workers):
+        class RequestHandler(_RequestHandler):
+            quiet = self.quiet
+
+        class Server(ThreadPoolWSGIServer):
+            pass
+        Server.workers = workers
+        return make_server(self.host, self.port, app, Server, RequestHandler)
+
+    def run(self, app):
+        server = self._make_server(app, self.options.get("workers") or ThreadPoolWSGIServer.workers)
+        server.start_workers()
+        server.serve_forever()
+
+
+class PreforkServer(ThreadPoolServer):
+    """bottle server adapter that binds the listening socket and forks several worker processes that accept the
+    connections, each one with a ThreadPoolWSGIServer. Worker processes that die are started again. Options:
+        workers: number of worker processes (4 by default)
+        threads: number of threads of each worker process (1 by default)
+        after_fork: function called at the worker process after the fork, with the worker index as parameter. It
+            must prepare the resources that cannot be shared with the parent process, as database connections
+    """
+    CHECK_PERIOD = 1  # time in seconds between checks of the worker processes
+
+    def run(self, app):
+        workers = self.options.get("workers") or 4
+        server = self._make_server(app, self.options.get("threads") or 1)
+        children = {}  # pid: worker index
+        try:
+            while True:
+                for index in set(range(workers)) - set(children.values()):
+                    parent_pid = os.getpid()
+                    pid = os.fork()
+                    if pid == 0:
+                        self._run_worker(server, index, parent_pid)
+                    children[pid] = index
+                    logger.debug("http worker process %d started with pid %d", index, pid)
+                time.sleep(self.CHECK_PERIOD)
+                # wait only for the own children, as this process can have other ones
+                for pid in list(children):
+                    finished_pid, status = os.waitpid(pid, os.WNOHANG)
+                    if finished_pid:
+                        logger.error("http worker process %d with pid %d finished with status %d", children[pid],
+                                     pid, status)
+                        del children[pid]
+        finally:
+            for pid in children:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except OSError:
+                    pass
+
+    def _watch_parent(self, parent_pid):
+        """Finish the worker process when the parent one has finished"""
+        while os.getppid() == parent_pid:
+            time.sleep(self.CHECK_PERIOD)
+        os._exit(0)
+
+    def _run_worker(self, server, index, parent_pid):
+        exit_code = 0
+        try:
+            watcher = threading.Thread(target=self._watch_parent, args=(parent_pid, ), name="http_parent_watcher")
+            watcher.daemon = True
+            watcher.start()
+            after_fork = self.options.get("after_fork")
+            if after_fork:
+                after_fork(index)
+            server.start_workers()
+            server.serve_forever()
+        except BaseException:
+            logger.critical("http worker process %d finished with exception", index, exc_info=True)
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
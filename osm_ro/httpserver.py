@@ -43,6 +43,7 @@ from openmano_schemas import vnfd_schema_v01, vnfd_schema_v02, \
                             sdn_port_mapping_schema, sdn_external_port_schema
 
 from .http_tools import errors as httperrors
+from .http_tools.wsgi_servers import PreforkServer, ThreadPoolServer
 from .http_tools.request_processing import (
     format_out,
     format_in,
@@ -51,9 +52,10 @@ from .http_tools.request_processing import (
 from .wim.http_handler import WimHandler
 
 import nfvo
+import task_relay
 import utils
 from db_base import db_base_Exception
-from functools import wraps
+from functools import partial, wraps
 
 global mydb
 global url_base
@@ -78,9 +80,42 @@ def log_to_logger(fn):
         return actual_response
     return _log_to_logger
 
+def _get_relay_thread(kind, key):
+    """Return the vim or wim thread that receives the tasks relayed from the prefork http worker processes"""
+    if kind == "vim":
+        return nfvo.vim_threads["running"].get(key)
+    elif kind == "wim" and nfvo.wim_engine:
+        return nfvo.wim_engine.threads.get(key)
+
+
+def _after_fork(relay_socket, receiving_socket, worker_index):
+    """Prepare a prefork http worker process: own database and vim connections, and relay of the tasks to the vim and
+    wim threads, that only run at the parent process"""
+    # locks can be held by threads of the parent process that do not exist here
+    logging._lock = threading.RLock()
+    for handler in logging._handlerList:
+        handler = handler() if callable(handler) else handler
+        if handler:
+            handler.createLock()
+    receiving_socket.close()
+    task_relay.relay_socket = relay_socket
+    mydb.reset_after_fork()
+    if nfvo.db and nfvo.db is not mydb:
+        nfvo.db.reset_after_fork()
+    nfvo.reset_after_fork()
+    logger.debug("http worker process %d ready", worker_index)
+
+
 class httpserver(threading.Thread):
+    SERVER_MODES = ("single", "threaded", "prefork")
+
     def __init__(self, db, admin=False, host='localhost', port=9090,
-                 wim_persistence=None, wim_engine=None):
+                 wim_persistence=None, wim_engine=None, server_mode="single", workers=None, worker_threads=None):
+        """
+        :param server_mode: "single" to process the requests one by one; "threaded" to process them with 'workers'
+            threads; "prefork" to process them with 'workers' processes, each one with its own database connections
+            and 'worker_threads' threads. The admin server uses "threaded" instead of "prefork"
+        """
         #global url_base
         global mydb
         global logger
@@ -90,6 +125,11 @@ class httpserver(threading.Thread):
         threading.Thread.__init__(self)
         self.host = host
         self.port = port   #Port where the listen service must be started
+        if server_mode not in self.SERVER_MODES:
+            raise ValueError("Invalid http server mode '{}'".format(server_mode))
+        self.server_mode = "threaded" if admin and server_mode == "prefork" else server_mode
+        self.workers = workers
+        self.worker_threads = worker_threads
         if admin==True:
             self.name = "http_admin"
         else:
@@ -114,7 +154,23 @@ class httpserver(threading.Thread):
         for handler in self.handlers:
             default_app.merge(handler.wsgi_app)
 
-        bottle.run(host=self.host, port=self.port, debug=debug, quiet=quiet)
+        if self.server_mode == "threaded":
+            bottle.run(server=ThreadPoolServer, host=self.host, port=self.port, debug=debug, quiet=quiet,
+                       workers=self.workers)
+        elif self.server_mode == "prefork":
+            # get_vim results are not reused, as database changes done by one process are not seen by the others.
+            # The vimconnectors are still reused while their database record does not change
+            nfvo.VIM_CACHE_TIME = 0
+            relay_socket, receiving_socket = task_relay.create()
+            relay_thread = threading.Thread(target=task_relay.receive, args=(receiving_socket, _get_relay_thread),
+                                            name="http_task_relay")
+            relay_thread.daemon = True
+            relay_thread.start()
+            bottle.run(server=PreforkServer, host=self.host, port=self.port, debug=debug, quiet=quiet,
+                       workers=self.workers, threads=self.worker_threads,
+                       after_fork=partial(_after_fork, relay_socket, receiving_socket))
+        else:
+            bottle.run(host=self.host, port=self.port, debug=debug, quiet=quiet)
 
 
 def run_bottle(db, host_='localhost', port_=9090):
@@ -31,9 +31,11 @@ __date__ ="$16-sep-2014 22:05:01$"
 import json
 import yaml
 import utils
+import action_extra
 from utils import deprecated
 import vim_thread
 import console_proxy_thread as cli
+from db_clean_thread import DbCleanThread
 import vimconn
 import logging
 import collections
@@ -42,7 +44,7 @@ from uuid import uuid4
 from db_base import db_base_Exception
 
 import nfvo_db
-from threading import Lock
+from threading import Lock, current_thread
 import time as t
 from lib_osm_openvim import ovim as ovim_module
 from lib_osm_openvim.ovim import ovimException
@@ -81,6 +83,14 @@ global_config = None
 vimconn_imported = {}   # dictionary with VIM type as key, loaded module as value
 vim_threads = {"running":{}, "deleting": {}, "names": []}      # threads running for attached-VIMs
 vim_persistent_info = {}
+# cache of get_vim. "accounts": datacenter_tenant_id: {"record": database row, "vim": vimconnector},
+# "queries": get_vim filter parameters: (time the result was obtained, list of datacenter_tenant_id)
+vim_cache = {"accounts": {}, "queries": {}}
+vim_cache_stats = {"hits": 0, "misses": 0, "connectors_reused": 0, "invalidations": 0}
+vim_cache_lock = Lock()
+VIM_CACHE_TIME = 300  # maximum time in seconds a get_vim result is reused, in case the database is changed by others
+# vimconnectors are not guaranteed to be thread safe (e.g. vmware reassigns its client), so each thread has its own
+# cached ones: vim_cache["accounts"] is indexed by (thread ident, datacenter_tenant_id)
 # WIM
 wimconn_imported = {}   # dictionary with WIM type as key, loaded module as value
 wim_threads = {"running":{}, "deleting": {}, "names": []}      # threads running for attached-WIMs
@@ -92,6 +102,9 @@ task_lock = Lock()
 last_task_id = 0.0
 db = None
 db_lock = Lock()
+db_clean_thread = None  # thread that removes old vim_wim_actions from database
+console_proxy = None  # thread that serves all the console proxy ports, started at first use
+console_proxy_lock = Lock()
 
 
 class NfvoException(httperrors.HttpMappedError):
@@ -152,8 +165,7 @@ def get_non_used_wim_name(wim_name, wim_id, tenant_name, tenant_id):
 
 def start_service(mydb, persistence=None, wim=None):
     global db, global_config
-    db = nfvo_db.nfvo_db(lock=db_lock)
-    mydb.lock = db_lock
+    db = nfvo_db.nfvo_db(lock=db_lock, pool_size=global_config.get("db_pool_size"))
     db.connect(global_config['db_host'], global_config['db_user'], global_config['db_passwd'], global_config['db_name'])
     global ovim
 
@@ -186,8 +198,14 @@ def start_service(mydb, persistence=None, wim=None):
 
         ovim.start_service()
 
-        #delete old unneeded vim_wim_actions
-        clean_db(mydb)
+        # delete old unneeded vim_wim_actions periodically
+        global db_clean_thread
+        db_clean_thread = DbCleanThread(
+            db, retention=global_config.get("db_clean_retention"), period=global_config.get("db_clean_period"),
+            chunk=global_config.get("db_clean_chunk"), throttle=global_config.get("db_clean_throttle"))
+        # no vim_thread is running yet, so all the locks belong to workers of a previous execution
+        db_clean_thread.release_all_locks()
+        db_clean_thread.start()
 
         # starts vim_threads
         from_= 'tenants_datacenters as td join datacenters as d on td.datacenter_id=d.uuid join '\
@@ -271,46 +289,34 @@ def stop_service():
     if wim_engine:
         wim_engine.stop_threads()
 
-    if global_config and global_config.get("console_thread"):
-        for thread in global_config["console_thread"]:
-            thread.terminate = True
+    if db_clean_thread:
+        db_clean_thread.terminate()
+
+    if console_proxy:
+        console_proxy.terminate()
+
+
+def reset_after_fork():
+    """Prepare a forked process (prefork http worker) to not share with the parent process the connections inherited
+    from it: the ovim database connection and the sessions kept at the persistent_info of the vim and wim connectors"""
+    global vim_cache_lock
+    vim_cache_lock = Lock()  # it can be held by a thread of the parent process
+    invalidate_vim_cache()
+    for persistent_info in vim_persistent_info.values() + wim_persistent_info.values():
+        persistent_info.clear()
+    vim_persistent_info.clear()
+    wim_persistent_info.clear()
+    if ovim:
+        ovim.db = ovim._create_database_connection()
+
 
 def get_version():
     return  ("openmanod version {} {}\n(c) Copyright Telefonica".format(global_config["version"],
                                                                         global_config["version_date"] ))
 
-def clean_db(mydb):
-    """
-    Clean unused or old entries at database to avoid unlimited growing
-    :param mydb: database connector
-    :return: None
-    """
-    # get and delete unused vim_wim_actions: all elements deleted, one week before, instance not present
-    now = t.time()-3600*24*7
-    instance_action_id = None
-    nb_deleted = 0
-    while True:
-        actions_to_delete = mydb.get_rows(
-            SELECT=("item", "item_id", "instance_action_id"),
-            FROM="vim_wim_actions as va join instance_actions as ia on va.instance_action_id=ia.uuid "
-                    "left join instance_scenarios as i on ia.instance_id=i.uuid",
-            WHERE={"va.action": "DELETE", "va.modified_at<": now, "i.uuid": None,
-                   "va.status": ("DONE", "SUPERSEDED")},
-            LIMIT=100
-        )
-        for to_delete in actions_to_delete:
-            mydb.delete_row(FROM="vim_wim_actions", WHERE=to_delete)
-            if instance_action_id != to_delete["instance_action_id"]:
-                instance_action_id = to_delete["instance_action_id"]
-                mydb.delete_row(FROM="instance_actions", WHERE={"uuid": instance_action_id})
-        nb_deleted += len(actions_to_delete)
-        if len(actions_to_delete) < 100:
-            break
-    # clean locks
-    mydb.update_rows("vim_wim_actions", UPDATE={"worker": None}, WHERE={"worker<>": None})
-
-    if nb_deleted:
-        logger.debug("Removed {} unused vim_wim_actions".format(nb_deleted))
+def get_db_clean_stats():
+    """Return the counters of the database cleaning thread: passes, deleted vim_wim_actions, time spent, ..."""
+    return db_clean_thread.get_stats() if db_clean_thread else None
 
 
 def get_flavorlist(mydb, vnf_id, nfvo_tenant=None):
@@ -363,6 +369,13 @@ def get_vim(mydb, nfvo_tenant=None, datacenter_id=None, datacenter_name=None, da
             'nfvo_tenant_id','datacenter_id','vim_tenant_id','vim_url','vim_url_admin','datacenter_name','type','user','passwd'
         raise exception upon error
     '''
+    cache_key = None
+    if nfvo_tenant or vim_tenant or vim_tenant_name or datacenter_tenant_id:
+        # vim accounts are cached; their connectors do not depend on vim_user and vim_passwd
+        cache_key = (nfvo_tenant, datacenter_id, datacenter_name, datacenter_tenant_id, vim_tenant, vim_tenant_name)
+        vim_dict = _get_cached_vims(cache_key)
+        if vim_dict is not None:
+            return vim_dict
     WHERE_dict={}
     if nfvo_tenant     is not None:  WHERE_dict['nfvo_tenant_id'] = nfvo_tenant
     if datacenter_id   is not None:  WHERE_dict['d.uuid']  = datacenter_id
@@ -381,7 +394,14 @@ def get_vim(mydb, nfvo_tenant=None, datacenter_id=None, datacenter_name=None, da
     try:
         vims = mydb.get_rows(FROM=from_, SELECT=select_, WHERE=WHERE_dict )
         vim_dict={}
+        cached_vims = []  # datacenter_tenant_id of the obtained vims. Set to None if some of them fails
         for vim in vims:
+            if cache_key:
+                myvim = _get_cached_vim_connector(vim)
+                if myvim:
+                    vim_dict[vim['datacenter_id']] = myvim
+                    cached_vims.append(vim['datacenter_tenant_id'])
+                    continue
             extra={'datacenter_tenant_id': vim.get('datacenter_tenant_id'),
                    'datacenter_id': vim.get('datacenter_id'),
                    '_vim_type_internal': vim.get('type')}
@@ -426,19 +446,84 @@ def get_vim(mydb, nfvo_tenant=None, datacenter_id=None, datacenter_name=None, da
                                 user=vim.get('user',vim_user), passwd=vim.get('passwd',vim_passwd),
                                 config=extra, persistent_info=persistent_info
                         )
+                if cache_key:
+                    with vim_cache_lock:
+                        vim_cache["accounts"][(current_thread().ident, vim['datacenter_tenant_id'])] = {
+                            "record": vim, "vim": vim_dict[vim['datacenter_id']]}
+                    if cached_vims is not None:
+                        cached_vims.append(vim['datacenter_tenant_id'])
             except Exception as e:
                 if ignore_errors:
                     logger.error("Error at VIM  {}; {}: {}".format(vim["type"], type(e).__name__, str(e)))
+                    cached_vims = None
                     continue
                 http_code = httperrors.Internal_Server_Error
                 if isinstance(e, vimconn.vimconnException):
                     http_code = e.http_code
                 raise NfvoException("Error at VIM  {}; {}: {}".format(vim["type"], type(e).__name__, str(e)), http_code)
+        if cache_key and cached_vims is not None:
+            with vim_cache_lock:
+                vim_cache["queries"][cache_key] = (t.time(), cached_vims)
         return vim_dict
     except db_base_Exception as e:
         raise NfvoException(str(e) + " at nfvo.get_vim", e.http_code)
 
 
+def _get_cached_vims(cache_key):
+    """Return the get_vim result for these filter parameters from the cache, or None if not cached or expired. The
+    vimconnectors must have been built at the calling thread"""
+    thread_ident = current_thread().ident
+    with vim_cache_lock:
+        cached = vim_cache["queries"].get(cache_key)
+        if cached and t.time() - cached[0] < VIM_CACHE_TIME:
+            vim_dict = {}
+            for datacenter_tenant_id in cached[1]:
+                account = vim_cache["accounts"].get((thread_ident, datacenter_tenant_id))
+                if not account:
+                    break
+                vim_dict[account["record"]["datacenter_id"]] = account["vim"]
+            else:
+                vim_cache_stats["hits"] += 1
+                return vim_dict
+        vim_cache_stats["misses"] += 1
+        return None
+
+
+def _get_cached_vim_connector(vim):
+    """Return the cached vimconnector of a vim account if it was built by the calling thread from the same database
+    content, else None"""
+    with vim_cache_lock:
+        account = vim_cache["accounts"].get((current_thread().ident, vim.get('datacenter_tenant_id')))
+        if account and account["record"] == vim:
+            vim_cache_stats["connectors_reused"] += 1
+            return account["vim"]
+    return None
+
+
+def invalidate_vim_cache(datacenter_tenant_id=None, datacenter_id=None):
+    """Remove from the get_vim cache the vim accounts with this datacenter_tenant_id or datacenter_id, or all of them if
+    none is provided. The cached get_vim results are always removed, as associations can also have changed
+    """
+    with vim_cache_lock:
+        vim_cache_stats["invalidations"] += 1
+        vim_cache["queries"].clear()
+        if not datacenter_tenant_id and not datacenter_id:
+            vim_cache["accounts"].clear()
+            return
+        for account_key, account in vim_cache["accounts"].items():
+            if account_key[1] == datacenter_tenant_id or account["record"]["datacenter_id"] == datacenter_id:
+                del vim_cache["accounts"][account_key]
+
+
+def get_vim_cache_stats():
+    """Return the hit/miss counters and size of the get_vim cache"""
+    with vim_cache_lock:
+        stats = dict(vim_cache_stats)
+        stats["accounts"] = len(vim_cache["accounts"])
+        stats["queries"] = len(vim_cache["queries"])
+        return stats
+
+
 def rollback(mydb,  vims, rollback_list):
     undeleted_items=[]
     #delete things by reverse order
@@ -483,6 +568,12 @@ def rollback(mydb,  vims, rollback_list):
 
 
 def check_vnf_descriptor(vnf_descriptor, vnf_descriptor_version=1):
+    """
+    Check the consistency of a vnf descriptor. Raise NfvoException if not valid
+    :param vnf_descriptor: vnf descriptor content, already validated against the vnfd schema (done by format_in with
+        the cached validator of the schema)
+    :param vnf_descriptor_version: 1 or 2
+    """
     global global_config
     #create a dictionary with vnfc-name: vnfc:interface-list  key:values pairs
     vnfc_interfaces={}
@@ -3212,9 +3303,9 @@ def create_instance(mydb, tenant_id, instance_dict):
         # 1. Creating new nets (sce_nets) in the VIM"
         number_mgmt_networks = 0
         db_instance_nets = []
+        # get involved datacenters where each network need to be created
+        nets_involved_datacenters = []
         for sce_net in scenarioDict['nets']:
-            sce_net_uuid = sce_net.get('uuid', sce_net["name"])
-            # get involved datacenters where this network need to be created
             involved_datacenters = []
             for sce_vnf in scenarioDict.get("vnfs", ()):
                 vnf_datacenter = sce_vnf.get("datacenter", default_datacenter_id)
@@ -3227,6 +3318,23 @@ def create_instance(mydb, tenant_id, instance_dict):
                             break
             if not involved_datacenters:
                 involved_datacenters.append(default_datacenter_id)
+            nets_involved_datacenters.append(involved_datacenters)
+
+        # --> WIM
+        # automatic selection of WIM is resolved at once for all the distinct sets of datacenters
+        automatic_wim_datacenters = []
+        for sce_net, involved_datacenters in zip(scenarioDict['nets'], nets_involved_datacenters):
+            target_wim_account = sce_net.get("wim_account", default_wim_account)
+            if len(involved_datacenters) > 1 and 'uuid' in sce_net and \
+                    (target_wim_account is None or target_wim_account is True):
+                automatic_wim_datacenters.append(involved_datacenters)
+        wim_accounts = {}
+        if automatic_wim_datacenters:
+            wim_accounts = wim_engine.find_suitable_wim_accounts(automatic_wim_datacenters, tenant_id)
+        # <-- WIM
+
+        for sce_net, involved_datacenters in zip(scenarioDict['nets'], nets_involved_datacenters):
+            sce_net_uuid = sce_net.get('uuid', sce_net["name"])
             target_wim_account = sce_net.get("wim_account", default_wim_account)
 
             # --> WIM
@@ -3237,8 +3345,7 @@ def create_instance(mydb, tenant_id, instance_dict):
                     # OBS: sce_net without uuid are used internally to VNFs
                     # and the assumption is that VNFs will not be split among
                     # different datacenters
-                    wim_account = wim_engine.find_suitable_wim_account(
-                        involved_datacenters, tenant_id)
+                    wim_account = wim_accounts[frozenset(involved_datacenters)]
                     wim_account_id = wim_account['uuid']
                     wim_account_name = wim_account['name']
                     wim_usage[sce_net['uuid']] = wim_account_id
@@ -3399,7 +3506,7 @@ def create_instance(mydb, tenant_id, instance_dict):
                     "item": "instance_nets",
                     "item_id": net_uuid,
                     "related": related_network,
-                    "extra": yaml.safe_dump(task_extra, default_flow_style=True, width=256)
+                    "extra": action_extra.dumps(task_extra)
                 }
                 net2task_id['scenario'][sce_net_uuid][datacenter_id] = task_index
                 task_index += 1
@@ -3496,8 +3603,7 @@ def create_instance(mydb, tenant_id, instance_dict):
                             "item": "instance_sfis",
                             "item_id": sfi_uuid,
                             "related": sfi_uuid,
-                            "extra": yaml.safe_dump({"params": extra_params, "depends_on": [dependencies[i]]},
-                                                    default_flow_style=True, width=256)
+                            "extra": action_extra.dumps({"params": extra_params, "depends_on": [dependencies[i]]})
                         }
                         sfis_created.append(task_index)
                         task_index += 1
@@ -3524,8 +3630,7 @@ def create_instance(mydb, tenant_id, instance_dict):
                         "item": "instance_sfs",
                         "item_id": sf_uuid,
                         "related": sf_uuid,
-                        "extra": yaml.safe_dump({"params": "", "depends_on": sfis_created},
-                                                default_flow_style=True, width=256)
+                        "extra": action_extra.dumps({"params": "", "depends_on": sfis_created})
                     }
                     sfs_created.append(task_index)
                     task_index += 1
@@ -3578,8 +3683,7 @@ def create_instance(mydb, tenant_id, instance_dict):
                             "item": "instance_classifications",
                             "item_id": classification_uuid,
                             "related": classification_uuid,
-                            "extra": yaml.safe_dump({"params": classification_params, "depends_on": [dependencies[i]]},
-                                                    default_flow_style=True, width=256)
+                            "extra": action_extra.dumps({"params": classification_params, "depends_on": [dependencies[i]]})
                         }
                         classifications_created.append(task_index)
                         task_index += 1
@@ -3607,8 +3711,7 @@ def create_instance(mydb, tenant_id, instance_dict):
                     "item": "instance_sfps",
                     "item_id": sfp_uuid,
                     "related": sfp_uuid,
-                    "extra": yaml.safe_dump({"params": "", "depends_on": sfs_created + classifications_created},
-                                            default_flow_style=True, width=256)
+                    "extra": action_extra.dumps({"params": "", "depends_on": sfs_created + classifications_created})
                 }
                 task_index += 1
                 db_vim_actions.append(db_vim_action)
@@ -3754,7 +3857,7 @@ def instantiate_vnf(mydb, sce_vnf, params, params_out, rollbackList):
             "item": "instance_nets",
             "item_id": net_uuid,
             "related": net_uuid,
-            "extra": yaml.safe_dump(task_extra, default_flow_style=True, width=256)
+            "extra": action_extra.dumps(task_extra)
         }
         task_index += 1
         db_vim_actions.append(db_vim_action)
@@ -4034,8 +4137,7 @@ def instantiate_vnf(mydb, sce_vnf, params, params_out, rollbackList):
                 "item": "instance_vms",
                 "item_id": vm_uuid,
                 "related": vm_uuid,
-                "extra": yaml.safe_dump({"params": task_params, "depends_on": task_depends_on},
-                                        default_flow_style=True, width=256)
+                "extra": action_extra.dumps({"params": task_params, "depends_on": task_depends_on})
             }
             task_index += 1
             db_vim_actions.append(db_vim_action)
@@ -4112,7 +4214,7 @@ def delete_instance(mydb, tenant_id, instance_id):
             "item": "instance_sfps",
             "item_id": sfp["uuid"],
             "related": sfp["related"],
-            "extra": yaml.safe_dump(extra, default_flow_style=True, width=256)
+            "extra": action_extra.dumps(extra)
         }
         task_index += 1
         db_vim_actions.append(db_vim_action)
@@ -4153,7 +4255,7 @@ def delete_instance(mydb, tenant_id, instance_id):
             "item": "instance_classifications",
             "item_id": classification["uuid"],
             "related": classification["related"],
-            "extra": yaml.safe_dump(extra, default_flow_style=True, width=256)
+            "extra": action_extra.dumps(extra)
         }
         task_index += 1
         db_vim_actions.append(db_vim_action)
@@ -4192,7 +4294,7 @@ def delete_instance(mydb, tenant_id, instance_id):
             "item": "instance_sfs",
             "item_id": sf["uuid"],
             "related": sf["related"],
-            "extra": yaml.safe_dump(extra, default_flow_style=True, width=256)
+            "extra": action_extra.dumps(extra)
         }
         task_index += 1
         db_vim_actions.append(db_vim_action)
@@ -4231,7 +4333,7 @@ def delete_instance(mydb, tenant_id, instance_id):
             "item": "instance_sfis",
             "item_id": sfi["uuid"],
             "related": sfi["related"],
-            "extra": yaml.safe_dump(extra, default_flow_style=True, width=256)
+            "extra": action_extra.dumps(extra)
         }
         task_index += 1
         db_vim_actions.append(db_vim_action)
@@ -4273,8 +4375,7 @@ def delete_instance(mydb, tenant_id, instance_id):
                 "item": "instance_vms",
                 "item_id": vm["uuid"],
                 "related": vm["related"],
-                "extra": yaml.safe_dump({"params": vm["interfaces"], "depends_on": sfi_dependencies},
-                                        default_flow_style=True, width=256)
+                "extra": action_extra.dumps({"params": vm["interfaces"], "depends_on": sfi_dependencies})
             }
             db_vim_actions.append(db_vim_action)
             for interface in vm["interfaces"]:
@@ -4328,7 +4429,7 @@ def delete_instance(mydb, tenant_id, instance_id):
             "item": "instance_nets",
             "item_id": net["uuid"],
             "related": net["related"],
-            "extra": yaml.safe_dump(extra, default_flow_style=True, width=256)
+            "extra": action_extra.dumps(extra)
         }
         task_index += 1
         db_vim_actions.append(db_vim_action)
@@ -4629,8 +4730,7 @@ def instance_action(mydb,nfvo_tenant,instance_id, action_dict):
                         "item": "instance_vms",
                         "item_id": vdu_id,
                         "related": target_vm["related"],
-                        "extra": yaml.safe_dump({"params": vm_interfaces},
-                                                default_flow_style=True, width=256)
+                        "extra": action_extra.dumps({"params": vm_interfaces})
                     }
                     task_index += 1
                     db_vim_actions.append(db_vim_action)
@@ -4646,7 +4746,7 @@ def instance_action(mydb,nfvo_tenant,instance_id, action_dict):
                 if not vim_action_to_clone:
                     raise NfvoException("Cannot find the vim_action at database with {}".format(where), httperrors.Internal_Server_Error)
                 vim_action_to_clone = vim_action_to_clone[0]
-                extra = yaml.safe_load(vim_action_to_clone["extra"])
+                extra = action_extra.loads(vim_action_to_clone["extra"])
 
                 # generate a new depends_on. Convert format TASK-Y into new format TASK-ACTION-XXXX.XXXX.Y
                 # TODO do the same for flavor and image when available
@@ -4726,7 +4826,7 @@ def instance_action(mydb,nfvo_tenant,instance_id, action_dict):
                         # TODO examinar parametros, quitar MAC o incrementar. Incrementar IP y colocar las dependencias con ACTION-asdfasd.
                         # ALF
                         # ALF
-                        "extra": yaml.safe_dump({"params": task_params_copy, "depends_on": task_depends_on}, default_flow_style=True, width=256)
+                        "extra": action_extra.dumps({"params": task_params_copy, "depends_on": task_depends_on})
                     }
                     task_index += 1
                     db_vim_actions.append(db_vim_action)
@@ -4808,12 +4908,12 @@ def instance_action(mydb,nfvo_tenant,instance_id, action_dict):
                         else:
                         #print "console data", data
                             try:
-                                console_thread = create_or_use_console_proxy_thread(data["server"], data["port"])
+                                console_proxy_port = create_or_use_console_proxy(data["server"], data["port"])
                                 vm_result[ vm['uuid'] ] = {"vim_result": 200,
                                                            "description": "{protocol}//{ip}:{port}/{suffix}".format(
                                                                                         protocol=data["protocol"],
                                                                                         ip = global_config["http_console_host"],
-                                                                                        port = console_thread.port,
+                                                                                        port = console_proxy_port,
                                                                                         suffix = data["suffix"]),
                                                            "name":vm['name']
                                                         }
@@ -4848,33 +4948,47 @@ def instance_action_get(mydb, nfvo_tenant, instance_id, action_id):
             raise NfvoException("Not found any action with this criteria", httperrors.Not_Found)
         vim_wim_actions = mydb.get_rows(FROM="vim_wim_actions", WHERE={"instance_action_id": action_id})
         rows[0]["vim_wim_actions"] = vim_wim_actions
+        # time of the longest chain of dependent tasks, computed by vim_thread when each task is completed
+        critical_path_time = 0
+        for vim_wim_action in vim_wim_actions:
+            if vim_wim_action["extra"] and "critical_path" in vim_wim_action["extra"]:
+                extra = action_extra.loads(vim_wim_action["extra"])
+                critical_path_time = max(critical_path_time, extra.get("critical_path") or 0)
+        rows[0]["critical_path_time"] = critical_path_time
         # for backward compatibility set vim_actions = vim_wim_actions
         rows[0]["vim_actions"] = vim_wim_actions
     return {"actions": rows}
 
 
-def create_or_use_console_proxy_thread(console_server, console_port):
-    #look for a non-used port
-    console_thread_key = console_server + ":" + str(console_port)
-    if console_thread_key in global_config["console_thread"]:
-        #global_config["console_thread"][console_thread_key].start_timeout()
-        return global_config["console_thread"][console_thread_key]
-
-    for port in  global_config["console_port_iterator"]():
-        #print "create_or_use_console_proxy_thread() port:", port
-        if port in global_config["console_ports"]:
-            continue
-        try:
-            clithread = cli.ConsoleProxyThread(global_config['http_host'], port, console_server, console_port)
-            clithread.start()
-            global_config["console_thread"][console_thread_key] = clithread
-            global_config["console_ports"][port] = console_thread_key
-            return clithread
-        except cli.ConsoleProxyExceptionPortUsed as e:
-            #port used, try with onoher
-            continue
-        except cli.ConsoleProxyException as e:
-            raise NfvoException(str(e), httperrors.Bad_Request)
+def create_or_use_console_proxy(console_server, console_port):
+    """
+    Obtain the port of the console proxy that bypasses to a console server, listening at a new port if needed
+    :return: listening port
+    """
+    global console_proxy
+    with console_proxy_lock:
+        if not console_proxy:
+            console_proxy = cli.ConsoleProxy(global_config['http_host'],
+                                             idle_timeout=global_config.get("http_console_idle_timeout"))
+            console_proxy.start()
+        port = console_proxy.get_port(console_server, console_port)
+        if port:
+            return port
+
+        #look for a non-used port
+        console_key = console_server + ":" + str(console_port)
+        for port in global_config["console_port_iterator"]():
+            if port in global_config["console_ports"]:
+                continue
+            try:
+                console_proxy.add_console(port, console_server, console_port)
+                global_config["console_ports"][port] = console_key
+                return port
+            except cli.ConsoleProxyExceptionPortUsed as e:
+                #port used, try with onoher
+                continue
+            except cli.ConsoleProxyException as e:
+                raise NfvoException(str(e), httperrors.Bad_Request)
     raise NfvoException("Not found any free 'http_console_ports'", httperrors.Conflict)
 
 
@@ -4903,6 +5017,8 @@ def delete_tenant(mydb, tenant):
 
     tenant_dict = mydb.get_table_by_uuid_name('nfvo_tenants', tenant, 'tenant')
     mydb.delete_row_by_id("nfvo_tenants", tenant_dict['uuid'])
+    # the associations of the tenant with the vims are deleted in cascade
+    invalidate_vim_cache()
     return tenant_dict['uuid'] + " " + tenant_dict["name"]
 
 
@@ -4982,12 +5098,14 @@ def edit_datacenter(mydb, datacenter_id_name, datacenter_descriptor):
                 raise NfvoException("Error deleting datacenter-port-mapping " + str(e), httperrors.Conflict)
 
     mydb.update_rows('datacenters', datacenter_descriptor, where)
+    invalidate_vim_cache(datacenter_id=datacenter_id)
     if new_sdn_port_mapping:
         try:
             datacenter_sdn_port_mapping_set(mydb, None, datacenter_id, new_sdn_port_mapping)
         except ovimException as e:
             # Rollback
             mydb.update_rows('datacenters', datacenter, where)
+            invalidate_vim_cache(datacenter_id=datacenter_id)
             raise NfvoException("Error adding datacenter-port-mapping " + str(e), httperrors.Conflict)
     return datacenter_id
 
@@ -4996,6 +5114,7 @@ def delete_datacenter(mydb, datacenter):
     #get nfvo_tenant info
     datacenter_dict = mydb.get_table_by_uuid_name('datacenters', datacenter, 'datacenter')
     mydb.delete_row_by_id("datacenters", datacenter_dict['uuid'])
+    invalidate_vim_cache(datacenter_id=datacenter_dict['uuid'])
     try:
         datacenter_sdn_port_mapping_delete(mydb, None, datacenter_dict['uuid'])
     except ovimException as e:
@@ -5074,6 +5193,7 @@ def create_vim_account(mydb, nfvo_tenant, datacenter_id, name=None, vim_id=None,
         datacenter_tenant_id = datacenter_tenants_dict["uuid"]
         tenants_datacenter_dict["datacenter_tenant_id"] = datacenter_tenant_id
         mydb.new_row('tenants_datacenters', tenants_datacenter_dict)
+        invalidate_vim_cache(datacenter_tenant_id=datacenter_tenant_id)
 
         # create thread
         thread_name = get_non_used_vim_name(datacenter_name, datacenter_id, tenant_dict['name'], tenant_dict['uuid'])
@@ -5123,6 +5243,7 @@ def edit_vim_account(mydb, nfvo_tenant, datacenter_tenant_id, datacenter_id=None
     if update_:
         mydb.update_rows("datacenter_tenants", UPDATE=update_, WHERE={"uuid": datacenter_tenant_id})
 
+    invalidate_vim_cache(datacenter_tenant_id=datacenter_tenant_id)
     vim_threads["running"][datacenter_tenant_id].insert_task("reload")
     return datacenter_tenant_id
 
@@ -5149,6 +5270,8 @@ def delete_vim_account(mydb, tenant_id, vim_account_id, datacenter=None):
 
     #delete this association
     mydb.delete_row(FROM='tenants_datacenters', WHERE=tenants_datacenter_dict)
+    for tenant_datacenter_item in tenant_datacenter_list:
+        invalidate_vim_cache(datacenter_tenant_id=tenant_datacenter_item['datacenter_tenant_id'])
 
     #get vim_tenant info and deletes
     warning=''
@@ -52,11 +52,21 @@ tables_with_createdat_field=["datacenters","instance_nets","instance_scenarios",
                            "instance_wim_nets"]
 
 
+def _group_rows(rows, key="group_id"):
+    """Group the rows of a query by the value of the column 'key', that is removed from the rows
+    :return: dictionary with the key values and the tuple of rows with this value, in the same order
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(row.pop(key), []).append(row)
+    return {k: tuple(v) for k, v in groups.items()}
+
+
 class nfvo_db(db_base.db_base):
     def __init__(self, host=None, user=None, passwd=None, database=None,
-                 log_name='openmano.db', log_level=None, lock=None):
+                 log_name='openmano.db', log_level=None, lock=None, pool_size=1):
         db_base.db_base.__init__(self, host, user, passwd, database,
-                                 log_name, log_level, lock)
+                                 log_name, log_level, lock, pool_size)
         db_base.db_base.tables_with_created_field=tables_with_createdat_field
         return
 
@@ -547,6 +557,7 @@ class nfvo_db(db_base.db_base):
         scenario_id is the uuid or the name if it is not a valid uuid format
         if datacenter_vim_id,d datacenter_id is provided, it supply aditional vim_id fields with the matching vim uuid
         Only one scenario must mutch the filtering or an error is returned
+        The content is obtained with a fixed number of queries, independent of the number of vnfs, vms, etc.
         '''
         where_text = "uuid='{}'".format(scenario_id)
         if not tenant_id and tenant_id != "any":
@@ -564,38 +575,89 @@ class nfvo_db(db_base.db_base):
             scenario_dict["cloud-config"] = yaml.load(scenario_dict["cloud_config"])
         del scenario_dict["cloud_config"]
         # sce_vnfs
-        cmd = "SELECT uuid,name,member_vnf_index,vnf_id,description FROM sce_vnfs WHERE scenario_id='{}' "\
-                "ORDER BY created_at".format(scenario_dict['uuid'])
+        cmd = "SELECT sv.uuid as uuid, sv.name as name, sv.member_vnf_index as member_vnf_index, sv.vnf_id as vnf_id,"\
+                " sv.description as description, v.mgmt_access as mgmt_access"\
+                " FROM sce_vnfs as sv left join vnfs as v on sv.vnf_id=v.uuid"\
+                " WHERE sv.scenario_id='{}' ORDER BY sv.created_at".format(scenario_dict['uuid'])
         self.logger.debug(cmd)
         self.cur.execute(cmd)
         scenario_dict['vnfs'] = self.cur.fetchall()
 
-        for vnf in scenario_dict['vnfs']:
-            cmd = "SELECT mgmt_access FROM vnfs WHERE uuid='{}'".format(scenario_dict['vnfs'][0]['vnf_id'])
+        # sce_interfaces of all the vnfs
+        cmd = "SELECT scei.uuid as uuid, scei.sce_net_id as sce_net_id, scei.interface_id as interface_id,"\
+                " i.external_name as external_name, scei.ip_address as ip_address, scei.sce_vnf_id as group_id"\
+                " FROM sce_interfaces as scei join interfaces as i on scei.interface_id=i.uuid"\
+                " join sce_vnfs as sv on scei.sce_vnf_id=sv.uuid"\
+                " WHERE sv.scenario_id='{}' ORDER BY scei.created_at".format(scenario_dict['uuid'])
+        self.logger.debug(cmd)
+        self.cur.execute(cmd)
+        sce_interfaces = _group_rows(self.cur.fetchall())
+
+        # vms of all the vnfs. Joined by sce_vnfs, so that every vnf gets its own copy even if the same vnf is used
+        # several times at the scenario
+        cmd = "SELECT vms.uuid as uuid, vms.flavor_id as flavor_id, vms.image_id as image_id,"\
+                " vms.image_list as image_list, vms.name as name, vms.description as description,"\
+                " vms.boot_data as boot_data, vms.count as count, vms.availability_zone as availability_zone,"\
+                " vms.osm_id as osm_id, vms.pdu_type as pdu_type, sv.uuid as group_id"\
+                " FROM sce_vnfs as sv join vms on sv.vnf_id=vms.vnf_id"\
+                " WHERE sv.scenario_id='{}' ORDER BY vms.created_at".format(scenario_dict['uuid'])
+        self.logger.debug(cmd)
+        self.cur.execute(cmd)
+        vnf_vms = _group_rows(self.cur.fetchall())
+
+        # interfaces of all the vms
+        cmd = "SELECT i.uuid as uuid, i.internal_name as internal_name, i.external_name as external_name,"\
+                " i.net_id as net_id, i.type as type, i.vpci as vpci, i.mac as mac, i.bw as bw, i.model as model,"\
+                " i.ip_address as ip_address, i.floating_ip as floating_ip, i.port_security as port_security,"\
+                " sv.uuid as group_id, i.vm_id as vm_id"\
+                " FROM sce_vnfs as sv join vms on sv.vnf_id=vms.vnf_id join interfaces as i on i.vm_id=vms.uuid"\
+                " WHERE sv.scenario_id='{}' ORDER BY i.created_at".format(scenario_dict['uuid'])
+        self.logger.debug(cmd)
+        self.cur.execute(cmd)
+        vm_interfaces = {}
+        for iface in self.cur.fetchall():
+            vm_interfaces.setdefault((iface.pop("group_id"), iface.pop("vm_id")), []).append(iface)
+
+        # nets of all the vnfs
+        cmd = "SELECT n.uuid as uuid, n.name as name, n.type as type, n.description as description,"\
+                " n.osm_id as osm_id, sv.uuid as group_id"\
+                " FROM sce_vnfs as sv join nets as n on sv.vnf_id=n.vnf_id"\
+                " WHERE sv.scenario_id='{}'".format(scenario_dict['uuid'])
+        self.logger.debug(cmd)
+        self.cur.execute(cmd)
+        vnf_nets = _group_rows(self.cur.fetchall())
+
+        SELECT_ = "ip_version,subnet_address,gateway_address,dns_address,dhcp_enabled,dhcp_start_address,dhcp_count"
+        net_ip_profiles = {}
+        net_ids = set(net["uuid"] for nets in vnf_nets.values() for net in nets)
+        if net_ids:
+            cmd = "SELECT {}, net_id as group_id FROM ip_profiles WHERE net_id IN ({})".format(
+                SELECT_, ",".join("'{}'".format(net_id) for net_id in net_ids))
             self.logger.debug(cmd)
             self.cur.execute(cmd)
-            mgmt_access_dict = self.cur.fetchall()
-            if mgmt_access_dict[0].get('mgmt_access'):
-                vnf['mgmt_access'] = yaml.load(mgmt_access_dict[0]['mgmt_access'])
+            net_ip_profiles = _group_rows(self.cur.fetchall())
+
+        vim_images = {}
+        vim_flavors = {}
+        if datacenter_vim_id!=None:
+            for table, column, vim_ids in (("datacenters_images", "image_id", vim_images),
+                                           ("datacenters_flavors", "flavor_id", vim_flavors)):
+                ids = set(vm[column] for vms in vnf_vms.values() for vm in vms if vm[column])
+                if not ids:
+                    continue
+                cmd = "SELECT {} as group_id, vim_id FROM {} WHERE datacenter_vim_id='{}' AND {} IN ({})".format(
+                    column, table, datacenter_vim_id, column, ",".join("'{}'".format(id_) for id_ in ids))
+                self.logger.debug(cmd)
+                self.cur.execute(cmd)
+                vim_ids.update(_group_rows(self.cur.fetchall()))
+
+        for vnf in scenario_dict['vnfs']:
+            if vnf['mgmt_access']:
+                vnf['mgmt_access'] = yaml.load(vnf['mgmt_access'])
             else:
                 vnf['mgmt_access'] = None
-            # sce_interfaces
-            cmd = "SELECT scei.uuid,scei.sce_net_id,scei.interface_id,i.external_name,scei.ip_address"\
-                    " FROM sce_interfaces as scei join interfaces as i on scei.interface_id=i.uuid"\
-                    " WHERE scei.sce_vnf_id='{}' ORDER BY scei.created_at".format(vnf['uuid'])
-            self.logger.debug(cmd)
-            self.cur.execute(cmd)
-            vnf['interfaces'] = self.cur.fetchall()
-            # vms
-            cmd = "SELECT vms.uuid as uuid, flavor_id, image_id, image_list, vms.name as name," \
-                    " vms.description as description, vms.boot_data as boot_data, count," \
-                    " vms.availability_zone as availability_zone, vms.osm_id as osm_id, vms.pdu_type" \
-                    " FROM vnfs join vms on vnfs.uuid=vms.vnf_id" \
-                    " WHERE vnfs.uuid='" + vnf['vnf_id'] + "'"  \
-                    " ORDER BY vms.created_at"
-            self.logger.debug(cmd)
-            self.cur.execute(cmd)
-            vnf['vms'] = self.cur.fetchall()
+            vnf['interfaces'] = sce_interfaces.get(vnf['uuid'], ())
+            vnf['vms'] = vnf_vms.get(vnf['uuid'], ())
             for vm in vnf['vms']:
                 if vm["boot_data"]:
                     vm["boot_data"] = yaml.safe_load(vm["boot_data"])
@@ -606,32 +668,14 @@ class nfvo_db(db_base.db_base):
                 else:
                     del vm["image_list"]
                 if datacenter_vim_id!=None:
-                    if vm['image_id']:
-                        cmd = "SELECT vim_id FROM datacenters_images WHERE image_id='{}' AND " \
-                                "datacenter_vim_id='{}'".format(vm['image_id'], datacenter_vim_id)
-                        self.logger.debug(cmd)
-                        self.cur.execute(cmd)
-                        if self.cur.rowcount==1:
-                            vim_image_dict = self.cur.fetchone()
-                            vm['vim_image_id']=vim_image_dict['vim_id']
-                    if vm['flavor_id']:
-                        cmd = "SELECT vim_id FROM datacenters_flavors WHERE flavor_id='{}' AND " \
-                                "datacenter_vim_id='{}'".format(vm['flavor_id'], datacenter_vim_id)
-                        self.logger.debug(cmd)
-                        self.cur.execute(cmd)
-                        if self.cur.rowcount==1:
-                            vim_flavor_dict = self.cur.fetchone()
-                            vm['vim_flavor_id']=vim_flavor_dict['vim_id']
+                    # only if there is exactly one entry, as done when they were obtained one by one
+                    if vm['image_id'] and len(vim_images.get(vm['image_id'], ())) == 1:
+                        vm['vim_image_id'] = vim_images[vm['image_id']][0]['vim_id']
+                    if vm['flavor_id'] and len(vim_flavors.get(vm['flavor_id'], ())) == 1:
+                        vm['vim_flavor_id'] = vim_flavors[vm['flavor_id']][0]['vim_id']
 
                 #interfaces
-                cmd = "SELECT uuid,internal_name,external_name,net_id,type,vpci,mac,bw,model,ip_address," \
-                        "floating_ip, port_security" \
-                        " FROM interfaces" \
-                        " WHERE vm_id='{}'" \
-                        " ORDER BY created_at".format(vm['uuid'])
-                self.logger.debug(cmd)
-                self.cur.execute(cmd)
-                vm['interfaces'] = self.cur.fetchall()
+                vm['interfaces'] = tuple(vm_interfaces.get((vnf['uuid'], vm['uuid']), ()))
                 for iface in vm['interfaces']:
                     iface['port-security'] = iface.pop("port_security")
                     iface['floating-ip'] = iface.pop("floating_ip")
@@ -641,19 +685,12 @@ class nfvo_db(db_base.db_base):
                                 iface["ip_address"] = sce_interface["ip_address"]
                             break
             #nets    every net of a vms
-            cmd = "SELECT uuid,name,type,description, osm_id FROM nets WHERE vnf_id='{}'".format(vnf['vnf_id'])
-            self.logger.debug(cmd)
-            self.cur.execute(cmd)
-            vnf['nets'] = self.cur.fetchall()
+            vnf['nets'] = vnf_nets.get(vnf['uuid'], ())
             for vnf_net in vnf['nets']:
-                SELECT_ = "ip_version,subnet_address,gateway_address,dns_address,dhcp_enabled,dhcp_start_address,dhcp_count"
-                cmd = "SELECT {} FROM ip_profiles WHERE net_id='{}'".format(SELECT_,vnf_net['uuid'])
-                self.logger.debug(cmd)
-                self.cur.execute(cmd)
-                ipprofiles = self.cur.fetchall()
-                if self.cur.rowcount==1:
-                    vnf_net["ip_profile"] = ipprofiles[0]
-                elif self.cur.rowcount>1:
+                ipprofiles = net_ip_profiles.get(vnf_net['uuid'], ())
+                if len(ipprofiles)==1:
+                    vnf_net["ip_profile"] = dict(ipprofiles[0])
+                elif len(ipprofiles)>1:
                     raise db_base.db_base_Exception("More than one ip-profile found with this criteria: net_id='{}'".format(vnf_net['uuid']), httperrors.Bad_Request)
 
         #sce_nets
@@ -663,31 +700,39 @@ class nfvo_db(db_base.db_base):
         self.logger.debug(cmd)
         self.cur.execute(cmd)
         scenario_dict['nets'] = self.cur.fetchall()
+        sce_net_ip_profiles = {}
+        internal_net_ids = [net['uuid'] for net in scenario_dict['nets'] if str(net['external']) == 'false']
+        if internal_net_ids:
+            cmd = "SELECT {}, sce_net_id as group_id FROM ip_profiles WHERE sce_net_id IN ({})".format(
+                SELECT_, ",".join("'{}'".format(net_id) for net_id in internal_net_ids))
+            self.logger.debug(cmd)
+            self.cur.execute(cmd)
+            sce_net_ip_profiles = _group_rows(self.cur.fetchall())
+        datacenter_nets = {}
+        external_net_names = set(net['name'] for net in scenario_dict['nets'] if str(net['external']) != 'false')
+        if external_net_names and datacenter_vim_id!=None:
+            WHERE_ = " WHERE name IN ({})".format(",".join(json.dumps(name) for name in external_net_names))
+            if datacenter_id!=None:
+                WHERE_ += " AND datacenter_id='{}'".format(datacenter_id)
+            cmd = "SELECT name as group_id, vim_net_id FROM datacenter_nets" + WHERE_
+            self.logger.debug(cmd)
+            self.cur.execute(cmd)
+            datacenter_nets = _group_rows(self.cur.fetchall())
         #datacenter_nets
         for net in scenario_dict['nets']:
             if str(net['external']) == 'false':
-                SELECT_ = "ip_version,subnet_address,gateway_address,dns_address,dhcp_enabled,dhcp_start_address,dhcp_count"
-                cmd = "SELECT {} FROM ip_profiles WHERE sce_net_id='{}'".format(SELECT_,net['uuid'])
-                self.logger.debug(cmd)
-                self.cur.execute(cmd)
-                ipprofiles = self.cur.fetchall()
-                if self.cur.rowcount==1:
+                ipprofiles = sce_net_ip_profiles.get(net['uuid'], ())
+                if len(ipprofiles)==1:
                     net["ip_profile"] = ipprofiles[0]
-                elif self.cur.rowcount>1:
+                elif len(ipprofiles)>1:
                     raise db_base.db_base_Exception("More than one ip-profile found with this criteria: sce_net_id='{}'".format(net['uuid']), httperrors.Bad_Request)
                 continue
-            WHERE_=" WHERE name='{}'".format(net['name'])
-            if datacenter_id!=None:
-                WHERE_ += " AND datacenter_id='{}'".format(datacenter_id)
-            cmd = "SELECT vim_net_id FROM datacenter_nets" + WHERE_
-            self.logger.debug(cmd)
-            self.cur.execute(cmd)
-            d_net = self.cur.fetchone()
-            if d_net==None or datacenter_vim_id==None:
+            d_nets = datacenter_nets.get(net['name'])
+            if not d_nets:
                 #print "nfvo_db.get_scenario() WARNING external net %s not found"  % net['name']
                 net['vim_id']=None
             else:
-                net['vim_id']=d_net['vim_net_id']
+                net['vim_id']=d_nets[0]['vim_net_id']
 
         db_base._convert_datetime2str(scenario_dict)
         db_base._convert_str2boolean(scenario_dict, ('public','shared','external','port-security','floating-ip') )
@@ -698,29 +743,48 @@ class nfvo_db(db_base.db_base):
         self.logger.debug(cmd)
         self.cur.execute(cmd)
         scenario_dict['vnffgs'] = self.cur.fetchall()
+        if not scenario_dict['vnffgs']:
+            return scenario_dict
+        cmd = "SELECT r.uuid as uuid, r.name as name, r.sce_vnffg_id as group_id"\
+                " FROM sce_rsps as r join sce_vnffgs as g on r.sce_vnffg_id=g.uuid"\
+                " WHERE g.scenario_id='{}' ORDER BY r.created_at".format(scenario_dict['uuid'])
+        self.logger.debug(cmd)
+        self.cur.execute(cmd)
+        rsps = _group_rows(self.cur.fetchall())
+        cmd = "SELECT h.uuid as uuid, h.if_order as if_order, h.ingress_interface_id as ingress_interface_id,"\
+                " h.egress_interface_id as egress_interface_id, h.sce_vnf_id as sce_vnf_id, h.sce_rsp_id as group_id"\
+                " FROM sce_rsp_hops as h join sce_rsps as r on h.sce_rsp_id=r.uuid"\
+                " join sce_vnffgs as g on r.sce_vnffg_id=g.uuid"\
+                " WHERE g.scenario_id='{}' ORDER BY h.created_at".format(scenario_dict['uuid'])
+        self.logger.debug(cmd)
+        self.cur.execute(cmd)
+        rsp_hops = _group_rows(self.cur.fetchall())
+        cmd = "SELECT c.uuid as uuid, c.name as name, c.sce_vnf_id as sce_vnf_id, c.interface_id as interface_id,"\
+                " c.sce_vnffg_id as vnffg_id, c.sce_rsp_id as rsp_id"\
+                " FROM sce_classifiers as c join sce_vnffgs as g on c.sce_vnffg_id=g.uuid"\
+                " WHERE g.scenario_id='{}' ORDER BY c.created_at".format(scenario_dict['uuid'])
+        self.logger.debug(cmd)
+        self.cur.execute(cmd)
+        classifiers = {}
+        for classifier in self.cur.fetchall():
+            # only the first one of each rsp is used
+            classifiers.setdefault((classifier.pop("vnffg_id"), classifier.pop("rsp_id")), classifier)
+        cmd = "SELECT m.uuid as uuid, m.ip_proto as ip_proto, m.source_ip as source_ip,"\
+                " m.destination_ip as destination_ip, m.source_port as source_port,"\
+                " m.destination_port as destination_port, m.sce_classifier_id as group_id"\
+                " FROM sce_classifier_matches as m join sce_classifiers as c on m.sce_classifier_id=c.uuid"\
+                " join sce_vnffgs as g on c.sce_vnffg_id=g.uuid"\
+                " WHERE g.scenario_id='{}' ORDER BY m.created_at".format(scenario_dict['uuid'])
+        self.logger.debug(cmd)
+        self.cur.execute(cmd)
+        classifier_matches = _group_rows(self.cur.fetchall())
         for vnffg in scenario_dict['vnffgs']:
-            cmd = "SELECT uuid,name FROM sce_rsps WHERE sce_vnffg_id='{}' "\
-                    "ORDER BY created_at".format(vnffg['uuid'])
-            self.logger.debug(cmd)
-            self.cur.execute(cmd)
-            vnffg['rsps'] = self.cur.fetchall()
+            vnffg['rsps'] = rsps.get(vnffg['uuid'], ())
             for rsp in vnffg['rsps']:
-                cmd = "SELECT uuid,if_order,ingress_interface_id,egress_interface_id,sce_vnf_id " \
-                        "FROM sce_rsp_hops WHERE sce_rsp_id='{}' "\
-                        "ORDER BY created_at".format(rsp['uuid'])
-                self.logger.debug(cmd)
-                self.cur.execute(cmd)
-                rsp['connection_points'] = self.cur.fetchall();
-                cmd = "SELECT uuid,name,sce_vnf_id,interface_id FROM sce_classifiers WHERE sce_vnffg_id='{}' "\
-                        "AND sce_rsp_id='{}' ORDER BY created_at".format(vnffg['uuid'], rsp['uuid'])
-                self.logger.debug(cmd)
-                self.cur.execute(cmd)
-                rsp['classifier'] = self.cur.fetchone();
-                cmd = "SELECT uuid,ip_proto,source_ip,destination_ip,source_port,destination_port FROM sce_classifier_matches "\
-                        "WHERE sce_classifier_id='{}' ORDER BY created_at".format(rsp['classifier']['uuid'])
-                self.logger.debug(cmd)
-                self.cur.execute(cmd)
-                rsp['classifier']['matches'] = self.cur.fetchall()
+                rsp['connection_points'] = rsp_hops.get(rsp['uuid'], ())
+                rsp['classifier'] = classifiers.get((vnffg['uuid'], rsp['uuid']))
+                if rsp['classifier']:
+                    rsp['classifier']['matches'] = classifier_matches.get(rsp['classifier']['uuid'], ())
 
         return scenario_dict
 
@@ -780,8 +844,15 @@ class nfvo_db(db_base.db_base):
                 attempt.info['table'] = table_name
                 if isinstance(row_list, dict):
                     row_list = (row_list, )  #create a list with the single value
+                # rows are inserted in bulk, grouped by columns. created_at keeps the order of the rows at row_list
+                rows = []
+                created_times = []
                 for row in row_list:
                     if "TO-DELETE" in row:
+                        # insert the previous rows first to keep the order of insertions and deletions
+                        self._new_rows_internal(table_name, rows, created_times, confidential_data=confidential_data)
+                        rows = []
+                        created_times = []
                         self._delete_row_by_id_internal(table_name, row["TO-DELETE"])
                         continue
                     if table_name in self.tables_with_created_field:
@@ -792,9 +863,9 @@ class nfvo_db(db_base.db_base):
                         index += 1
                     else:
                         created_time_param = 0
-                    self._new_row_internal(table_name, row, add_uuid=False, root_uuid=None,
-                                            confidential_data=confidential_data,
-                                            created_time=created_time_param)
+                    rows.append(row)
+                    created_times.append(created_time_param)
+                self._new_rows_internal(table_name, rows, created_times, confidential_data=confidential_data)
 
     @retry
     @with_transaction
@@ -912,6 +983,7 @@ class nfvo_db(db_base.db_base):
         '''Obtain the instance information, filtering by one or several of the tenant, uuid or name
         instance_id is the uuid or the name if it is not a valid uuid format
         Only one instance must mutch the filtering or an error is returned
+        The content is obtained with a fixed number of queries, independent of the number of vnfs and vms
         '''
         # instance table
         where_list = []
@@ -952,6 +1024,32 @@ class nfvo_db(db_base.db_base):
         self.logger.debug(cmd)
         self.cur.execute(cmd)
         instance_dict['vnfs'] = self.cur.fetchall()
+
+        # instance vms of all the vnfs
+        cmd = "SELECT iv.uuid as uuid, iv.vim_vm_id as vim_vm_id, iv.status as status, iv.error_msg as error_msg,"\
+                " iv.vim_info as vim_info, iv.created_at as created_at, vms.name as name, vms.osm_id as vdu_osm_id,"\
+                " iv.vim_name as vim_name, vms.uuid as vm_uuid, iv.related as related,"\
+                " iv.instance_vnf_id as group_id"\
+                " FROM instance_vms as iv join vms on iv.vm_id=vms.uuid"\
+                " join instance_vnfs as ivnf on iv.instance_vnf_id=ivnf.uuid"\
+                " WHERE ivnf.instance_scenario_id='{}' ORDER BY iv.created_at".format(instance_dict['uuid'])
+        self.logger.debug(cmd)
+        self.cur.execute(cmd)
+        vnf_vms = _group_rows(self.cur.fetchall())
+
+        # instance_interfaces of all the vms
+        cmd = "SELECT ii.vim_interface_id as vim_interface_id, ii.instance_net_id as instance_net_id,"\
+                " i.internal_name as internal_name, i.external_name as external_name,"\
+                " ii.mac_address as mac_address, ii.ip_address as ip_address, ii.vim_info as vim_info,"\
+                " i.type as type, ii.sdn_port_id as sdn_port_id, i.uuid as uuid, ii.instance_vm_id as group_id"\
+                " FROM instance_interfaces as ii join interfaces as i on ii.interface_id=i.uuid"\
+                " join instance_vms as iv on ii.instance_vm_id=iv.uuid"\
+                " join instance_vnfs as ivnf on iv.instance_vnf_id=ivnf.uuid"\
+                " WHERE ivnf.instance_scenario_id='{}' ORDER BY i.created_at".format(instance_dict['uuid'])
+        self.logger.debug(cmd)
+        self.cur.execute(cmd)
+        vm_interfaces = _group_rows(self.cur.fetchall())
+
         for vnf in instance_dict['vnfs']:
             vnf["ip_address"] = None
             vnf_mgmt_access_iface = None
@@ -963,23 +1061,11 @@ class nfvo_db(db_base.db_base):
                 vnf["ip_address"] = vnf_mgmt_access.get("ip-address")
 
             # instance vms
-            cmd = "SELECT iv.uuid as uuid, vim_vm_id, status, error_msg, vim_info, iv.created_at as "\
-                    "created_at, name, vms.osm_id as vdu_osm_id, vim_name, vms.uuid as vm_uuid, related"\
-                    " FROM instance_vms as iv join vms on iv.vm_id=vms.uuid "\
-                    " WHERE instance_vnf_id='{}' ORDER BY iv.created_at".format(vnf['uuid'])
-            self.logger.debug(cmd)
-            self.cur.execute(cmd)
-            vnf['vms'] = self.cur.fetchall()
+            vnf['vms'] = vnf_vms.get(vnf['uuid'], ())
             for vm in vnf['vms']:
                 vm_manage_iface_list=[]
                 # instance_interfaces
-                cmd = "SELECT vim_interface_id, instance_net_id, internal_name,external_name, mac_address,"\
-                        " ii.ip_address as ip_address, vim_info, i.type as type, sdn_port_id, i.uuid"\
-                        " FROM instance_interfaces as ii join interfaces as i on ii.interface_id=i.uuid"\
-                        " WHERE instance_vm_id='{}' ORDER BY created_at".format(vm['uuid'])
-                self.logger.debug(cmd)
-                self.cur.execute(cmd )
-                vm['interfaces'] = self.cur.fetchall()
+                vm['interfaces'] = vm_interfaces.get(vm['uuid'], ())
                 for iface in vm['interfaces']:
                     if vnf_mgmt_access_iface and vnf_mgmt_access_iface == iface["uuid"]:
                         if not vnf["ip_address"]:
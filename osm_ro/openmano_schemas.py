@@ -27,6 +27,35 @@ JSON schemas used by openmano httpserver.py module to parse the different files
 __author__="Alfonso Tierno, Gerardo Garcia, Pablo Montes"
 __date__ ="$09-oct-2014 09:09:48$"
 
+from jsonschema import FormatChecker
+from jsonschema.validators import validator_for
+
+format_checker = FormatChecker()  # shared by all the validators
+_validators = {}  # id(schema): (schema, validator). The schema is kept so that its id is not reused
+
+
+def get_validator(schema):
+    """
+    Return the validator of a schema. It is created, after checking the schema itself, the first time the schema is
+    used, and reused later, so that the schema is not checked and its references are not resolved again
+    :param schema: json schema, usually one of this module
+    :return: jsonschema validator
+    """
+    entry = _validators.get(id(schema))
+    if entry and entry[0] is schema:
+        return entry[1]
+    cls = validator_for(schema)
+    cls.check_schema(schema)
+    validator = cls(schema, format_checker=format_checker)
+    _validators[id(schema)] = (schema, validator)
+    return validator
+
+
+def validate(data, schema):
+    """Same as jsonschema.validate, using the cached validator of the schema. Raises jsonschema ValidationError"""
+    get_validator(schema).validate(data)
+
+
 #Basis schemas
 patern_name="^[ -~]+$"
 passwd_schema={"type" : "string", "minLength":1, "maxLength":60}
@@ -85,12 +114,20 @@ config_schema = {
         "http_port": port_schema,
         "http_admin_port": port_schema,
         "http_host": nameshort_schema,
+        "http_server_mode": {"type": "string", "enum": ["single", "threaded", "prefork"]},
+        "http_workers": {"type": "integer", "minimum": 1},
+        "http_worker_threads": {"type": "integer", "minimum": 1},
         "auto_push_VNF_to_VIMs": boolean_schema,
         "vnf_repository": path_schema,
         "db_host": nameshort_schema,
         "db_user": nameshort_schema,
         "db_passwd": {"type":"string"},
         "db_name": nameshort_schema,
+        "db_pool_size": {"type": "integer", "minimum": 1},
+        "db_clean_retention": {"type": "integer", "minimum": 1},
+        "db_clean_period": {"type": "integer", "minimum": 1},
+        "db_clean_chunk": {"type": "integer", "minimum": 1},
+        "db_clean_throttle": {"type": "number", "minimum": 0},
         "db_ovim_host": nameshort_schema,
         "db_ovim_user": nameshort_schema,
         "db_ovim_passwd": {"type":"string"},
@@ -111,6 +148,7 @@ config_schema = {
                 {"type": "object", "properties": {"from": port_schema, "to": port_schema}, "required": ["from", "to"]}
             ]}
         },
+        "http_console_idle_timeout": {"type": "integer", "minimum": 1},
         "log_level": log_level_schema,
         "log_socket_level": log_level_schema,
         "log_level_db": log_level_schema,
@@ -118,6 +156,8 @@ config_schema = {
         "log_level_wim": log_level_schema,
         "log_level_nfvo": log_level_schema,
         "log_level_http": log_level_schema,
+        "log_http_body_sample": {"type": "number", "minimum": 0, "maximum": 1},
+        "log_http_body_max_size": {"type": "integer", "minimum": 0},
         "log_level_console": log_level_schema,
         "log_level_ovim": log_level_schema,
         "log_file_db": path_schema,
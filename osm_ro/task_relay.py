@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openmano
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+"""
+Relay of the messages for the vim and wim threads from the forked http worker processes (prefork http server mode),
+where these threads are not running, to the parent process. Messages are sent as json datagrams over a unix socket
+pair, so that the messages of several processes are never mixed.
+"""
+
+import json
+import logging
+import socket
+
+__author__ = "Alfonso Tierno"
+
+MAX_MESSAGE_SIZE = 65536
+
+logger = logging.getLogger('openmano.nfvo')
+relay_socket = None  # socket where the forked processes send the messages; None at the parent process
+
+
+def create():
+    """
+    Create the socket pair. It must be called before forking
+    :return: tuple with the sending and the receiving socket
+    """
+    return socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+
+def send(kind, key, task):
+    """
+    Send a message to the parent process. Ignored if there is not relay socket, and then the tasks are taken from
+    database by the thread at its next check
+    :param kind: "vim" or "wim"
+    :param key: thread identifier: datacenter_tenant_id for vim threads, wim_account_id for wim threads
+    :param task: message for the insert_task method of the thread
+    """
+    if relay_socket is None:
+        return
+    try:
+        relay_socket.send(json.dumps({"kind": kind, "key": key, "task": task}))
+    except (socket.error, TypeError, ValueError) as e:
+        logger.error("Cannot relay {} task to '{}': {}".format(kind, key, e))
+
+
+def receive(receiving_socket, get_thread):
+    """
+    Receive the messages and insert them at the threads. It is run by a thread of the parent process until the socket
+    is closed
+    :param receiving_socket: socket returned by create
+    :param get_thread: function that returns the running thread for a kind and key, or None
+    """
+    while True:
+        try:
+            message = receiving_socket.recv(MAX_MESSAGE_SIZE)
+        except socket.error as e:
+            logger.error("Cannot receive relayed tasks: {}".format(e))
+            return
+        if not message:
+            return
+        try:
+            message = json.loads(message)
+            thread = get_thread(message["kind"], message["key"])
+            task = message["task"]
+            if isinstance(task, unicode):  # messages as "reload" are expected as str
+                task = str(task)
+            if thread:
+                thread.insert_task(task)
+        except Exception as e:
+            logger.error("Cannot process relayed task '{}': {}".format(message, e))
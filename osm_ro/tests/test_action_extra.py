@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import unittest
+from datetime import datetime
+
+import yaml
+
+from .. import action_extra
+
+
+class TestActionExtra(unittest.TestCase):
+    def setUp(self):
+        self.extra = {"params": ["vm", None, True, [{"name": "eth0", "net_id": "TASK-1"}]], "depends_on": [1],
+                      "created_items": {"port:1234": True}, "vim_info": "{status: ACTIVE}\n", "critical_path": 1.5}
+
+    def test_round_trip(self):
+        text = action_extra.dumps(self.extra)
+        self.assertTrue(text.startswith(action_extra.HEADER))
+        extra = action_extra.loads(text)
+        self.assertEqual(extra, self.extra)
+        # ascii strings are decoded as str, as yaml does
+        self.assertIsInstance(extra["params"][3][0]["name"], str)
+        # it can be read also as yaml
+        self.assertEqual(yaml.safe_load(text), self.extra)
+
+    def test_yaml_fallback(self):
+        self.assertEqual(action_extra.loads(yaml.safe_dump(self.extra, default_flow_style=True, width=256)),
+                         self.extra)
+        self.assertIsNone(action_extra.loads(None))
+
+    def test_not_json_content_as_yaml(self):
+        extra = {"created_at": datetime(2019, 6, 3)}
+        text = action_extra.dumps(extra)
+        self.assertFalse(text.startswith(action_extra.HEADER))
+        self.assertEqual(action_extra.loads(text), extra)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import socket
+import threading
+import time
+import unittest
+
+from ..console_proxy_thread import ConsoleProxy, ConsoleProxyExceptionPortUsed
+
+
+def _free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def _wait_for(condition, timeout=5):
+    limit = time.time() + timeout
+    while not condition() and time.time() < limit:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestConsoleProxy(unittest.TestCase):
+    def setUp(self):
+        # console server that echoes the received data
+        self.console = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.console.bind(("127.0.0.1", 0))
+        self.console.listen(5)
+        self.console_port = self.console.getsockname()[1]
+        echo = threading.Thread(target=self._echo)
+        echo.daemon = True
+        echo.start()
+        self.proxy = ConsoleProxy("127.0.0.1", idle_timeout=3600)
+        self.proxy.check_finish = 0.05
+        self.proxy.start()
+        self.port = _free_port()
+        self.proxy.add_console(self.port, "127.0.0.1", self.console_port)
+
+    def tearDown(self):
+        self.proxy.terminate()
+        self.proxy.join(5)
+        self.console.close()
+
+    def _echo(self):
+        while True:
+            try:
+                conn, _ = self.console.accept()
+            except socket.error:
+                return
+            thread = threading.Thread(target=self._echo_connection, args=(conn, ))
+            thread.daemon = True
+            thread.start()
+
+    @staticmethod
+    def _echo_connection(conn):
+        while True:
+            data = conn.recv(65536)
+            if not data:
+                break
+            conn.sendall(data)
+        conn.close()
+
+    def _receive(self, client, size):
+        data = b""
+        while len(data) < size:
+            received = client.recv(65536)
+            if not received:
+                break
+            data += received
+        return data
+
+    def test_forward_with_byte_counters(self):
+        data = b"0123456789" * 100000  # larger than the buffers, so that it is sent in parts
+        clients = [socket.create_connection(("127.0.0.1", self.port), timeout=5) for _ in range(2)]
+        for client in clients:
+            sender = threading.Thread(target=client.sendall, args=(data, ))
+            sender.start()
+            self.assertEqual(self._receive(client, len(data)), data)
+            sender.join()
+
+        stats = self.proxy.get_stats()
+        self.assertEqual(stats["sessions"], 2)
+        self.assertEqual(stats["bytes_in"], 2 * len(data))
+        self.assertEqual(stats["bytes_out"], 2 * len(data))
+        self.assertEqual([(s["bytes_in"], s["bytes_out"]) for s in stats["sessions_opened"]],
+                         [(len(data), len(data))] * 2)
+
+        for client in clients:
+            client.close()
+        self.assertTrue(_wait_for(lambda: not self.proxy.get_stats()["sessions_opened"]))
+
+    def test_several_consoles_at_same_thread(self):
+        port2 = _free_port()
+        self.proxy.add_console(port2, "127.0.0.1", self.console_port)
+        self.assertEqual(self.proxy.get_port("127.0.0.1", self.console_port), port2)
+        for port in (self.port, port2):
+            client = socket.create_connection(("127.0.0.1", port), timeout=5)
+            client.sendall(b"hello")
+            self.assertEqual(self._receive(client, 5), b"hello")
+            client.close()
+        self.assertEqual(self.proxy.get_stats()["consoles"], 2)
+
+    def test_port_used(self):
+        with self.assertRaises(ConsoleProxyExceptionPortUsed):
+            self.proxy.add_console(self.port, "127.0.0.1", self.console_port)
+
+    def test_idle_session_reaped(self):
+        self.proxy.idle_timeout = 0.2
+        client = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+        client.sendall(b"hello")
+        self.assertEqual(self._receive(client, 5), b"hello")
+
+        # the proxy closes the connection once idle
+        self.assertEqual(client.recv(10), b"")
+        client.close()
+        self.assertEqual(self.proxy.get_stats()["sessions_reaped"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
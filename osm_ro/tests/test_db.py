@@ -1,14 +1,17 @@
 # -*- coding: utf-8 -*-
 # pylint: disable=E1101
 import unittest
+from copy import deepcopy
+from threading import Thread
+from time import sleep
 
 from MySQLdb import connect, cursors, DatabaseError, IntegrityError
 import mock
 from mock import Mock
 
-from ..db_base import retry, with_transaction
+from ..db_base import build_delete, build_insert, build_select, build_update, retry, with_transaction
 from ..nfvo_db import nfvo_db
-from .db_helpers import TestCaseWithDatabase
+from .db_helpers import TestCaseWithDatabase, TestCaseWithDatabasePerTest, disable_foreign_keys, uuid
 
 
 class TestDbDecorators(TestCaseWithDatabase):
@@ -118,6 +121,321 @@ class TestDbDecorators(TestCaseWithDatabase):
 
         self.assertEqual(count, {'counter': 0})
 
+    def _get_rows_in_thread(self, db, result):
+        thread = Thread(target=lambda: result.append(db.get_rows(SELECT="1+1 as two", FROM="DUAL")))
+        thread.start()
+        return thread
+
+    def test_transaction_pool_concurrency(self):
+        db = nfvo_db(self.host, self.user, self.password, self.database, pool_size=2)
+        db.connect()
+        self.addCleanup(db.disconnect)
+        result = []
+        with db.transaction():
+            # Other thread does not wait for this transaction
+            thread = self._get_rows_in_thread(db, result)
+            thread.join(5)
+            self.assertEqual(result, [({'two': 2},)])
+
+        stats = db.get_pool_stats()
+        self.assertEqual(stats["max_in_use"], 2)
+        self.assertEqual(stats["in_use"], 0)
+        self.assertEqual(stats["idle"], 2)
+
+    def test_transaction_pool_saturation(self):
+        db = nfvo_db(self.host, self.user, self.password, self.database, pool_size=1)
+        db.connect()
+        self.addCleanup(db.disconnect)
+        result = []
+        with db.transaction():
+            # Other thread waits until this transaction finishes
+            thread = self._get_rows_in_thread(db, result)
+            sleep(0.2)
+            self.assertEqual(result, [])
+        thread.join(5)
+        self.assertEqual(result, [({'two': 2},)])
+
+        stats = db.get_pool_stats()
+        self.assertEqual(stats["max_in_use"], 1)
+        self.assertEqual(stats["waits"], 1)
+        self.assertGreater(stats["wait_time"], 0.1)
+
+
+def _without_times(content):
+    """Remove the created_at/modified_at values, that change at every run"""
+    content = deepcopy(content)
+    items = [content]
+    while items:
+        item = items.pop()
+        if isinstance(item, dict):
+            item.pop("created_at", None)
+            item.pop("modified_at", None)
+            items.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            items.extend(item)
+    return content
+
+
+class TestScenarioQueries(TestCaseWithDatabasePerTest):
+    """Full content of get_scenario and get_instance_scenario, that are obtained with a fixed number of queries. A
+    scenario with three vnfs is used: vnf-a with two vms, and vnf-b (one vm) used twice"""
+
+    def setUp(self):
+        super(TestScenarioQueries, self).setUp()
+        self.populate_scenario()
+
+    @disable_foreign_keys
+    def populate_scenario(self):
+        tenant, scenario, instance = uuid("tenant"), uuid("scenario"), uuid("instance")
+        datacenter, datacenter_tenant = uuid("datacenter"), uuid("datacenter-tenant")
+        self.populate([
+            {"nfvo_tenants": {"uuid": tenant, "name": "tenant"}},
+            {"vnfs": [
+                {"uuid": uuid("vnf-a"), "osm_id": "vnfd-a", "name": "vnf-a", "tenant_id": tenant,
+                 "mgmt_access": "interface_id: {}\n".format(uuid("iface-a1-mgmt"))},
+                {"uuid": uuid("vnf-b"), "osm_id": "vnfd-b", "name": "vnf-b", "tenant_id": tenant,
+                 "mgmt_access": "vm_id: {}\n".format(uuid("vm-b1"))}]},
+            {"vms": [
+                {"uuid": uuid("vm-a1"), "osm_id": "vdu-a1", "name": "vm-a1", "vnf_id": uuid("vnf-a"),
+                 "flavor_id": uuid("flavor"), "image_id": uuid("image"), "boot_data": "user-data: hello\n"},
+                {"uuid": uuid("vm-a2"), "osm_id": "vdu-a2", "name": "vm-a2", "vnf_id": uuid("vnf-a"),
+                 "flavor_id": uuid("flavor"), "image_id": uuid("image"), "count": 2},
+                {"uuid": uuid("vm-b1"), "osm_id": "vdu-b1", "name": "vm-b1", "vnf_id": uuid("vnf-b"),
+                 "flavor_id": uuid("flavor"), "image_id": uuid("image")}]},
+            {"nets": {"uuid": uuid("net-a"), "osm_id": "internal-a", "name": "internal-a", "vnf_id": uuid("vnf-a"),
+                      "type": "bridge"}},
+            {"ip_profiles": {"net_id": uuid("net-a"), "ip_version": "IPv4", "subnet_address": "10.0.0.0/24",
+                             "dhcp_enabled": "true"}},
+            {"interfaces": [
+                {"uuid": uuid("iface-a1-mgmt"), "vm_id": uuid("vm-a1"), "internal_name": "eth0",
+                 "external_name": "mgmt", "type": "mgmt"},
+                {"uuid": uuid("iface-a1-data"), "vm_id": uuid("vm-a1"), "internal_name": "eth1",
+                 "net_id": uuid("net-a"), "type": "bridge"},
+                {"uuid": uuid("iface-a2-data"), "vm_id": uuid("vm-a2"), "internal_name": "eth0",
+                 "net_id": uuid("net-a"), "type": "bridge", "mac": "fa:16:3e:00:00:01"},
+                {"uuid": uuid("iface-b1-mgmt"), "vm_id": uuid("vm-b1"), "internal_name": "eth0",
+                 "external_name": "mgmt", "type": "mgmt"}]},
+            {"scenarios": {"uuid": scenario, "osm_id": "nsd", "name": "scenario", "tenant_id": tenant}},
+            {"sce_vnfs": [
+                {"uuid": uuid("sce-vnf-a"), "member_vnf_index": "1", "name": "vnf-a", "scenario_id": scenario,
+                 "vnf_id": uuid("vnf-a")},
+                {"uuid": uuid("sce-vnf-b"), "member_vnf_index": "2", "name": "vnf-b", "scenario_id": scenario,
+                 "vnf_id": uuid("vnf-b")},
+                {"uuid": uuid("sce-vnf-b2"), "member_vnf_index": "3", "name": "vnf-b2", "scenario_id": scenario,
+                 "vnf_id": uuid("vnf-b")}]},
+            {"sce_nets": {"uuid": uuid("sce-net-mgmt"), "osm_id": "mgmt", "name": "mgmt", "scenario_id": scenario,
+                          "type": "bridge", "external": "true"}},
+            {"sce_interfaces": [
+                {"uuid": uuid("sce-iface-a"), "sce_vnf_id": uuid("sce-vnf-a"), "sce_net_id": uuid("sce-net-mgmt"),
+                 "interface_id": uuid("iface-a1-mgmt"), "ip_address": "10.1.0.10"},
+                {"uuid": uuid("sce-iface-b"), "sce_vnf_id": uuid("sce-vnf-b"), "sce_net_id": uuid("sce-net-mgmt"),
+                 "interface_id": uuid("iface-b1-mgmt")},
+                {"uuid": uuid("sce-iface-b2"), "sce_vnf_id": uuid("sce-vnf-b2"), "sce_net_id": uuid("sce-net-mgmt"),
+                 "interface_id": uuid("iface-b1-mgmt"), "ip_address": "10.1.0.12"}]},
+            {"instance_scenarios": {"uuid": instance, "name": "instance", "scenario_id": scenario,
+                                    "tenant_id": tenant, "datacenter_id": datacenter,
+                                    "datacenter_tenant_id": datacenter_tenant}},
+            {"instance_vnfs": [
+                {"uuid": uuid("ivnf-" + vnf), "instance_scenario_id": instance, "vnf_id": uuid(vnfd),
+                 "sce_vnf_id": uuid("sce-" + vnf), "datacenter_id": datacenter,
+                 "datacenter_tenant_id": datacenter_tenant}
+                for vnf, vnfd in (("vnf-a", "vnf-a"), ("vnf-b", "vnf-b"), ("vnf-b2", "vnf-b"))]},
+            {"instance_vms": [
+                {"uuid": uuid("ivm-" + name), "instance_vnf_id": uuid("ivnf-" + vnf), "vm_id": uuid(vm),
+                 "vim_vm_id": "vim-" + name, "vim_name": "instance-" + name, "status": "ACTIVE",
+                 "related": uuid("ivm-" + name)}
+                for vnf, name, vm in (("vnf-a", "vm-a1", "vm-a1"), ("vnf-a", "vm-a2", "vm-a2"),
+                                      ("vnf-b", "vm-b1", "vm-b1"), ("vnf-b2", "vm-b1-2", "vm-b1"))]},
+            {"instance_nets": [
+                {"uuid": uuid("inet-mgmt"), "vim_net_id": "vim-mgmt", "instance_scenario_id": instance,
+                 "sce_net_id": uuid("sce-net-mgmt"), "datacenter_id": datacenter,
+                 "datacenter_tenant_id": datacenter_tenant, "status": "ACTIVE", "related": uuid("inet-mgmt")},
+                {"uuid": uuid("inet-a"), "vim_net_id": "vim-internal-a", "instance_scenario_id": instance,
+                 "net_id": uuid("net-a"), "datacenter_id": datacenter, "datacenter_tenant_id": datacenter_tenant,
+                 "status": "ACTIVE", "created": "true", "related": uuid("inet-a")}]},
+            {"instance_interfaces": [
+                {"uuid": uuid("i" + name), "instance_vm_id": uuid("ivm-" + vm), "instance_net_id": uuid(net),
+                 "interface_id": uuid(iface), "vim_interface_id": "vim-" + name, "ip_address": ip_address,
+                 "type": "external" if net == "inet-mgmt" else "internal"}
+                for vm, name, iface, net, ip_address in (
+                    ("vm-a1", "iface-a1-mgmt", "iface-a1-mgmt", "inet-mgmt", "10.1.0.10"),
+                    ("vm-a1", "iface-a1-data", "iface-a1-data", "inet-a", "10.0.0.2"),
+                    ("vm-a2", "iface-a2-data", "iface-a2-data", "inet-a", "10.0.0.3"),
+                    ("vm-b1", "iface-b1-mgmt", "iface-b1-mgmt", "inet-mgmt", "10.1.0.11"),
+                    ("vm-b1-2", "iface-b1-mgmt-2", "iface-b1-mgmt", "inet-mgmt", "10.1.0.12"))]},
+        ])
+
+    def test_get_scenario(self):
+        scenario = _without_times(self.db.get_scenario(uuid("scenario"), tenant_id=uuid("tenant")))
+
+        def vm_b1(ip_address):
+            return {"uuid": uuid("vm-b1"), "osm_id": "vdu-b1", "name": "vm-b1", "description": None,
+                    "flavor_id": uuid("flavor"), "image_id": uuid("image"), "count": 1,
+                    "availability_zone": None, "pdu_type": None,
+                    "interfaces": ({"uuid": uuid("iface-b1-mgmt"), "internal_name": "eth0",
+                                    "external_name": "mgmt", "net_id": None, "type": "mgmt", "vpci": None,
+                                    "mac": None, "bw": None, "model": None, "ip_address": ip_address,
+                                    "floating-ip": False, "port-security": True},)}
+
+        def sce_interface_b(name, ip_address):
+            return ({"uuid": uuid(name), "sce_net_id": uuid("sce-net-mgmt"), "interface_id": uuid("iface-b1-mgmt"),
+                     "external_name": "mgmt", "ip_address": ip_address},)
+
+        # mgmt_access of each vnf comes from its own vnfd. Before, the one of the first vnf was used for all of them
+        vnf_b_mgmt_access = {"vm_id": uuid("vm-b1")}
+        self.assertEqual(scenario["vnfs"][1]["mgmt_access"], vnf_b_mgmt_access)
+        self.assertEqual(scenario, {
+            "uuid": uuid("scenario"), "osm_id": "nsd", "name": "scenario", "short_name": None,
+            "tenant_id": uuid("tenant"), "description": None, "vendor": None, "public": False, "descriptor": None,
+            "vnfs": (
+                {"uuid": uuid("sce-vnf-a"), "name": "vnf-a", "member_vnf_index": "1", "vnf_id": uuid("vnf-a"),
+                 "description": None, "mgmt_access": {"interface_id": uuid("iface-a1-mgmt")},
+                 "interfaces": ({"uuid": uuid("sce-iface-a"), "sce_net_id": uuid("sce-net-mgmt"),
+                                 "interface_id": uuid("iface-a1-mgmt"), "external_name": "mgmt",
+                                 "ip_address": "10.1.0.10"},),
+                 "vms": (
+                     {"uuid": uuid("vm-a1"), "osm_id": "vdu-a1", "name": "vm-a1", "description": None,
+                      "flavor_id": uuid("flavor"), "image_id": uuid("image"), "count": 1,
+                      "availability_zone": None, "pdu_type": None, "boot_data": {"user-data": "hello"},
+                      "interfaces": (
+                          {"uuid": uuid("iface-a1-mgmt"), "internal_name": "eth0", "external_name": "mgmt",
+                           "net_id": None, "type": "mgmt", "vpci": None, "mac": None, "bw": None, "model": None,
+                           "ip_address": "10.1.0.10", "floating-ip": False, "port-security": True},
+                          {"uuid": uuid("iface-a1-data"), "internal_name": "eth1", "external_name": None,
+                           "net_id": uuid("net-a"), "type": "bridge", "vpci": None, "mac": None, "bw": None,
+                           "model": None, "ip_address": None, "floating-ip": False, "port-security": True})},
+                     {"uuid": uuid("vm-a2"), "osm_id": "vdu-a2", "name": "vm-a2", "description": None,
+                      "flavor_id": uuid("flavor"), "image_id": uuid("image"), "count": 2,
+                      "availability_zone": None, "pdu_type": None,
+                      "interfaces": (
+                          {"uuid": uuid("iface-a2-data"), "internal_name": "eth0", "external_name": None,
+                           "net_id": uuid("net-a"), "type": "bridge", "vpci": None, "mac": "fa:16:3e:00:00:01",
+                           "bw": None, "model": None, "ip_address": None, "floating-ip": False,
+                           "port-security": True},)}),
+                 "nets": ({"uuid": uuid("net-a"), "osm_id": "internal-a", "name": "internal-a", "type": "bridge",
+                           "description": None,
+                           "ip_profile": {"ip_version": "IPv4", "subnet_address": "10.0.0.0/24",
+                                          "gateway_address": None, "dns_address": None, "dhcp_enabled": "true",
+                                          "dhcp_start_address": None, "dhcp_count": None}},)},
+                {"uuid": uuid("sce-vnf-b"), "name": "vnf-b", "member_vnf_index": "2", "vnf_id": uuid("vnf-b"),
+                 "description": None, "mgmt_access": vnf_b_mgmt_access,
+                 "interfaces": sce_interface_b("sce-iface-b", None), "vms": (vm_b1(None),), "nets": ()},
+                # same vnfd used twice: each vnf has its own copy of the vms
+                {"uuid": uuid("sce-vnf-b2"), "name": "vnf-b2", "member_vnf_index": "3", "vnf_id": uuid("vnf-b"),
+                 "description": None, "mgmt_access": vnf_b_mgmt_access,
+                 "interfaces": sce_interface_b("sce-iface-b2", "10.1.0.12"), "vms": (vm_b1("10.1.0.12"),),
+                 "nets": ()}),
+            "nets": ({"uuid": uuid("sce-net-mgmt"), "osm_id": "mgmt", "name": "mgmt", "type": "bridge",
+                      "description": None, "external": True, "vim_network_name": None, "vim_id": None},),
+            "vnffgs": (),
+        })
+
+    def test_get_instance_scenario(self):
+        instance = _without_times(self.db.get_instance_scenario(uuid("instance"), verbose=True))
+
+        def vm(name, vm_name, vdu_osm_id, ip_address, *interfaces):
+            content = {"uuid": uuid("ivm-" + name), "vim_vm_id": "vim-" + name, "status": "ACTIVE",
+                       "error_msg": None, "vim_info": None, "name": vm_name, "vdu_osm_id": vdu_osm_id,
+                       "vim_name": "instance-" + name, "related": uuid("ivm-" + name), "interfaces": interfaces}
+            if ip_address:
+                content["ip_address"] = ip_address
+            return content
+
+        def interface(name, net, internal_name, ip_address, external_name=None, type_="bridge"):
+            return {"vim_interface_id": "vim-" + name, "instance_net_id": uuid(net), "internal_name": internal_name,
+                    "external_name": external_name, "mac_address": None, "ip_address": ip_address,
+                    "vim_info": None, "type": type_, "sdn_port_id": None}
+
+        def vnf(name, vnfd, vnfd_osm_id, member_vnf_index, ip_address, mgmt_access, *vms):
+            return {"uuid": uuid("ivnf-" + name), "vnf_id": uuid(vnfd), "vnf_name": name,
+                    "sce_vnf_id": uuid("sce-" + name), "datacenter_id": uuid("datacenter"),
+                    "datacenter_tenant_id": uuid("datacenter-tenant"), "mgmt_access": mgmt_access,
+                    "member_vnf_index": member_vnf_index, "vnfd_osm_id": vnfd_osm_id,
+                    "ip_address": ip_address, "vms": vms}
+
+        def net(name, vim_net_id, sce_net_id=None, vnf_net_id=None, created=False, ns_net_osm_id=None,
+                vnf_net_osm_id=None):
+            return {"uuid": uuid(name), "vim_net_id": vim_net_id, "status": "ACTIVE", "error_msg": None,
+                    "vim_info": None, "created": created, "sce_net_id": sce_net_id, "vnf_net_id": vnf_net_id,
+                    "datacenter_id": uuid("datacenter"), "datacenter_tenant_id": uuid("datacenter-tenant"),
+                    "sdn_net_id": None, "ns_net_osm_id": ns_net_osm_id, "vnf_net_osm_id": vnf_net_osm_id,
+                    "vim_name": None, "related": uuid(name)}
+
+        mgmt_b = "vm_id: {}\n".format(uuid("vm-b1"))
+        self.assertEqual(instance, {
+            "uuid": uuid("instance"), "name": "instance", "scenario_id": uuid("scenario"),
+            "datacenter_id": uuid("datacenter"), "datacenter_tenant_id": uuid("datacenter-tenant"),
+            "scenario_name": "scenario", "tenant_id": uuid("tenant"), "description": None, "nsd_osm_id": "nsd",
+            "vnfs": (
+                vnf("vnf-a", "vnf-a", "vnfd-a", "1", "10.1.0.10", "interface_id: {}\n".format(uuid("iface-a1-mgmt")),
+                    vm("vm-a1", "vm-a1", "vdu-a1", "10.1.0.10",
+                       interface("iface-a1-mgmt", "inet-mgmt", "eth0", "10.1.0.10", "mgmt", "mgmt"),
+                       interface("iface-a1-data", "inet-a", "eth1", "10.0.0.2")),
+                    vm("vm-a2", "vm-a2", "vdu-a2", None, interface("iface-a2-data", "inet-a", "eth0", "10.0.0.3"))),
+                # the ip address of vnf-b is taken from the vm of its mgmt_access
+                vnf("vnf-b", "vnf-b", "vnfd-b", "2", "10.1.0.11", mgmt_b,
+                    vm("vm-b1", "vm-b1", "vdu-b1", "10.1.0.11",
+                       interface("iface-b1-mgmt", "inet-mgmt", "eth0", "10.1.0.11", "mgmt", "mgmt"))),
+                vnf("vnf-b2", "vnf-b", "vnfd-b", "3", "10.1.0.12", mgmt_b,
+                    vm("vm-b1-2", "vm-b1", "vdu-b1", "10.1.0.12",
+                       interface("iface-b1-mgmt-2", "inet-mgmt", "eth0", "10.1.0.12", "mgmt", "mgmt")))),
+            "nets": (net("inet-mgmt", "vim-mgmt", sce_net_id=uuid("sce-net-mgmt"), ns_net_osm_id="mgmt"),
+                     net("inet-a", "vim-internal-a", vnf_net_id=uuid("net-a"), created=True,
+                         vnf_net_osm_id="internal-a")),
+            "sfps": (), "sfs": (), "sfis": (), "classifications": (),
+        })
+
+
+class TestQueryBuilder(unittest.TestCase):
+    def test_build_select_binds_values(self):
+        sql, params = build_select(
+            SELECT=("uuid",), FROM="vim_wim_actions",
+            WHERE={"status": ["SCHEDULED", None], "worker": None},
+            ORDER_BY=("created_at",), LIMIT="0,10")
+        self.assertIn("(status=%s OR status is Null)", sql)
+        self.assertIn("worker is Null", sql)
+        self.assertTrue(sql.startswith("SELECT uuid FROM vim_wim_actions WHERE "))
+        self.assertTrue(sql.endswith(" ORDER BY created_at LIMIT 0,10"))
+        self.assertEqual(params, ("SCHEDULED",))
+
+    def test_build_select_reuses_template(self):
+        sql1, params1 = build_select(FROM="instance_nets", WHERE={"uuid": "a"})
+        sql2, params2 = build_select(FROM="instance_nets", WHERE={"uuid": 'b"; DROP TABLE x'})
+        self.assertIs(sql1, sql2)
+        self.assertEqual(params2, ('b"; DROP TABLE x',))
+
+    def test_build_select_escapes_literal_percent(self):
+        sql, params = build_select(FROM="vms", WHERE={"image_list LIKE ": "%abc%"})
+        self.assertEqual(sql, "SELECT * FROM vms WHERE image_list LIKE %s")
+        self.assertEqual(params, ("%abc%",))
+        sql, _ = build_select(SELECT="DATE_FORMAT(created_at, '%Y')", FROM="vms")
+        self.assertEqual(sql, "SELECT DATE_FORMAT(created_at, '%%Y') FROM vms")
+
+    def test_build_update(self):
+        sql, params = build_update("wims", {"description": None, "counter": {"INCREMENT": 1}},
+                                   {"OR": {"uuid": 1, "name": "w"}}, modified_time=10.5)
+        self.assertTrue(sql.startswith("UPDATE wims SET "))
+        self.assertIn("counter=counter+1", sql)
+        self.assertIn("description=Null", sql)
+        self.assertIn("modified_at=%s WHERE (", sql)
+        self.assertEqual(params[0], "10.500000")
+        self.assertEqual(sorted(params[1:]), ["1", "w"])
+
+    def test_build_delete(self):
+        sql, params = build_delete(FROM="wims", WHERE=[{"uuid": "a"}, {"name": "b"}], LIMIT=1)
+        self.assertEqual(sql, "DELETE FROM wims WHERE (uuid=%s) OR (name=%s) LIMIT 1")
+        self.assertEqual(params, ("a", "b"))
+
+    def test_build_insert_groups_by_columns(self):
+        sql1, params1 = build_insert("instance_vms", {"uuid": "a", "vim_name": None}, created_time=1.5)
+        sql2, params2 = build_insert("instance_vms", {"vim_name": "b", "uuid": "c"}, created_time=1.6)
+        sql3, _ = build_insert("instance_vms", {"uuid": "d"})
+        self.assertIs(sql1, sql2)
+        self.assertEqual(sql1, "INSERT INTO instance_vms (uuid,vim_name,created_at,modified_at) "
+                               "VALUES (%s,%s,%s,%s)")
+        self.assertEqual(params1, ("a", None, "1.500000000", "1.500000000"))
+        self.assertEqual(sql3, "INSERT INTO instance_vms (uuid) VALUES (%s)")
+
 
 if __name__ == '__main__':
     unittest.main()
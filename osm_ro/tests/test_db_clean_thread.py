@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from mock import Mock
+
+from ..db_clean_thread import DbCleanThread
+
+
+class TestDbCleanThread(unittest.TestCase):
+    def setUp(self):
+        self.db = Mock()
+        self.db.delete_row.return_value = 3
+        self.db.update_rows.return_value = 2
+
+    def test_delete_in_chunks_ordered_by_primary_key(self):
+        chunks = [[{"instance_action_id": "a"}, {"instance_action_id": "b"}],
+                  [{"instance_action_id": "c"}]]
+        self.db.get_rows.side_effect = chunks + [[]]
+        thread = DbCleanThread(self.db, chunk=2, throttle=0)
+
+        deleted = thread.clean()
+
+        self.assertEqual(deleted, 6)
+        # next chunk continues after the last instance_action_id
+        where = self.db.get_rows.call_args_list[1][1]["WHERE"]
+        self.assertEqual(where["va.instance_action_id>"], "b")
+        self.db.delete_row.assert_any_call(FROM="vim_wim_actions", WHERE={"instance_action_id": ["c"]})
+        self.db.delete_row.assert_any_call(FROM="instance_actions", WHERE={"uuid": ["c"]})
+        stats = thread.get_stats()
+        self.assertEqual(stats["actions_deleted"], 6)
+        self.assertEqual(stats["instance_actions_deleted"], 3)
+
+    def test_periodic_pass_keeps_the_locks(self):
+        # locks can belong to workers of other openmanod sharing the database, they are only released at startup
+        self.db.get_rows.return_value = []
+        thread = DbCleanThread(self.db, throttle=0)
+
+        self.assertEqual(thread.clean(), 0)
+        self.assertEqual(thread.clean(), 0)
+        self.db.update_rows.assert_not_called()
+        self.assertEqual(thread.get_stats()["passes"], 2)
+
+    def test_release_all_locks_at_startup(self):
+        thread = DbCleanThread(self.db)
+
+        self.assertEqual(thread.release_all_locks(), 2)
+        self.db.update_rows.assert_called_once_with("vim_wim_actions", UPDATE={"worker": None}, modified_time=0,
+                                                    WHERE={"worker<>": None})
+        self.assertEqual(thread.get_stats()["locks_released"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
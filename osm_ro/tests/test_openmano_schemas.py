@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from jsonschema import exceptions as js_e
+from mock import patch
+
+from .. import openmano_schemas
+from ..openmano_schemas import get_validator, validate, id_schema
+
+
+class TestValidator(unittest.TestCase):
+    def test_validator_created_once_per_schema(self):
+        schema = {"type": "object", "properties": {"name": {"type": "string"}}}
+        with patch.object(openmano_schemas, "validator_for", wraps=openmano_schemas.validator_for) as validator_for:
+            validator = get_validator(schema)
+            self.assertIs(get_validator(schema), validator)
+            validate({"name": "vnf"}, schema)
+        validator_for.assert_called_once_with(schema)
+
+    def test_validate(self):
+        validate("a4b1c2d3-e4f5-4a6b-8c7d-9e0f1a2b3c4d", id_schema)
+        with self.assertRaises(js_e.ValidationError):
+            validate("not-an-id", id_schema)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -28,7 +28,13 @@ import copy
 import unittest
 
 import mock
+from glanceclient.v2.images import Controller as ImageController
 from neutronclient.v2_0.client import Client
+from novaclient import exceptions as nvExceptions
+from novaclient.base import ListWithMeta
+from novaclient.v2.flavors import FlavorManager
+from novaclient.v2.servers import ServerManager
+from requests.exceptions import ConnectionError
 
 from osm_ro import vimconn
 from osm_ro.vimconn_openstack import vimconnector
@@ -850,5 +856,332 @@ class TestSfcOperations(unittest.TestCase):
         self.assertEqual(result, '638f957c-82df-11e7-b7c8-132706021464')
 
 
+class TestRefreshStatus(unittest.TestCase):
+    def setUp(self):
+        # instantiate dummy VIM connector so we can test it
+        self.vimconn = vimconnector(
+            '123', 'openstackvim', '456', '789', 'http://dummy.url', None,
+            'user', 'pass')
+
+    @staticmethod
+    def _mock_server(vm_id, status):
+        server = mock.Mock(id=vm_id)
+        server.to_dict.return_value = {'id': vm_id, 'status': status}
+        return server
+
+    @mock.patch.object(ServerManager, 'list')
+    @mock.patch.object(ServerManager, 'get')
+    @mock.patch.object(Client, 'list_floatingips')
+    @mock.patch.object(Client, 'list_networks')
+    @mock.patch.object(Client, 'list_ports')
+    def test_refresh_vms_status(self, list_ports, list_networks,
+                                list_floatingips, get_server, list_servers):
+        # what OpenStack is assumed to return to the VIM connector
+        servers = {'vm-1': self._mock_server('vm-1', 'ACTIVE'),
+                   'vm-2': self._mock_server('vm-2', 'BUILD')}
+
+        def _get_server(vm_id):
+            if vm_id not in servers:
+                raise nvExceptions.NotFound(404)
+            return servers[vm_id]
+
+        get_server.side_effect = _get_server
+        list_ports.return_value = {'ports': [
+            {'id': 'port-1', 'device_id': 'vm-1', 'network_id': 'net-1',
+             'mac_address': 'fa:16:3e:00:00:01',
+             'fixed_ips': [{'ip_address': '10.0.0.1'}]},
+            {'id': 'port-2', 'device_id': 'vm-2', 'network_id': 'net-1',
+             'mac_address': 'fa:16:3e:00:00:02',
+             'fixed_ips': [{'ip_address': '10.0.0.2'}]},
+        ]}
+        list_networks.return_value = {'networks': [
+            {'id': 'net-1', 'provider:network_type': 'vxlan'}]}
+        list_floatingips.return_value = {'floatingips': [
+            {'port_id': 'port-1', 'floating_ip_address': '192.168.0.1'}]}
+
+        # call the VIM connector
+        result = self.vimconn.refresh_vms_status(['vm-1', 'vm-2', 'vm-3'])
+
+        # assert the VIM connector asked only for the few VMs requested,
+        # and for all their ports at once
+        self.assertFalse(list_servers.called)
+        self.assertEqual(sorted(c[0][0] for c in get_server.call_args_list),
+                         ['vm-1', 'vm-2', 'vm-3'])
+        self.assertEqual(list_ports.call_count, 1)
+        self.assertEqual(sorted(list_ports.call_args[1]['device_id']),
+                         ['vm-1', 'vm-2'])
+        self.assertEqual(list_networks.call_count, 1)
+        self.assertEqual(list_floatingips.call_count, 1)
+        # assert the result is filled for each one of the VMs
+        self.assertEqual(sorted(result.keys()), ['vm-1', 'vm-2', 'vm-3'])
+        self.assertEqual(result['vm-1']['status'], 'ACTIVE')
+        self.assertEqual(result['vm-2']['status'], 'BUILD')
+        self.assertEqual(result['vm-3']['status'], 'DELETED')
+        interface = result['vm-1']['interfaces'][0]
+        self.assertEqual(interface['vim_interface_id'], 'port-1')
+        self.assertEqual(interface['vim_net_id'], 'net-1')
+        self.assertEqual(interface['ip_address'], '192.168.0.1;10.0.0.1')
+        self.assertEqual(result['vm-2']['interfaces'][0]['ip_address'],
+                         '10.0.0.2')
+
+    @mock.patch.object(ServerManager, 'list')
+    @mock.patch.object(ServerManager, 'get')
+    @mock.patch.object(Client, 'list_floatingips')
+    @mock.patch.object(Client, 'list_networks')
+    @mock.patch.object(Client, 'list_ports')
+    def test_refresh_vms_status_many(self, list_ports, list_networks,
+                                     list_floatingips, get_server,
+                                     list_servers):
+        # more VMs than the limit for getting them one by one
+        vm_ids = ['vm-%d' % i
+                  for i in range(vimconnector.REFRESH_VMS_GET_LIMIT + 1)]
+        list_servers.return_value = [self._mock_server(vm_id, 'ACTIVE')
+                                     for vm_id in vm_ids[1:] + ['vm-other']]
+        list_ports.return_value = {'ports': []}
+        list_networks.return_value = {'networks': []}
+        list_floatingips.return_value = {'floatingips': []}
+
+        result = self.vimconn.refresh_vms_status(vm_ids)
+
+        # assert all the VMs are obtained with a single listing of all pages
+        self.assertFalse(get_server.called)
+        list_servers.assert_called_once_with(detailed=True, limit=-1)
+        self.assertEqual(sorted(result.keys()), sorted(vm_ids))
+        self.assertEqual(result['vm-0']['status'], 'DELETED')
+        self.assertEqual(result['vm-1']['status'], 'ACTIVE')
+
+    @mock.patch.object(ServerManager, '_list')
+    @mock.patch.object(Client, 'list_floatingips')
+    @mock.patch.object(Client, 'list_networks')
+    @mock.patch.object(Client, 'list_ports')
+    def test_refresh_vms_status_many_pages(self, list_ports, list_networks,
+                                           list_floatingips, list_page):
+        # the VIM returns the servers in pages of 6 servers
+        vm_ids = ['vm-%02d' % i
+                  for i in range(vimconnector.REFRESH_VMS_GET_LIMIT + 1)]
+        servers = [self._mock_server(vm_id, 'ACTIVE') for vm_id in vm_ids]
+        pages = [servers[index:index + 6]
+                 for index in range(0, len(servers), 6)] + [[]]
+        list_page.side_effect = [ListWithMeta(page, None) for page in pages]
+        list_ports.return_value = {'ports': []}
+        list_networks.return_value = {'networks': []}
+        list_floatingips.return_value = {'floatingips': []}
+
+        result = self.vimconn.refresh_vms_status(vm_ids)
+
+        # assert the next pages are requested from the last server obtained
+        self.assertEqual(list_page.call_count, len(pages))
+        self.assertIn('marker=vm-05', list_page.call_args_list[1][0][0])
+        self.assertIn('marker=vm-10', list_page.call_args_list[2][0][0])
+        # assert the VMs of all the pages are found
+        self.assertEqual(set(vm['status'] for vm in result.values()),
+                         {'ACTIVE'})
+        self.assertEqual(sorted(result.keys()), vm_ids)
+
+    @mock.patch.object(ServerManager, 'get')
+    def test_refresh_vms_status_vim_error(self, get_server):
+        get_server.side_effect = ConnectionError('VIM unreachable')
+
+        result = self.vimconn.refresh_vms_status(['vm-1', 'vm-2'])
+
+        self.assertEqual(result['vm-1']['status'], 'VIM_ERROR')
+        self.assertEqual(result['vm-2']['status'], 'VIM_ERROR')
+
+    @mock.patch.object(Client, 'list_subnets')
+    @mock.patch.object(Client, 'list_networks')
+    def test_refresh_nets_status(self, list_networks, list_subnets):
+        # what OpenStack is assumed to return to the VIM connector
+        list_networks.return_value = {'networks': [
+            {'id': 'net-1', 'status': 'ACTIVE', 'admin_state_up': True,
+             'subnets': ['subnet-1']},
+            {'id': 'net-2', 'status': 'ACTIVE', 'admin_state_up': False,
+             'subnets': []},
+        ]}
+        list_subnets.return_value = {'subnets': [
+            {'id': 'subnet-1', 'cidr': '10.0.0.0/24'}]}
+
+        # call the VIM connector
+        result = self.vimconn.refresh_nets_status(['net-1', 'net-2', 'net-3'])
+
+        # assert the VIM connector asked for all the networks at once
+        self.assertEqual(list_networks.call_count, 1)
+        list_networks.assert_called_with(id=['net-1', 'net-2', 'net-3'])
+        list_subnets.assert_called_with(id=['subnet-1'])
+        self.assertEqual(result['net-1']['status'], 'ACTIVE')
+        self.assertEqual(result['net-2']['status'], 'DOWN')
+        self.assertEqual(result['net-3']['status'], 'DELETED')
+
+
+class TestImageIndex(unittest.TestCase):
+    def setUp(self):
+        # instantiate dummy VIM connector so we can test it
+        self.persistent_info = {}
+        self.vimconn = vimconnector(
+            '123', 'openstackvim', '456', '789', 'http://dummy.url', None,
+            'user', 'pass', persistent_info=self.persistent_info)
+        self.images = [
+            {'id': 'image-1', 'name': 'ubuntu', 'checksum': 'c1',
+             'location': '/images/ubuntu.qcow2',
+             'updated_at': '2019-03-01T10:00:00Z'},
+            {'id': 'image-2', 'name': 'cirros', 'checksum': 'c2',
+             'location': '/images/cirros.img',
+             'updated_at': '2019-03-02T10:00:00Z'},
+        ]
+
+    @mock.patch.object(ImageController, 'list')
+    def test_image_lookups_use_index(self, list_images):
+        list_images.return_value = self.images
+
+        self.assertEqual(
+            self.vimconn.get_image_id_from_path('/images/cirros.img'),
+            'image-2')
+        result = self.vimconn.get_image_list({'name': 'ubuntu'})
+        self.assertEqual([image['id'] for image in result], ['image-1'])
+        result = self.vimconn.get_image_list({'checksum': 'c2'})
+        self.assertEqual([image['id'] for image in result], ['image-2'])
+
+        # assert glance was asked only once for the whole list
+        list_images.assert_called_once_with()
+
+    @mock.patch.object(ImageController, 'list')
+    def test_index_survives_connector_recreation(self, list_images):
+        list_images.return_value = self.images
+        self.vimconn.get_image_list({'id': 'image-1'})
+
+        other_vimconn = vimconnector(
+            '123', 'openstackvim', '456', '789', 'http://dummy.url', None,
+            'user', 'pass', persistent_info=self.persistent_info)
+        result = other_vimconn.get_image_list({'id': 'image-2'})
+
+        self.assertEqual(result[0]['name'], 'cirros')
+        self.assertEqual(list_images.call_count, 1)
+
+    @mock.patch.object(ImageController, 'list')
+    def test_unknown_path_refreshes_changes_since(self, list_images):
+        list_images.return_value = self.images
+        self.vimconn.get_image_list()
+        new_image = {'id': 'image-3', 'name': 'new', 'checksum': 'c3',
+                     'location': '/images/new.img',
+                     'updated_at': '2019-03-03T10:00:00Z'}
+        list_images.return_value = [new_image]
+
+        image_id = self.vimconn.get_image_id_from_path('/images/new.img')
+
+        self.assertEqual(image_id, 'image-3')
+        list_images.assert_called_with(
+            filters={'updated_at': 'gte:2019-03-02T10:00:00Z'})
+        with self.assertRaises(vimconn.vimconnNotFoundException):
+            self.vimconn.get_image_id_from_path('/images/other.img')
+
+    @mock.patch.object(ImageController, 'delete')
+    @mock.patch.object(ImageController, 'list')
+    def test_delete_image_removes_it_from_index(self, list_images,
+                                                delete_image):
+        list_images.return_value = self.images
+        self.vimconn.get_image_list()
+        list_images.return_value = []
+
+        self.vimconn.delete_image('image-1')
+
+        self.assertEqual(self.vimconn.get_image_list({'name': 'ubuntu'}), [])
+        delete_image.assert_called_once_with('image-1')
+
+
+class TestFlavorCatalog(unittest.TestCase):
+    def setUp(self):
+        # instantiate dummy VIM connector so we can test it
+        self.persistent_info = {}
+        self.vimconn = vimconnector(
+            '123', 'openstackvim', '456', '789', 'http://dummy.url', None,
+            'user', 'pass', persistent_info=self.persistent_info)
+        epa_keys = {'hw:numa_nodes': '1', 'hw:mem_page_size': 'large',
+                    'hw:cpu_policy': 'dedicated',
+                    'hw:numa_mempolicy': 'strict', 'hw:cpu_sockets': '1',
+                    'hw:cpu_thread_policy': 'isolate'}
+        self.flavors = [
+            self._flavor('small', 2048, 1, 10),
+            self._flavor('medium', 4096, 2, 20),
+            self._flavor('large', 8192, 4, 40),
+            self._flavor('wide', 4096, 1, 80),
+            self._flavor('epa', 4096, 4, 10, epa_keys),
+        ]
+
+    @staticmethod
+    def _flavor(flavor_id, ram, vcpus, disk, extra_specs=None):
+        flavor = mock.Mock(id=flavor_id, ram=ram, vcpus=vcpus, disk=disk)
+        flavor.get_keys.return_value = extra_specs or {}
+        return flavor
+
+    @mock.patch.object(FlavorManager, 'list')
+    def test_exact_match(self, list_flavors):
+        list_flavors.return_value = self.flavors
+
+        flavor_id = self.vimconn.get_flavor_id_from_data(
+            {'ram': 4096, 'vcpus': 2, 'disk': 20})
+        self.assertEqual(flavor_id, 'medium')
+        with self.assertRaises(vimconn.vimconnNotFoundException):
+            self.vimconn.get_flavor_id_from_data(
+                {'ram': 4096, 'vcpus': 2, 'disk': 30})
+
+        # assert nova and extra_specs were asked only once
+        list_flavors.assert_called_once_with()
+        for flavor in self.flavors:
+            flavor.get_keys.assert_called_once_with()
+
+    @mock.patch.object(FlavorManager, 'list')
+    def test_nearest_fit(self, list_flavors):
+        list_flavors.return_value = self.flavors
+        self.vimconn.config['use_existing_flavors'] = True
+
+        # 'wide' has more ram and disk but not enough vcpus
+        flavor_id = self.vimconn.get_flavor_id_from_data(
+            {'ram': 3000, 'vcpus': 2, 'disk': 15})
+        self.assertEqual(flavor_id, 'medium')
+        flavor_id = self.vimconn.get_flavor_id_from_data(
+            {'ram': 4096, 'vcpus': 2, 'disk': 30})
+        self.assertEqual(flavor_id, 'large')
+        with self.assertRaises(vimconn.vimconnNotFoundException):
+            self.vimconn.get_flavor_id_from_data(
+                {'ram': 16384, 'vcpus': 1, 'disk': 10})
+
+    @mock.patch.object(FlavorManager, 'list')
+    def test_extended_match(self, list_flavors):
+        list_flavors.return_value = self.flavors
+        flavor_dict = {'ram': 1024, 'vcpus': 1, 'disk': 10,
+                       'extended': {'numas': [{'memory': 4, 'cores': 4}]}}
+
+        flavor_id = self.vimconn.get_flavor_id_from_data(flavor_dict)
+        self.assertEqual(flavor_id, 'epa')
+        flavor_dict['extended']['numas'][0] = {'memory': 4, 'threads': 4}
+        with self.assertRaises(vimconn.vimconnNotFoundException):
+            self.vimconn.get_flavor_id_from_data(flavor_dict)
+
+    @mock.patch.object(FlavorManager, 'delete')
+    @mock.patch.object(FlavorManager, 'create')
+    @mock.patch.object(FlavorManager, 'list')
+    def test_new_and_delete_flavor_update_catalog(self, list_flavors,
+                                                  create_flavor,
+                                                  delete_flavor):
+        list_flavors.return_value = self.flavors
+        self.vimconn.get_flavor_id_from_data(
+            {'ram': 2048, 'vcpus': 1, 'disk': 10})
+        create_flavor.return_value = self._flavor('new', 1024, 1, 5)
+
+        flavor_id = self.vimconn.new_flavor(
+            {'name': 'new', 'ram': 1024, 'vcpus': 1, 'disk': 5},
+            change_name_if_used=False)
+        self.assertEqual(
+            self.vimconn.get_flavor_id_from_data(
+                {'ram': 1024, 'vcpus': 1, 'disk': 5}),
+            flavor_id)
+
+        self.vimconn.delete_flavor('small')
+        with self.assertRaises(vimconn.vimconnNotFoundException):
+            self.vimconn.get_flavor_id_from_data(
+                {'ram': 2048, 'vcpus': 1, 'disk': 10})
+        delete_flavor.assert_called_once_with('small')
+        list_flavors.assert_called_once_with()
+
+
 if __name__ == '__main__':
     unittest.main()
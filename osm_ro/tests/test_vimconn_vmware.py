@@ -30,6 +30,7 @@ from pyvcloud.vcd.org import Org
 from pyvcloud.vcd.vdc import VDC
 from pyvcloud.vcd.vapp import VApp
 import os
+import tempfile
 import unittest
 import mock
 import test_vimconn_vmware_xml_response as xml_resp
@@ -978,3 +979,64 @@ class TestVimconn_VMware(unittest.TestCase):
 
         # call to VIM connector method
         self.assertRaises(vimconnException, self.vim.action_vminstance, vm_id,{'invalid': None})
+
+    @mock.patch('osm_ro.vimconn_vmware.Client')
+    def test_connect_reuses_client(self, client_class):
+        """
+        Testcase to reuse the logged client at the following connections
+        """
+        self.vim.persistent_info = {}
+        self.vim.user = 'user'
+        self.vim.passwd = 'passwd'
+        client_class.side_effect = [mock.Mock(), mock.Mock()]
+
+        client = self.vim.connect()
+
+        self.assertIs(self.vim.connect(), client)
+        self.assertIsNot(self.vim.connect_as_admin(), client)
+        self.assertEqual(client_class.call_count, 2)
+
+    @mock.patch('osm_ro.vimconn_vmware.Client')
+    def test_perform_request_login_again_on_unauthorized(self, client_class):
+        """
+        Testcase to log in again and repeat the request when vCD session has expired
+        """
+        self.vim.persistent_info = {}
+        self.vim.client = mock.Mock()
+        self.vim.client._session.headers = {'x-vcloud-authorization': 'old'}
+        client_class.return_value._session.headers = {'x-vcloud-authorization': 'new'}
+        session = mock.Mock()
+        session.request.side_effect = [mock.Mock(status_code=401), mock.Mock(status_code=200)]
+        self.vim.persistent_info["http_session"] = session
+
+        response = self.vim.perform_request(req_type='GET', url='https://test/api/org',
+                                            headers={'x-vcloud-authorization': 'old'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIs(self.vim.client, client_class.return_value)
+        self.assertEqual(session.request.call_args[1]['headers']['x-vcloud-authorization'], 'new')
+
+    @mock.patch('osm_ro.vimconn_vmware.UPLOAD_RETRIES', 1)
+    def test_upload_vmdk_resumed_after_failure(self):
+        """
+        Testcase to resume a failed VMDK upload from the last uploaded offset
+        """
+        href = 'https://test/transfer/disk.vmdk'
+        self.vim.persistent_info = {"http_session": mock.Mock()}
+        put = self.vim.persistent_info["http_session"].put
+        put.side_effect = [mock.Mock(status_code=200), mock.Mock(status_code=200), mock.Mock(status_code=500)]
+        file_vmdk = tempfile.NamedTemporaryFile(suffix='.vmdk')
+        file_vmdk.write('0123456789' * 5)
+        file_vmdk.flush()
+
+        self.assertFalse(self.vim.upload_vmdk(href, file_vmdk.name, {}, catalog_name='catalog', chunk_bytes=10))
+        self.assertEqual(self.vim.persistent_info["vmdk_uploads"][href]["offset"], 20)
+
+        # data is read from the file map, that is closed after the upload
+        received = []
+        put.side_effect = lambda url, headers, data: received.append((headers['Content-Range'], str(data))) or \
+            mock.Mock(status_code=200)
+        self.assertTrue(self.vim.upload_vmdk(href, file_vmdk.name, {}, catalog_name='catalog', chunk_bytes=10))
+        self.assertEqual(received, [('bytes 20-29/50', '0123456789'), ('bytes 30-39/50', '0123456789'),
+                                    ('bytes 40-49/50', '0123456789')])
+        self.assertEqual(self.vim.persistent_info["vmdk_uploads"], {})
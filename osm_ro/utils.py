@@ -39,7 +39,8 @@ import six
 from six.moves import filter, filterfalse
 
 from jsonschema import exceptions as js_e
-from jsonschema import validate as js_v
+
+from .openmano_schemas import validate as js_v
 
 if six.PY3:
     from inspect import getfullargspec as getspec
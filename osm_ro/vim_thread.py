@@ -22,7 +22,10 @@
 ##
 
 """"
-This is thread that interacts with a VIM. It processes TASKs sequentially against a single VIM.
+This is thread that interacts with a VIM. It processes TASKs sequentially against a single VIM. The VIM operations
+(creations, deletions) can be executed in parallel by several task workers setting 'tasks_concurrency' at the vim
+account or datacenter config. Tasks of the same related group, and tasks with pending dependencies, are never
+executed in parallel.
 The tasks are stored at database in table vim_wim_actions
 Several vim_wim_actions can refer to the same element at VIM (flavor, network, ...). This is somethng to avoid if RO
 is migrated to a non-relational database as mongo db. Each vim_wim_actions reference a different instance_Xxxxx
@@ -44,7 +47,7 @@ The task content is (M: stored at memory, D: stored at database):
                     FINISHED: similar to DONE, but no refresh is needed anymore. Task is maintained at database but
                         it is never processed by any thread
                     SUPERSEDED: similar to FINSISHED, but nothing has been done to completed the task.
-    MD  extra:      text with yaml format at database, dict at memory with:
+    MD  extra:      text with json format at database (see action_extra), dict at memory with:
             params:     list with the params to be sent to the VIM for CREATE or FIND. For DELETE the vim_id is taken
                         from other related tasks
             find:       (only for CREATE tasks) if present it should FIND before creating and use if existing. Contains
@@ -63,7 +66,10 @@ The task content is (M: stored at memory, D: stored at database):
             vim_status: VIM status of the element. Stored also at database in the instance_XXX
             vim_info:   Detailed information of a vm/net from the VIM. Stored at database in the instance_XXX but not at
                         vim_wim_actions
+            critical_path: time in seconds to complete this task and the longest chain of tasks it depends on,
+                        from the moment each one can be processed
     M   depends:    dict with task_index(from depends_on) to dependency task
+    M   started_at: time when the processing of a SCHEDULED task started, to compute critical_path
     M   params:     same as extra[params]
     MD  error_msg:  descriptive text upon an error.Stored also at database instance_XXX
     MD  created_at: task creation time. The task of creation must be the oldest
@@ -72,13 +78,17 @@ The task content is (M: stored at memory, D: stored at database):
     MD related:     All the tasks over the same VIM element have same "related". Note that other VIMs can contain the
                     same value of related, but this thread only process those task of one VIM.  Also related can be the
                     same among several NS os isntance-scenarios
-    MD worker:      Used to lock in case of several thread workers.
+    MD worker:      Used to lock in case of several thread workers. The thread takes the ownership of all the pending
+                    tasks of its VIM, that are kept at memory and ordered by modified_at in a heap. Database is only
+                    written with the changes of state, grouped in transactions (see _update_db and _flush_db_journal)
 
 """
 
+import os
 import threading
 import time
 import Queue
+import heapq
 import logging
 import vimconn
 import vimconn_openvim
@@ -89,9 +99,13 @@ import vimconn_vmware
 import vimconn_fos
 import vimconn_azure
 import yaml
+import action_extra
+import task_relay
 from db_base import db_base_Exception
 from lib_osm_openvim.ovim import ovimException
 from copy import deepcopy
+from collections import OrderedDict
+from itertools import count
 
 __author__ = "Alfonso Tierno, Pablo Montes"
 __date__ = "$28-Sep-2017 12:07:15$"
@@ -107,6 +121,12 @@ vim_module = {
 }
 
 
+# tasks of a vim_thread with other vim_threads of this process waiting for them to be completed.
+# <instance_action_id>.<task_index>: set of waiting vim_threads. See vim_thread._wake_cross_thread_dependents
+cross_thread_waits = {}
+cross_thread_waits_lock = threading.Lock()
+
+
 def is_task_id(task_id):
     return task_id.startswith("TASK-")
 
@@ -124,6 +144,12 @@ class vim_thread(threading.Thread):
     REFRESH_ACTIVE = 60  # 1 minute
     REFRESH_ERROR = 600
     REFRESH_DELETE = 3600 * 10
+    REFRESH_BATCH = 100  # maximum number of VIM elements refreshed with a single call to the VIM
+    MAX_WAITING_TIME = 60  # maximum time sleeping when there is nothing to do, in case tasks are inserted externally
+    RETRY_DATABASE = 5  # time to retry when tasks cannot be loaded from or written to database
+    DATABASE_LIMIT = 1000  # number of tasks read from database at each query when loading tasks
+    DATABASE_BATCH = 20  # maximum number of pending updates before writing them to database
+    TASKS_CONCURRENCY = 1  # default number of VIM operations in parallel. Set per vim account with 'tasks_concurrency'
 
     def __init__(self, task_lock, name=None, datacenter_name=None, datacenter_tenant_id=None,
                  db=None, db_lock=None, ovim=None):
@@ -146,13 +172,38 @@ class vim_thread(threading.Thread):
             self.name = name
         self.vim_persistent_info = {}
         self.my_id = self.name[:64]
+        # VIM status obtained in bulk and not consumed yet by its refresh task. <item>: {<vim_id>: (time, vim_info)}
+        self.refresh_cache = {"instance_vms": {}, "instance_nets": {}}
 
         self.logger = logging.getLogger('openmano.vim.' + self.name)
         self.db = db
         self.db_lock = db_lock
 
         self.task_lock = task_lock
+        self.pid = os.getpid()  # process where the thread runs. Other processes send the tasks through task_relay
         self.task_queue = Queue.Queue(2000)
+        self.task_event = threading.Event()  # set when new messages or tasks are inserted, to wake up the thread
+
+        # pending tasks at memory
+        self.tasks = {}  # <instance_action_id>.<task_index>: task
+        self.related_tasks = {}  # (item, related): list of tasks ordered by created_at
+        self.schedule = []  # heap with (time, created_at, task_id) of the tasks to process
+        self.scheduled_at = {}  # task_id: time. Heap entries with other time are obsolete and ignored
+        self.load_all_tasks = True  # (re)load all the tasks of this VIM from database
+        self.load_instance_actions = set()  # instance_action_ids notified by nfvo with new tasks to load
+        self.next_database_check = 0  # next time to look for tasks inserted at database without notification
+        # database updates pending to be written. <key>: update_rows params. Updates of the same key are merged
+        self.db_journal = OrderedDict()
+        self.db_journal_index = count()
+
+        # parallel execution of VIM operations, when tasks_concurrency > 1
+        self.tasks_concurrency = self.TASKS_CONCURRENCY
+        self.task_workers = []  # threads executing _task_worker
+        self.worker_queue = Queue.Queue()  # (vim_operation, task) to be executed by a task worker
+        self.completed_tasks = Queue.Queue()  # (task, result) executed by a task worker, to be completed
+        self.running_tasks = {}  # task_id: (task, related_tasks, old_task_status, create_or_find) being executed
+        self.blocked_tasks = []  # ready tasks waiting for a running task of the same related group
+        self.dependent_tasks = {}  # task_id: list of tasks waiting for this task to be completed
 
     def get_vimconnector(self):
         try:
@@ -170,6 +221,7 @@ class vim_thread(threading.Thread):
             if vim["dt_config"]:
                 vim_config.update(yaml.load(vim["dt_config"]))
             vim_config['datacenter_tenant_id'] = vim.get('datacenter_tenant_id')
+            self.tasks_concurrency = int(vim_config.get("tasks_concurrency") or self.TASKS_CONCURRENCY)
             vim_config['datacenter_id'] = vim.get('datacenter_id')
 
             # get port_mapping
@@ -184,94 +236,317 @@ class vim_thread(threading.Thread):
                 user=vim['user'], passwd=vim['passwd'],
                 config=vim_config, persistent_info=self.vim_persistent_info
             )
+            self.refresh_cache = {"instance_vms": {}, "instance_nets": {}}
             self.error_status = None
         except Exception as e:
             self.logger.error("Cannot load vimconnector for vim_account {}: {}".format(self.datacenter_tenant_id, e))
             self.vim = None
             self.error_status = "Error loading vimconnector: {}".format(e)
 
-    def _get_db_task(self):
+    @staticmethod
+    def _get_task_id(task):
+        return "{}.{}".format(task["instance_action_id"], task["task_index"])
+
+    def _load_tasks(self):
         """
-        Read actions from database and reload them at memory. Fill self.refresh_list, pending_list, vim_actions
-        :return: None
+        Take the ownership (worker column) of the pending tasks of this VIM at database and load them at memory. All
+        tasks are loaded if self.load_all_tasks, otherwise only the ones of self.load_instance_actions
+        :return: True if success, False if database cannot be accessed
         """
         now = time.time()
         try:
-            database_limit = 20
-            task_related = None
+            if now >= self.next_database_check:
+                # look for tasks inserted without notification, e.g. by other openmano using the same database
+                self.next_database_check = now + self.MAX_WAITING_TIME
+                if not self.load_all_tasks:
+                    vim_actions = self.db.get_rows(SELECT=("instance_action_id",), FROM="vim_wim_actions",
+                                                   WHERE={"datacenter_vim_id": self.datacenter_tenant_id,
+                                                          "status": ['SCHEDULED', 'BUILD', 'DONE'],
+                                                          "worker": None})
+                    self.load_instance_actions.update(task["instance_action_id"] for task in vim_actions)
+            if not self.load_all_tasks and not self.load_instance_actions:
+                return True
+
+            where_ = {"datacenter_vim_id": self.datacenter_tenant_id,
+                      "status": ['SCHEDULED', 'BUILD', 'DONE', 'FAILED']}
+            if not self.load_all_tasks:
+                where_["instance_action_id"] = list(self.load_instance_actions)
+            self.db.update_rows("vim_wim_actions", UPDATE={"worker": self.my_id}, modified_time=0,
+                                WHERE=dict(where_, worker=None))
+            where_["worker"] = self.my_id
+            if self.load_all_tasks:
+                self.tasks = {}
+                self.related_tasks = {}
+                self.schedule = []
+                self.scheduled_at = {}
+                self.blocked_tasks = []
+                self.dependent_tasks = {}
+            offset = 0
             while True:
-                # get 20 (database_limit) entries each time
-                vim_actions = self.db.get_rows(FROM="vim_wim_actions",
-                                               WHERE={"datacenter_vim_id": self.datacenter_tenant_id,
-                                                      "status": ['SCHEDULED', 'BUILD', 'DONE'],
-                                                      "worker": [None, self.my_id], "modified_at<=": now
-                                                      },
-                                               ORDER_BY=("modified_at", "created_at",),
-                                               LIMIT=database_limit)
-                if not vim_actions:
-                    return None, None
-                # if vim_actions[0]["modified_at"] > now:
-                #     return int(vim_actions[0] - now)
+                vim_actions = self.db.get_rows(FROM="vim_wim_actions", WHERE=where_, ORDER_BY=("created_at",),
+                                               LIMIT="{:d},{:d}".format(offset, self.DATABASE_LIMIT))
                 for task in vim_actions:
-                    # block related task
-                    if task_related == task["related"]:
-                        continue  # ignore if a locking has already tried for these task set
-                    task_related = task["related"]
-                    # lock ...
-                    self.db.update_rows("vim_wim_actions", UPDATE={"worker": self.my_id}, modified_time=0,
-                                        WHERE={"datacenter_vim_id": self.datacenter_tenant_id,
-                                               "status": ['SCHEDULED', 'BUILD', 'DONE', 'FAILED'],
-                                               "worker": [None, self.my_id],
-                                               "related": task_related,
-                                               "item": task["item"],
-                                               })
-                    # ... and read all related and check if locked
-                    related_tasks = self.db.get_rows(FROM="vim_wim_actions",
-                                                     WHERE={"datacenter_vim_id": self.datacenter_tenant_id,
-                                                            "status": ['SCHEDULED', 'BUILD', 'DONE', 'FAILED'],
-                                                            "related": task_related,
-                                                            "item": task["item"],
-                                                            },
-                                                     ORDER_BY=("created_at",))
-                    # check that all related tasks have been locked. If not release and try again. It can happen
-                    # for race conditions if a new related task has been inserted by nfvo in the process
-                    some_tasks_locked = False
-                    some_tasks_not_locked = False
-                    creation_task = None
-                    for relate_task in related_tasks:
-                        if relate_task["worker"] != self.my_id:
-                            some_tasks_not_locked = True
-                        else:
-                            some_tasks_locked = True
-                        if not creation_task and relate_task["action"] in ("CREATE", "FIND"):
-                            creation_task = relate_task
-                    if some_tasks_not_locked:
-                        if some_tasks_locked:  # unlock
-                            self.db.update_rows("vim_wim_actions", UPDATE={"worker": None}, modified_time=0,
-                                                WHERE={"datacenter_vim_id": self.datacenter_tenant_id,
-                                                       "worker": self.my_id,
-                                                       "related": task_related,
-                                                       "item": task["item"],
-                                                       })
-                        continue
+                    self._add_task(task)
+                if len(vim_actions) < self.DATABASE_LIMIT:
+                    break
+                offset += self.DATABASE_LIMIT
+            if self.load_all_tasks:
+                self.logger.debug("Loaded {} tasks, {} pending".format(len(self.tasks), len(self.scheduled_at)))
+            self.load_all_tasks = False
+            self.load_instance_actions = set()
+            return True
+        except db_base_Exception as e:
+            self.logger.error("Cannot load tasks from database: {}".format(e))
+            return False
 
-                    # task of creation must be the first in the list of related_task
-                    assert(related_tasks[0]["action"] in ("CREATE", "FIND"))
+    def _add_task(self, task):
+        """
+        Insert at memory a task read from database. Ignored if it is already loaded
+        :param task: vim_wim_actions database row
+        :return: None
+        """
+        task_id = self._get_task_id(task)
+        if task_id in self.tasks:
+            return
+        # content stored at database, to know if it must be written after processing
+        task["db_content"] = (task["status"], task["vim_id"], task["error_msg"], task["extra"])
+        task["params"] = None
+        task["depends"] = {}
+        extra = action_extra.loads(task["extra"]) or {}
+        task["extra"] = extra
+        if extra.get("params"):
+            task["params"] = deepcopy(extra["params"])
+        self.tasks[task_id] = task
+        self.related_tasks.setdefault((task["item"], task["related"]), []).append(task)
+        self._schedule_task(task, task["modified_at"])
+
+    def _remove_task(self, task):
+        """
+        Remove from memory a task that does not need to be processed anymore (FINISHED, SUPERSEDED)
+        :return: None
+        """
+        task_id = self._get_task_id(task)
+        self.tasks.pop(task_id, None)
+        self.scheduled_at.pop(task_id, None)
+        self._release_dependent_tasks(task_id)
+        related_key = (task["item"], task["related"])
+        related_tasks = self.related_tasks.get(related_key)
+        if related_tasks and task in related_tasks:
+            related_tasks.remove(task)
+            if not related_tasks:
+                del self.related_tasks[related_key]
+
+    def _release_dependent_tasks(self, task_id):
+        """
+        Schedule to be processed now the tasks that were waiting for this task to be completed
+        :param task_id: completed task
+        :return: None
+        """
+        for dependent_task in self.dependent_tasks.pop(task_id, ()):
+            if self._get_task_id(dependent_task) in self.tasks:
+                self._schedule_task(dependent_task, time.time())
 
-                    task["params"] = None
-                    if task["extra"]:
-                        extra = yaml.load(task["extra"])
-                    else:
-                        extra = {}
-                    task["extra"] = extra
-                    if extra.get("depends_on"):
-                        task["depends"] = {}
-                    if extra.get("params"):
-                        task["params"] = deepcopy(extra["params"])
-                    return task, related_tasks
-        except Exception as e:
-            self.logger.critical("Unexpected exception at _get_db_task: " + str(e), exc_info=True)
-            return None, None
+    def _schedule_task(self, task, process_time):
+        """
+        Set the next time a task must be processed. Tasks that are not pending are removed from the schedule
+        :param task: task to schedule
+        :param process_time: time in seconds since the epoch
+        :return: None
+        """
+        task_id = self._get_task_id(task)
+        task["modified_at"] = process_time
+        if task["status"] not in ('SCHEDULED', 'BUILD', 'DONE'):
+            self.scheduled_at.pop(task_id, None)
+        elif self.scheduled_at.get(task_id) != process_time:
+            self.scheduled_at[task_id] = process_time
+            heapq.heappush(self.schedule, (process_time, task["created_at"], task_id))
+
+    def _get_next_task(self):
+        """
+        Get from the schedule the first task that must be processed now
+        :return: task, related_tasks; or None, None if there is not any task ready to be processed
+        """
+        now = time.time()
+        while self.schedule and self.schedule[0][0] <= now:
+            process_time, _, task_id = heapq.heappop(self.schedule)
+            if self.scheduled_at.get(task_id) != process_time:
+                continue  # obsolete entry, the task has been removed or rescheduled
+            del self.scheduled_at[task_id]
+            task = self.tasks[task_id]
+            if self.running_tasks and self._is_task_blocked(task):
+                self.blocked_tasks.append(task)
+                continue
+            return task, self.related_tasks[(task["item"], task["related"])]
+        return None, None
+
+    def _is_task_blocked(self, task):
+        """
+        Check if a task must wait to the running tasks. Tasks of the same related group are processed in order, and
+        creations or deletions need a free task worker
+        :return: True if the task cannot be processed now
+        """
+        for running_task, _, _, _ in self.running_tasks.values():
+            if running_task["item"] == task["item"] and running_task["related"] == task["related"]:
+                return True
+        if task["status"] != "SCHEDULED":
+            return False
+        return len(self.running_tasks) >= self.tasks_concurrency
+
+    def _start_task_workers(self):
+        """
+        Start the threads that execute VIM operations in parallel, if tasks_concurrency is greater than 1
+        :return: None
+        """
+        if self.tasks_concurrency <= 1:
+            return
+        for index in range(self.tasks_concurrency):
+            worker = threading.Thread(target=self._task_worker, name="{}.worker{}".format(self.name, index))
+            worker.daemon = True
+            worker.start()
+            self.task_workers.append(worker)
+        self.logger.debug("Started {} task workers".format(self.tasks_concurrency))
+
+    def _stop_task_workers(self):
+        """
+        Wait until the running VIM operations finish and stop the task workers
+        :return: None
+        """
+        for _ in self.task_workers:
+            self.worker_queue.put(None)
+        for worker in self.task_workers:
+            worker.join()
+        self.task_workers = []
+        self._process_completed_tasks()
+
+    def _task_worker(self):
+        """
+        Body of the task worker threads. Execute the VIM operations dispatched by _proccess_pending_tasks and send
+        the result to the vim_thread, that is the only one modifying the memory and database content
+        :return: None
+        """
+        while True:
+            work = self.worker_queue.get()
+            if not work:
+                return
+            vim_operation, task = work
+            try:
+                result = vim_operation(task)
+            except VimThreadException as e:
+                result = e
+            except Exception as e:
+                self.logger.critical("Unexpected exception at task worker: " + str(e), exc_info=True)
+                result = e
+            self.completed_tasks.put((task, result))
+            self.task_event.set()
+
+    def _process_completed_tasks(self):
+        """
+        Complete the tasks executed by the task workers, and reschedule the tasks that were waiting for them
+        :return: None
+        """
+        completed = False
+        while not self.completed_tasks.empty():
+            task, result = self.completed_tasks.get()
+            task, related_tasks, old_task_status, create_or_find = self.running_tasks.pop(self._get_task_id(task))
+            if isinstance(result, Exception):
+                result = self._set_task_failed(task, result)
+            self._complete_task(task, related_tasks, old_task_status, create_or_find, result)
+            completed = True
+        if completed:
+            blocked_tasks = self.blocked_tasks
+            self.blocked_tasks = []
+            for task in blocked_tasks:
+                if self._get_task_id(task) in self.tasks:
+                    self._schedule_task(task, task["modified_at"])
+
+    def _update_db(self, table, UPDATE, WHERE, modified_time=None, key=None, db_contents=()):
+        """
+        Annotate a database update to be written later by _flush_db_journal. Parameters are the same as
+        db_base.update_rows, plus:
+        :param key: updates with the same key are merged into the last one. None for an independent update
+        :param db_contents: list of (task, db_content) to be stored at task["db_content"] once the update is written
+        :return: None
+        """
+        if key is None:
+            key = next(self.db_journal_index)
+        update = self.db_journal.pop(key, None)
+        if update:
+            update["UPDATE"].update(UPDATE)
+            if modified_time != 0:
+                update["modified_time"] = modified_time
+        else:
+            update = {"table": table, "UPDATE": dict(UPDATE), "WHERE": WHERE, "modified_time": modified_time,
+                      "db_contents": []}
+        update["db_contents"].extend(db_contents)
+        self.db_journal[key] = update
+
+    def _flush_db_journal(self):
+        """
+        Write at database, in a single transaction, the updates annotated by _update_db. The journal is kept if the
+        write fails, so that it is retried at the next call
+        :return: True if written (or nothing to write), False if failed
+        """
+        if not self.db_journal:
+            return True
+        update_list = list(self.db_journal.values())
+        try:
+            self.db.update_rows_list(update_list)
+        except db_base_Exception as e:
+            self.logger.error("Error updating database, {} pending updates kept for retrying: {}".format(
+                len(update_list), e), exc_info=True)
+            return False
+        self.db_journal = OrderedDict()
+        completed_tasks = []
+        for update in update_list:
+            for task, db_content in update["db_contents"]:
+                if task["db_content"][0] == "SCHEDULED" and db_content[0] != "SCHEDULED":
+                    completed_tasks.append(self._get_task_id(task))
+                task["db_content"] = db_content
+        if completed_tasks and cross_thread_waits:
+            self._wake_cross_thread_dependents(completed_tasks)
+        return True
+
+    def _wait_cross_thread_dependency(self, task, dependency_id):
+        """
+        Annotate that a task waits for a task of other vim_thread. If that thread runs at this process, it wakes
+        this one when the dependency is completed, see _wake_cross_thread_dependents
+        :param task: SCHEDULED task of this thread
+        :param dependency_id: <instance_action_id>.<task_index> of the task that it depends on
+        :return: None
+        """
+        dependent_tasks = self.dependent_tasks.setdefault(dependency_id, [])
+        if task not in dependent_tasks:
+            dependent_tasks.append(task)
+        with cross_thread_waits_lock:
+            cross_thread_waits.setdefault(dependency_id, set()).add(self)
+
+    def _wake_cross_thread_dependents(self, task_ids):
+        """
+        Notify the other vim_threads waiting for these tasks, once their completion is written at database
+        :param task_ids: list of <instance_action_id>.<task_index> of the completed tasks
+        :return: None
+        """
+        with cross_thread_waits_lock:
+            waiting_threads = [(task_id, cross_thread_waits.pop(task_id)) for task_id in task_ids
+                               if task_id in cross_thread_waits]
+        for task_id, threads in waiting_threads:
+            for thread in threads:
+                try:
+                    thread.insert_task(("completed", task_id))
+                except vimconn.vimconnException as e:
+                    # the waiting task is checked again later, as scheduled by _proccess_pending_tasks
+                    self.logger.error("Cannot notify completed task {}: {}".format(task_id, e))
+
+    def _release_tasks(self):
+        """
+        Release the ownership of the tasks at database, so that they can be taken by other worker
+        :return: None
+        """
+        try:
+            self.db.update_rows("vim_wim_actions", UPDATE={"worker": None}, modified_time=0,
+                                WHERE={"datacenter_vim_id": self.datacenter_tenant_id, "worker": self.my_id})
+        except db_base_Exception as e:
+            self.logger.error("Cannot release tasks at database: {}".format(e))
 
     def _delete_task(self, task):
         """
@@ -296,51 +571,45 @@ class vim_thread(threading.Thread):
         if task["status"] == "FAILED":
             return   # TODO need to be retry??
         try:
-            # get all related tasks
-            related_tasks = self.db.get_rows(FROM="vim_wim_actions",
-                                             WHERE={"datacenter_vim_id": self.datacenter_tenant_id,
-                                                    "status": ['SCHEDULED', 'BUILD', 'DONE', 'FAILED'],
-                                                    "action": ["FIND", "CREATE"],
-                                                    "related": task["related"],
-                                                    },
-                                             ORDER_BY=("created_at",),
-                                             )
-            for related_task in related_tasks:
-                if related_task["item"] == task["item"] and related_task["item_id"] == task["item_id"]:
+            # look for the creation task and other related creation tasks
+            for related_task in self.related_tasks.get((task["item"], task["related"]), ()):
+                if related_task["action"] not in ("FIND", "CREATE"):
+                    continue
+                if related_task["item_id"] == task["item_id"]:
                     task_create = related_task
                     # TASK_CREATE
-                    if related_task["extra"]:
-                        extra_created = yaml.load(related_task["extra"])
-                        if extra_created.get("created"):
-                            deletion_needed = True
-                        related_task["extra"] = extra_created
+                    if related_task["extra"].get("created"):
+                        deletion_needed = True
                 elif not dependency_task:
                     dependency_task = related_task
                 if task_create and dependency_task:
                     break
+            if not task_create:
+                return
 
             # mark task_create as FINISHED
-            self.db.update_rows("vim_wim_actions", UPDATE={"status": "FINISHED"},
-                                WHERE={"datacenter_vim_id": self.datacenter_tenant_id,
-                                       "instance_action_id": task_create["instance_action_id"],
-                                       "task_index": task_create["task_index"]
-                                       })
+            task_create["status"] = "FINISHED"
+            self._remove_task(task_create)
+            self._update_db("vim_wim_actions", UPDATE={"status": "FINISHED"},
+                            WHERE={"datacenter_vim_id": self.datacenter_tenant_id,
+                                   "instance_action_id": task_create["instance_action_id"],
+                                   "task_index": task_create["task_index"]
+                                   },
+                            key=self._get_task_id(task_create))
             if not deletion_needed:
                 return
             elif dependency_task:
                 # move create information  from task_create to relate_task
-                extra_new_created = yaml.load(dependency_task["extra"]) or {}
-                extra_new_created["created"] = extra_created["created"]
-                copy_extra_created(copy_to=extra_new_created, copy_from=extra_created)
-
-                self.db.update_rows("vim_wim_actions",
-                                    UPDATE={"extra": yaml.safe_dump(extra_new_created, default_flow_style=True,
-                                                                    width=256),
-                                            "vim_id": task_create.get("vim_id")},
-                                    WHERE={"datacenter_vim_id": self.datacenter_tenant_id,
-                                           "instance_action_id": dependency_task["instance_action_id"],
-                                           "task_index": dependency_task["task_index"]
-                                           })
+                copy_extra_created(copy_to=dependency_task["extra"], copy_from=task_create["extra"])
+                dependency_task["vim_id"] = task_create.get("vim_id")
+                self._update_db("vim_wim_actions",
+                                UPDATE={"extra": action_extra.dumps(dependency_task["extra"]),
+                                        "vim_id": dependency_task["vim_id"]},
+                                WHERE={"datacenter_vim_id": self.datacenter_tenant_id,
+                                       "instance_action_id": dependency_task["instance_action_id"],
+                                       "task_index": dependency_task["task_index"]
+                                       },
+                                key=self._get_task_id(dependency_task))
                 return False
             else:
                 task["vim_id"] = task_create["vim_id"]
@@ -350,15 +619,54 @@ class vim_thread(threading.Thread):
         except Exception as e:
             self.logger.critical("Unexpected exception at _delete_task: " + str(e), exc_info=True)
 
+    def _get_refresh_vim_info(self, task):
+        """
+        Obtain the VIM status of the element (vm or net) of a refresh task. Instead of asking the VIM for this only
+        element, all the elements of the same type with a refresh due soon are requested in a single call. The
+        results are kept at self.refresh_cache to be consumed by the following refresh tasks
+        :param task: task with action CREATE or FIND and status BUILD or DONE
+        :return: the vim_info of the element, with the format of vimconnector.refresh_vms_status/refresh_nets_status
+            Raises vimconnException on VIM error
+        """
+        now = time.time()
+        item_cache = self.refresh_cache[task["item"]]
+        cached = item_cache.pop(task["vim_id"], None)
+        if cached and cached[0] > now - self.REFRESH_BUILD:
+            return cached[1]
+
+        if task["item"] == "instance_vms":
+            refresh_method = self.vim.refresh_vms_status
+        else:
+            refresh_method = self.vim.refresh_nets_status
+        vim_ids = [task["vim_id"]]
+        # add the elements of the same type scheduled to be refreshed soon
+        for process_time, _, task_id in self.schedule:
+            if len(vim_ids) >= self.REFRESH_BATCH:
+                break
+            if process_time > now + self.REFRESH_BUILD or self.scheduled_at.get(task_id) != process_time:
+                continue
+            due_task = self.tasks[task_id]
+            if due_task["item"] == task["item"] and due_task["action"] in ("CREATE", "FIND") and \
+                    due_task["status"] in ("BUILD", "DONE") and due_task["vim_id"] and \
+                    due_task["vim_id"] not in vim_ids:
+                vim_ids.append(due_task["vim_id"])
+
+        vim_dict = refresh_method(vim_ids)
+        # remove the entries that were never consumed, they are too old to be used
+        for vim_id, (cached_at, _) in item_cache.items():
+            if cached_at <= now - self.REFRESH_BUILD:
+                del item_cache[vim_id]
+        for vim_id, vim_info in vim_dict.items():
+            if vim_id != task["vim_id"]:
+                item_cache[vim_id] = (now, vim_info)
+        return vim_dict[task["vim_id"]]
+
     def _refres_vm(self, task):
         """Call VIM to get VMs status"""
         database_update = None
 
-        vim_id = task["vim_id"]
-        vm_to_refresh_list = [vim_id]
         try:
-            vim_dict = self.vim.refresh_vms_status(vm_to_refresh_list)
-            vim_info = vim_dict[vim_id]
+            vim_info = self._get_refresh_vim_info(task)
         except vimconn.vimconnException as e:
             # Mark all tasks at VIM_ERROR status
             self.logger.error("task=several get-VM: vimconnException when trying to refresh vms " + str(e))
@@ -414,16 +722,17 @@ class vim_thread(threading.Thread):
                         task_warning_msg += error_text
                         # TODO Set error_msg at instance_nets instead of instance VMs
 
-                self.db.update_rows('instance_interfaces',
-                                    UPDATE={"mac_address": interface.get("mac_address"),
-                                            "ip_address": interface.get("ip_address"),
-                                            "vim_interface_id": interface.get("vim_interface_id"),
-                                            "vim_info": interface.get("vim_info"),
-                                            "sdn_port_id": task_interface.get("sdn_port_id"),
-                                            "compute_node": interface.get("compute_node"),
-                                            "pci": interface.get("pci"),
-                                            "vlan": interface.get("vlan")},
-                                    WHERE={'uuid': task_interface["iface_id"]})
+                self._update_db('instance_interfaces',
+                                UPDATE={"mac_address": interface.get("mac_address"),
+                                        "ip_address": interface.get("ip_address"),
+                                        "vim_interface_id": interface.get("vim_interface_id"),
+                                        "vim_info": interface.get("vim_info"),
+                                        "sdn_port_id": task_interface.get("sdn_port_id"),
+                                        "compute_node": interface.get("compute_node"),
+                                        "pci": interface.get("pci"),
+                                        "vlan": interface.get("vlan")},
+                                WHERE={'uuid': task_interface["iface_id"]},
+                                key=('instance_interfaces', task_interface["iface_id"]))
                 task_interface["vim_info"] = interface
 
         # check and update task and instance_vms database
@@ -452,11 +761,8 @@ class vim_thread(threading.Thread):
         """Call VIM to get network status"""
         database_update = None
 
-        vim_id = task["vim_id"]
-        net_to_refresh_list = [vim_id]
         try:
-            vim_dict = self.vim.refresh_nets_status(net_to_refresh_list)
-            vim_info = vim_dict[vim_id]
+            vim_info = self._get_refresh_vim_info(task)
         except vimconn.vimconnException as e:
             # Mark all tasks at VIM_ERROR status
             self.logger.error("task=several get-net: vimconnException when trying to refresh nets " + str(e))
@@ -508,9 +814,19 @@ class vim_thread(threading.Thread):
         return database_update
 
     def _proccess_pending_tasks(self, task, related_tasks):
+        """
+        Process a task: creation, deletion or find at VIM of a SCHEDULED task, or refresh of a created one. A SCHEDULED
+        task waits until the tasks it depends on are completed. Dependencies of this thread and of other vim_threads of
+        this process release it as soon as they are completed; dependencies processed by other openmanod sharing the
+        database are only checked again 10 seconds after their modified_at
+        :param task: task to process
+        :param related_tasks: list of tasks of the same related group
+        :return: None
+        """
         old_task_status = task["status"]
         create_or_find = False   # if as result of processing this task something is created or found
         next_refresh = 0
+        vim_operation = None  # VIM creation, deletion or find, that can be executed in parallel by a task worker
 
         try:
             if task["status"] == "SCHEDULED":
@@ -540,12 +856,16 @@ class vim_thread(threading.Thread):
                     task["depends"]["TASK-"+str(task_index)] = task_dependency
                     task["depends"]["TASK-{}.{}".format(task["instance_action_id"], task_index)] = task_dependency
                 if dependency_not_completed:
-                    # Move this task to the time dependency is going to be modified plus 10 seconds.
-                    self.db.update_rows("vim_wim_actions", modified_time=dependency_modified_at + 10,
-                                        UPDATE={"worker": None},
-                                        WHERE={"datacenter_vim_id": self.datacenter_tenant_id, "worker": self.my_id,
-                                               "related": task["related"],
-                                               })
+                    dependency_id = self._get_task_id(task_dependency)
+                    if self.tasks.get(dependency_id) is task_dependency:
+                        # wait until the dependency is completed, see _release_dependent_tasks
+                        self.dependent_tasks.setdefault(dependency_id, []).append(task)
+                        return
+                    # Dependency processed by other thread. If it runs at this process it wakes this thread once
+                    # completed. Otherwise (other openmanod using the same database) this task is checked again at the
+                    # time dependency is going to be modified plus 10 seconds, that is also a safeguard for the former
+                    self._wait_cross_thread_dependency(task, dependency_id)
+                    self._schedule_task(task, max(dependency_modified_at + 10, time.time() + self.REFRESH_BUILD))
                     # task["extra"]["tries"] = task["extra"].get("tries", 0) + 1
                     # if task["extra"]["tries"] > 3:
                     #     raise VimThreadException(
@@ -555,6 +875,7 @@ class vim_thread(threading.Thread):
                     #                               task_dependency["instance_action_id"], task_dependency["task_index"]
                     #                               task_dependency["action"], task_dependency["item"]))
                     return
+                task["started_at"] = time.time()
 
             database_update = None
             if task["action"] == "DELETE":
@@ -575,8 +896,7 @@ class vim_thread(threading.Thread):
                 task["status"] = related_tasks[0]["status"]
                 task["error_msg"] = related_tasks[0]["error_msg"]
                 task["vim_id"] = related_tasks[0]["vim_id"]
-                extra = yaml.load(related_tasks[0]["extra"])
-                task["extra"]["vim_status"] = extra["vim_status"]
+                task["extra"]["vim_status"] = related_tasks[0]["extra"].get("vim_status")
                 next_refresh = related_tasks[0]["modified_at"] + 0.001
                 database_update = {"status": task["extra"].get("vim_status", "VIM_ERROR"),
                                    "error_msg": task["error_msg"]}
@@ -590,9 +910,9 @@ class vim_thread(threading.Thread):
                     create_or_find = True
                 elif task["action"] == "CREATE":
                     create_or_find = True
-                    database_update = self.new_vm(task)
+                    vim_operation = self.new_vm
                 elif task["action"] == "DELETE":
-                    self.del_vm(task)
+                    vim_operation = self.del_vm
                 else:
                     raise vimconn.vimconnException(self.name + "unknown task action {}".format(task["action"]))
             elif task["item"] == 'instance_nets':
@@ -601,79 +921,126 @@ class vim_thread(threading.Thread):
                     create_or_find = True
                 elif task["action"] == "CREATE":
                     create_or_find = True
-                    database_update = self.new_net(task)
+                    vim_operation = self.new_net
                 elif task["action"] == "DELETE":
-                    self.del_net(task)
+                    vim_operation = self.del_net
                 elif task["action"] == "FIND":
-                    database_update = self.get_net(task)
+                    vim_operation = self.get_net
                 else:
                     raise vimconn.vimconnException(self.name + "unknown task action {}".format(task["action"]))
             elif task["item"] == 'instance_sfis':
                 if task["action"] == "CREATE":
                     create_or_find = True
-                    database_update = self.new_sfi(task)
+                    vim_operation = self.new_sfi
                 elif task["action"] == "DELETE":
-                    self.del_sfi(task)
+                    vim_operation = self.del_sfi
                 else:
                     raise vimconn.vimconnException(self.name + "unknown task action {}".format(task["action"]))
             elif task["item"] == 'instance_sfs':
                 if task["action"] == "CREATE":
                     create_or_find = True
-                    database_update = self.new_sf(task)
+                    vim_operation = self.new_sf
                 elif task["action"] == "DELETE":
-                    self.del_sf(task)
+                    vim_operation = self.del_sf
                 else:
                     raise vimconn.vimconnException(self.name + "unknown task action {}".format(task["action"]))
             elif task["item"] == 'instance_classifications':
                 if task["action"] == "CREATE":
                     create_or_find = True
-                    database_update = self.new_classification(task)
+                    vim_operation = self.new_classification
                 elif task["action"] == "DELETE":
-                    self.del_classification(task)
+                    vim_operation = self.del_classification
                 else:
                     raise vimconn.vimconnException(self.name + "unknown task action {}".format(task["action"]))
             elif task["item"] == 'instance_sfps':
                 if task["action"] == "CREATE":
                     create_or_find = True
-                    database_update = self.new_sfp(task)
+                    vim_operation = self.new_sfp
                 elif task["action"] == "DELETE":
-                    self.del_sfp(task)
+                    vim_operation = self.del_sfp
                 else:
                     raise vimconn.vimconnException(self.name + "unknown task action {}".format(task["action"]))
             else:
                 raise vimconn.vimconnException(self.name + "unknown task item {}".format(task["item"]))
                 # TODO
+            if vim_operation:
+                if self.task_workers:
+                    # executed in parallel by a task worker. It is completed later by _process_completed_tasks
+                    self.running_tasks[self._get_task_id(task)] = (task, related_tasks, old_task_status,
+                                                                   create_or_find)
+                    self.worker_queue.put((vim_operation, task))
+                    return
+                database_update = vim_operation(task)
         except VimThreadException as e:
-            task["error_msg"] = str(e)
-            task["status"] = "FAILED"
-            database_update = {"status": "VIM_ERROR", "error_msg": task["error_msg"]}
-            if task["item"] == 'instance_vms':
-                database_update["vim_vm_id"] = None
-            elif task["item"] == 'instance_nets':
-                database_update["vim_net_id"] = None
+            database_update = self._set_task_failed(task, e)
+        self._complete_task(task, related_tasks, old_task_status, create_or_find, database_update, next_refresh)
+
+    def _set_task_failed(self, task, error):
+        """
+        Mark a task as FAILED because of an error
+        :return: the content to update the instance_XXX database table
+        """
+        task["error_msg"] = str(error)
+        task["status"] = "FAILED"
+        database_update = {"status": "VIM_ERROR", "error_msg": task["error_msg"]}
+        if task["item"] == 'instance_vms':
+            database_update["vim_vm_id"] = None
+        elif task["item"] == 'instance_nets':
+            database_update["vim_net_id"] = None
+        return database_update
 
+    def _complete_task(self, task, related_tasks, old_task_status, create_or_find, database_update, next_refresh=0):
+        """
+        Schedule the next processing of a task, and annotate the database changes, after the task has been processed
+        :param task: processed task
+        :param related_tasks: list of tasks of the same related group
+        :param old_task_status: status of the task before processing it
+        :param create_or_find: True if as result of processing this task something is created or found
+        :param database_update: content to update the instance_XXX database table
+        :param next_refresh: time to process the task again. If 0 it is computed from the status
+        :return: None
+        """
         task_id = task["instance_action_id"] + "." + str(task["task_index"])
         self.logger.debug("task={} item={} action={} result={}:'{}' params={}".format(
             task_id, task["item"], task["action"], task["status"],
             task["vim_id"] if task["status"] == "DONE" else task.get("error_msg"), task["params"]))
-        try:
-            if not next_refresh:
-                if task["status"] == "DONE":
-                    next_refresh = time.time()
-                    if task["extra"].get("vim_status") == "BUILD":
-                        next_refresh += self.REFRESH_BUILD
-                    elif task["extra"].get("vim_status") in ("ERROR", "VIM_ERROR"):
-                        next_refresh += self.REFRESH_ERROR
-                    elif task["extra"].get("vim_status") == "DELETED":
-                        next_refresh += self.REFRESH_DELETE
-                    else:
-                        next_refresh += self.REFRESH_ACTIVE
-                elif task["status"] == "FAILED":
-                    next_refresh = time.time() + self.REFRESH_DELETE
-
-            if create_or_find:
-                # modify all related task with action FIND/CREATED non SCHEDULED
-                self.db.update_rows(
+        if old_task_status == "SCHEDULED" and task["status"] != old_task_status:
+            dependencies_time = max([dependency["extra"].get("critical_path") or 0
+                                     for dependency in task["depends"].values()] or [0])
+            task["extra"]["critical_path"] = round(time.time() - task.pop("started_at", time.time()) +
+                                                   dependencies_time, 3)
+            self._release_dependent_tasks(task_id)
+        if not next_refresh:
+            if task["status"] == "DONE":
+                next_refresh = time.time()
+                if task["extra"].get("vim_status") == "BUILD":
+                    next_refresh += self.REFRESH_BUILD
+                elif task["extra"].get("vim_status") in ("ERROR", "VIM_ERROR"):
+                    next_refresh += self.REFRESH_ERROR
+                elif task["extra"].get("vim_status") == "DELETED":
+                    next_refresh += self.REFRESH_DELETE
+                else:
+                    next_refresh += self.REFRESH_ACTIVE
+            elif task["status"] == "FAILED":
+                next_refresh = time.time() + self.REFRESH_DELETE
+
+        if create_or_find:
+            # modify all related task with action FIND/CREATED non SCHEDULED
+            related_changed = False
+            related_contents = []  # stored at related_task["db_content"] once written at database
+            for related_task in related_tasks:
+                if related_task is not task and related_task["action"] in ("FIND", "CREATE") and \
+                        related_task["status"] != "SCHEDULED":
+                    if related_task["db_content"][:3] != (task["status"], task.get("vim_id"), task["error_msg"]):
+                        related_changed = True
+                    related_task["status"] = task["status"]
+                    related_task["vim_id"] = task.get("vim_id")
+                    related_task["error_msg"] = task["error_msg"]
+                    related_contents.append((related_task, (task["status"], task.get("vim_id"), task["error_msg"],
+                                                            related_task["db_content"][3])))
+                    self._schedule_task(related_task, next_refresh + 0.001)
+            if related_changed:
+                self._update_db(
                     table="vim_wim_actions", modified_time=next_refresh + 0.001,
                     UPDATE={"status": task["status"], "vim_id": task.get("vim_id"),
                             "error_msg": task["error_msg"],
@@ -684,46 +1051,76 @@ class vim_thread(threading.Thread):
                            "action": ["FIND", "CREATE"],
                            "related": task["related"],
                            "status<>": "SCHEDULED",
-                           })
-            # modify own task
-            self.db.update_rows(
+                           },
+                    key=("related", task["item"], task["related"]), db_contents=related_contents)
+        # modify own task. Not written at database if only the refresh time has changed
+        if task["status"] in ("FINISHED", "SUPERSEDED"):
+            self._remove_task(task)
+        else:
+            self._schedule_task(task, next_refresh)
+        extra = action_extra.dumps(task["extra"])
+        db_content = (task["status"], task.get("vim_id"), task["error_msg"], extra)
+        if db_content != task["db_content"]:
+            # task["db_content"] is updated once written, so that it is annotated again while the write fails
+            self._update_db(
                 table="vim_wim_actions", modified_time=next_refresh,
                 UPDATE={"status": task["status"], "vim_id": task.get("vim_id"),
-                        "error_msg": task["error_msg"],
-                        "extra": yaml.safe_dump(task["extra"], default_flow_style=True, width=256)},
-                WHERE={"instance_action_id": task["instance_action_id"], "task_index": task["task_index"]})
-            # Unlock tasks
-            self.db.update_rows(
-                table="vim_wim_actions", modified_time=0,
-                UPDATE={"worker": None},
-                WHERE={"datacenter_vim_id": self.datacenter_tenant_id,
-                       "worker": self.my_id,
-                       "related": task["related"],
-                       })
-
-            # Update table instance_actions
-            if old_task_status == "SCHEDULED" and task["status"] != old_task_status:
-                self.db.update_rows(
-                    table="instance_actions",
-                    UPDATE={("number_failed" if task["status"] == "FAILED" else "number_done"): {"INCREMENT": 1}},
-                    WHERE={"uuid": task["instance_action_id"]})
-            if database_update:
-                where_filter = {"related": task["related"]}
-                if task["item"] == "instance_nets" and task["datacenter_vim_id"]:
-                    where_filter["datacenter_tenant_id"] = task["datacenter_vim_id"] 
-                self.db.update_rows(table=task["item"],
-                                    UPDATE=database_update,
-                                    WHERE=where_filter)
-        except db_base_Exception as e:
-            self.logger.error("task={} Error updating database {}".format(task_id, e), exc_info=True)
+                        "error_msg": task["error_msg"], "extra": extra},
+                WHERE={"instance_action_id": task["instance_action_id"], "task_index": task["task_index"]},
+                key=task_id, db_contents=((task, db_content),))
+
+        # Update table instance_actions
+        if old_task_status == "SCHEDULED" and task["status"] != old_task_status:
+            self._update_db(
+                table="instance_actions",
+                UPDATE={("number_failed" if task["status"] == "FAILED" else "number_done"): {"INCREMENT": 1}},
+                WHERE={"uuid": task["instance_action_id"]})
+        if database_update:
+            where_filter = {"related": task["related"]}
+            if task["item"] == "instance_nets" and task["datacenter_vim_id"]:
+                where_filter["datacenter_tenant_id"] = task["datacenter_vim_id"]
+            self._update_db(table=task["item"],
+                            UPDATE=database_update,
+                            WHERE=where_filter,
+                            key=(task["item"], task["related"], where_filter.get("datacenter_tenant_id")))
 
     def insert_task(self, task):
+        """
+        Send a message to the thread. It is also used by nfvo to notify that new tasks has been inserted at database,
+        and by other vim_threads to notify that a task this thread waits for has been completed
+        :param task: "exit", "reload", the list of new vim_wim_actions inserted at database or
+            ("completed", <instance_action_id>.<task_index>)
+        :return: None
+        """
+        if self.pid != os.getpid():
+            # called at a forked http worker process, where this thread is not running
+            if isinstance(task, list):
+                # only the fields read by the thread are sent
+                task = [{"instance_action_id": new_task["instance_action_id"],
+                         "datacenter_vim_id": new_task.get("datacenter_vim_id")} for new_task in task]
+            task_relay.send("vim", self.datacenter_tenant_id, task)
+            return None
         try:
             self.task_queue.put(task, False)
+            self.task_event.set()
             return None
         except Queue.Full:
             raise vimconn.vimconnException(self.name + ": timeout inserting a task")
 
+    def _wait_for_tasks(self, waiting_time=None):
+        """
+        Sleep until a message is inserted with insert_task, or until the next pending task must be processed.
+        The sleep time is limited by MAX_WAITING_TIME
+        :param waiting_time: time to sleep instead of the time to the next task
+        :return: None
+        """
+        if waiting_time is None:
+            waiting_time = self.MAX_WAITING_TIME
+            if self.schedule:
+                waiting_time = max(0, min(self.schedule[0][0] - time.time(), waiting_time))
+        self.task_event.wait(waiting_time)
+        self.task_event.clear()
+
     def del_task(self, task):
         with self.task_lock:
             if task["status"] == "SCHEDULED":
@@ -738,29 +1135,52 @@ class vim_thread(threading.Thread):
         while True:
             self.get_vimconnector()
             self.logger.debug("Vimconnector loaded")
+            self._start_task_workers()
             reload_thread = False
+            self.load_all_tasks = True
 
             while True:
                 try:
                     while not self.task_queue.empty():
                         task = self.task_queue.get()
                         if isinstance(task, list):
-                            pass
+                            # notification of new tasks inserted at database. They are read by _load_tasks
+                            self.load_instance_actions.update(
+                                new_task["instance_action_id"] for new_task in task
+                                if new_task.get("datacenter_vim_id") == self.datacenter_tenant_id)
+                        elif isinstance(task, tuple) and task[0] == "completed":
+                            # task of other vim_thread completed, see _wake_cross_thread_dependents
+                            self._release_dependent_tasks(task[1])
                         elif isinstance(task, str):
                             if task == 'exit':
+                                self._stop_task_workers()
+                                self._flush_db_journal()
+                                self._release_tasks()
                                 return 0
                             elif task == 'reload':
                                 reload_thread = True
                                 break
                         self.task_queue.task_done()
                     if reload_thread:
+                        self._stop_task_workers()
+                        self._flush_db_journal()
                         break
 
-                    task, related_tasks = self._get_db_task()
+                    self._process_completed_tasks()
+
+                    if not self._load_tasks():
+                        self._wait_for_tasks(self.RETRY_DATABASE)
+                        continue
+                    task, related_tasks = self._get_next_task()
                     if task:
+                        # write pending changes before a creation or deletion, that can take long at VIM
+                        if task["status"] == "SCHEDULED" or len(self.db_journal) >= self.DATABASE_BATCH:
+                            self._flush_db_journal()
                         self._proccess_pending_tasks(task, related_tasks)
+                    elif not self._flush_db_journal():
+                        self._wait_for_tasks(self.RETRY_DATABASE)
                     else:
-                        time.sleep(5)
+                        self._wait_for_tasks()
 
                 except Exception as e:
                     self.logger.critical("Unexpected exception at run: " + str(e), exc_info=True)
@@ -769,7 +1189,7 @@ class vim_thread(threading.Thread):
 
     def _look_for_task(self, instance_action_id, task_id):
         """
-        Look for a concrete task at vim_actions database table
+        Look for a concrete task at memory or at vim_actions database table
         :param instance_action_id: The instance_action_id
         :param task_id: Can have several formats:
             <task index>: integer
@@ -777,15 +1197,12 @@ class vim_thread(threading.Thread):
             [TASK-]<instance_action_id>.<task index>: this instance_action_id overrides the one in the parameter
         :return: Task dictionary or None if not found
         """
-        if isinstance(task_id, int):
-            task_index = task_id
-        else:
-            if task_id.startswith("TASK-"):
-                task_id = task_id[5:]
-            ins_action_id, _, task_index = task_id.rpartition(".")
-            if ins_action_id:
-                instance_action_id = ins_action_id
-
+        task_id = self._get_dependency_id(instance_action_id, task_id)
+        task = self.tasks.get(task_id)
+        if task:
+            return task
+        instance_action_id, _, task_index = task_id.rpartition(".")
+        # task of other VIM, or not pending anymore
         tasks = self.db.get_rows(FROM="vim_wim_actions", WHERE={"instance_action_id": instance_action_id,
                                                                 "task_index": task_index})
         if not tasks:
@@ -793,14 +1210,25 @@ class vim_thread(threading.Thread):
         task = tasks[0]
         task["params"] = None
         task["depends"] = {}
-        if task["extra"]:
-            extra = yaml.load(task["extra"])
-            task["extra"] = extra
-            task["params"] = extra.get("params")
-        else:
-            task["extra"] = {}
+        task["extra"] = action_extra.loads(task["extra"]) or {}
+        task["params"] = task["extra"].get("params")
         return task
 
+    @staticmethod
+    def _get_dependency_id(instance_action_id, task_id):
+        """
+        Get the <instance_action_id>.<task_index> identifier of a task referenced at depends_on
+        :param instance_action_id: The instance_action_id of the task that depends on
+        :param task_id: Any format allowed at _look_for_task
+        :return: the task identifier, as used at self.tasks
+        """
+        if isinstance(task_id, int):
+            return "{}.{}".format(instance_action_id, task_id)
+        if task_id.startswith("TASK-"):
+            task_id = task_id[5:]
+        ins_action_id, _, task_index = task_id.rpartition(".")
+        return "{}.{}".format(ins_action_id or instance_action_id, task_index)
+
     @staticmethod
     def _format_vim_error_msg(error_text, max_length=1024):
         if error_text and len(error_text) >= max_length:
@@ -44,6 +44,9 @@ import yaml
 import random
 import re
 import copy
+import bisect
+import itertools
+import threading
 from pprint import pformat
 from types import StringTypes
 
@@ -78,6 +81,12 @@ supportedClassificationTypes = ['legacy_flow_classifier']
 #global var to have a timeout creating and deleting volumes
 volume_timeout = 600
 server_timeout = 600
+# the image index is refreshed with the images changed since the last refresh after this time, and fully reloaded (to
+# detect images deleted by others) after image_index_reload_time. Can be changed with the same vim config names
+image_index_time = 300
+image_index_reload_time = 3600
+# the flavor catalog is refreshed in background after this time. Can be changed with the same vim config name
+flavor_catalog_time = 300
 
 
 class SafeDumper(yaml.SafeDumper):
@@ -92,6 +101,8 @@ class SafeDumper(yaml.SafeDumper):
 
 
 class vimconnector(vimconn.vimconnector):
+    REFRESH_VMS_GET_LIMIT = 10  # refresh_vms_status gets the VMs one by one up to this number, else lists all servers
+
     def __init__(self, uuid, name, tenant_id, tenant_name, url, url_admin=None, user=None, passwd=None,
                  log_level=None, config={}, persistent_info={}):
         '''using common constructor parameters. In this case
@@ -683,11 +694,33 @@ class vimconnector(vimconn.vimconnector):
                 subnet = {"id": subnet_id, "fault": str(e)}
             subnets.append(subnet)
         net["subnets"] = subnets
+        self._fill_net_encapsulation(net)
+        return net
+
+    @staticmethod
+    def _fill_net_encapsulation(net):
+        '''Add the encapsulation information of an openstack network with the mano field names'''
         net["encapsulation"] = net.get('provider:network_type')
         net["encapsulation_type"] = net.get('provider:network_type')
         net["segmentation_id"] = net.get('provider:segmentation_id')
         net["encapsulation_id"] = net.get('provider:segmentation_id')
-        return net
+
+    @staticmethod
+    def _list_by_ids(list_method, key, filter_name, values, chunk_size=100):
+        '''Call a neutron list method filtering by several values of the same field. Neutron accepts the same filter
+        repeated in the query string, so a single request is done for each chunk of values (the chunks keep the URL
+        length under control).
+        :param list_method: neutron client method, e.g. self.neutron.list_ports
+        :param key: key of the response that contains the list, e.g. "ports"
+        :param filter_name: field used for filtering, e.g. "device_id"
+        :param values: iterable with the values to filter by
+        :return: list with the concatenated content of all the responses
+        '''
+        values = list(values)
+        result = []
+        for index in range(0, len(values), chunk_size):
+            result += list_method(**{filter_name: values[index:index + chunk_size]})[key]
+        return result
 
     def delete_network(self, net_id, created_items=None):
         """
@@ -739,34 +772,61 @@ class vimconnector(vimconn.vimconnector):
                                 #
                     error_msg:  #Text with VIM error message, if any. Or the VIM connection ERROR
                     vim_info:   #Text with plain information obtained from vim (yaml.safe_dump)
-
+           All the networks and their subnets are obtained with one request each, regardless the length of net_list
         '''
         net_dict={}
+        try:
+            self._reload_connection()
+            net_vim_list = self._list_by_ids(self.neutron.list_networks, "networks", "id", net_list)
+            subnet_ids = set()
+            for net_vim in net_vim_list:
+                subnet_ids.update(net_vim.get("subnets", ()))
+            subnet_list = self._list_by_ids(self.neutron.list_subnets, "subnets", "id", subnet_ids)
+        except (neExceptions.ConnectionFailed, ksExceptions.ClientException, neExceptions.NeutronException,
+                ConnectionError) as e:
+            try:
+                self._format_exception(e)
+            except vimconn.vimconnException as e:
+                self.logger.error("Exception getting net status: %s", str(e))
+                for net_id in net_list:
+                    net_dict[net_id] = {"status": "VIM_ERROR", "error_msg": str(e)}
+                return net_dict
+
+        self.__net_os2mano(net_vim_list)
+        net_vim_by_id = {net_vim["id"]: net_vim for net_vim in net_vim_list}
+        subnet_by_id = {subnet["id"]: subnet for subnet in subnet_list}
         for net_id in net_list:
             net = {}
-            try:
-                net_vim = self.get_network(net_id)
-                if net_vim['status'] in netStatus2manoFormat:
-                    net["status"] = netStatus2manoFormat[ net_vim['status'] ]
+            net_vim = net_vim_by_id.get(net_id)
+            if not net_vim:
+                error_text = "Network '{}' not found".format(net_id)
+                self.logger.error("Exception getting net status: %s", error_text)
+                net['status'] = "DELETED"
+                net['error_msg'] = error_text
+                net_dict[net_id] = net
+                continue
+            subnets = []
+            for subnet_id in net_vim.get("subnets", ()):
+                if subnet_id in subnet_by_id:
+                    subnets.append({"subnet": subnet_by_id[subnet_id]})
                 else:
-                    net["status"] = "OTHER"
-                    net["error_msg"] = "VIM status reported " + net_vim['status']
+                    subnets.append({"id": subnet_id, "fault": "Subnet '{}' not found".format(subnet_id)})
+            net_vim["subnets"] = subnets
+            self._fill_net_encapsulation(net_vim)
 
-                if net['status'] == "ACTIVE" and not net_vim['admin_state_up']:
-                    net['status'] = 'DOWN'
+            if net_vim['status'] in netStatus2manoFormat:
+                net["status"] = netStatus2manoFormat[ net_vim['status'] ]
+            else:
+                net["status"] = "OTHER"
+                net["error_msg"] = "VIM status reported " + net_vim['status']
 
-                net['vim_info'] = self.serialize(net_vim)
+            if net['status'] == "ACTIVE" and not net_vim['admin_state_up']:
+                net['status'] = 'DOWN'
 
-                if net_vim.get('fault'):  #TODO
-                    net['error_msg'] = str(net_vim['fault'])
-            except vimconn.vimconnNotFoundException as e:
-                self.logger.error("Exception getting net status: %s", str(e))
-                net['status'] = "DELETED"
-                net['error_msg'] = str(e)
-            except vimconn.vimconnException as e:
-                self.logger.error("Exception getting net status: %s", str(e))
-                net['status'] = "VIM_ERROR"
-                net['error_msg'] = str(e)
+            net['vim_info'] = self.serialize(net_vim)
+
+            if net_vim.get('fault'):  #TODO
+                net['error_msg'] = str(net_vim['fault'])
             net_dict[net_id] = net
         return net_dict
 
@@ -781,6 +841,65 @@ class vimconnector(vimconn.vimconnector):
         except (nvExceptions.NotFound, nvExceptions.ClientException, ksExceptions.ClientException, ConnectionError) as e:
             self._format_exception(e)
 
+    @staticmethod
+    def _flavor_epa_key(extra_specs):
+        """Normalized and hashable content of the flavor extra_specs, used for grouping flavors with the same EPA"""
+        return tuple(sorted((str(k), str(v)) for k, v in extra_specs.items()))
+
+    @staticmethod
+    def _build_flavor_catalog(flavors, loaded_at=None):
+        """Compose the flavor catalog from a dictionary with flavor id: (ram, vcpus, disk, epa_key)
+        :return: dictionary with "flavors", the loading time and "index": {epa_key: sorted list of (ram, vcpus, disk,
+            flavor_id)}, that allows searching flavors of the same EPA with bisect
+        """
+        index = {}
+        for flavor_id, (ram, vcpus, disk, epa_key) in flavors.items():
+            index.setdefault(epa_key, []).append((ram, vcpus, disk, flavor_id))
+        for flavor_list in index.values():
+            flavor_list.sort()
+        return {"flavors": flavors, "index": index, "loaded_at": loaded_at or time.time(), "refreshing": False}
+
+    def _load_flavor_catalog(self, catalog=None):
+        """Obtain the flavors from nova. extra_specs are only requested for the flavors not present at the old catalog
+        :param catalog: old catalog, if any
+        :return: the new catalog
+        """
+        old_flavors = catalog["flavors"] if catalog else {}
+        flavors = {}
+        for flavor in self.nova.flavors.list():
+            flavor_data = (flavor.ram, flavor.vcpus, flavor.disk)
+            if flavor.id in old_flavors and old_flavors[flavor.id][:3] == flavor_data:
+                flavors[flavor.id] = old_flavors[flavor.id]
+            else:
+                flavors[flavor.id] = flavor_data + (self._flavor_epa_key(flavor.get_keys()), )
+        self.logger.debug("Loaded flavor catalog with %d flavors", len(flavors))
+        return self._build_flavor_catalog(flavors)
+
+    def _refresh_flavor_catalog(self, catalog):
+        try:
+            self.persistent_info["flavor_catalog"] = self._load_flavor_catalog(catalog)
+        except Exception as e:
+            self.logger.error("Cannot refresh flavor catalog: %s", e)
+            catalog["loaded_at"] = time.time()  # try again later
+        finally:
+            catalog["refreshing"] = False
+
+    def _get_flavor_catalog(self):
+        """Return the flavor catalog kept at persistent_info, so that it is shared by the connectors of the same vim
+        account. It is loaded the first time, and after flavor_catalog_time it is refreshed by a background thread
+        while the current one is still used"""
+        catalog = self.persistent_info.get("flavor_catalog")
+        if not catalog:
+            catalog = self.persistent_info["flavor_catalog"] = self._load_flavor_catalog()
+        elif not catalog["refreshing"] and \
+                time.time() - catalog["loaded_at"] > self.config.get("flavor_catalog_time", flavor_catalog_time):
+            catalog["refreshing"] = True
+            refresh_thread = threading.Thread(target=self._refresh_flavor_catalog, args=(catalog, ),
+                                              name="flavor_catalog_" + str(self.id))
+            refresh_thread.daemon = True
+            refresh_thread.start()
+        return catalog
+
     def get_flavor_id_from_data(self, flavor_dict):
         """Obtain flavor id that match the flavor description
            Returns the flavor_id or raises a vimconnNotFoundException
@@ -788,35 +907,23 @@ class vimconnector(vimconn.vimconnector):
            If 'use_existing_flavors' is set to True at config, the closer flavor that provides same or more ram, vcpus
                 and disk is returned. Otherwise a flavor with exactly same ram, vcpus and disk is returned or a
                 vimconnNotFoundException is raised
+           Only flavors with the same extra_specs that new_flavor would create for the 'extended' (EPA) content are
+                considered
         """
         exact_match = False if self.config.get('use_existing_flavors') else True
         try:
             self._reload_connection()
-            flavor_candidate_id = None
-            flavor_candidate_data = (10000, 10000, 10000)
-            flavor_target = (flavor_dict["ram"], flavor_dict["vcpus"], flavor_dict["disk"])
-            # numa=None
-            extended = flavor_dict.get("extended", {})
-            if extended:
-                #TODO
-                raise vimconn.vimconnNotFoundException("Flavor with EPA still not implemted")
-                # if len(numas) > 1:
-                #     raise vimconn.vimconnNotFoundException("Cannot find any flavor with more than one numa")
-                # numa=numas[0]
-                # numas = extended.get("numas")
-            for flavor in self.nova.flavors.list():
-                epa = flavor.get_keys()
-                if epa:
-                    continue
-                    # TODO
-                flavor_data = (flavor.ram, flavor.vcpus, flavor.disk)
-                if flavor_data == flavor_target:
-                    return flavor.id
-                elif not exact_match and flavor_target < flavor_data < flavor_candidate_data:
-                    flavor_candidate_id = flavor.id
-                    flavor_candidate_data = flavor_data
-            if not exact_match and flavor_candidate_id:
-                return flavor_candidate_id
+            ram, vcpus, extra_specs = self._get_flavor_extra_specs(flavor_dict)
+            flavor_target = (ram, vcpus, flavor_dict["disk"])
+            flavor_list = self._get_flavor_catalog()["index"].get(self._flavor_epa_key(extra_specs), ())
+            # flavor_list is sorted by (ram, vcpus, disk). Look for the first one equal or greater than the target
+            position = bisect.bisect_left(flavor_list, flavor_target)
+            if position < len(flavor_list) and flavor_list[position][:3] == flavor_target:
+                return flavor_list[position][3]
+            if not exact_match:
+                for flavor_ram, flavor_vcpus, flavor_disk, flavor_id in itertools.islice(flavor_list, position, None):
+                    if flavor_vcpus >= flavor_target[1] and flavor_disk >= flavor_target[2]:
+                        return flavor_id
             raise vimconn.vimconnNotFoundException("Cannot find any flavor matching '{}'".format(str(flavor_dict)))
         except (nvExceptions.NotFound, nvExceptions.ClientException, ksExceptions.ClientException, ConnectionError) as e:
             self._format_exception(e)
@@ -860,58 +967,7 @@ class vimconnector(vimconn.vimconnector):
                             name_suffix += 1
                             name = flavor_data['name']+"-" + str(name_suffix)
 
-                    ram = flavor_data.get('ram',64)
-                    vcpus = flavor_data.get('vcpus',1)
-                    extra_specs={}
-
-                    extended = flavor_data.get("extended")
-                    if extended:
-                        numas=extended.get("numas")
-                        if numas:
-                            numa_nodes = len(numas)
-                            if numa_nodes > 1:
-                                return -1, "Can not add flavor with more than one numa"
-                            extra_specs["hw:numa_nodes"] = str(numa_nodes)
-                            extra_specs["hw:mem_page_size"] = "large"
-                            extra_specs["hw:cpu_policy"] = "dedicated"
-                            extra_specs["hw:numa_mempolicy"] = "strict"
-                            if self.vim_type == "VIO":
-                                extra_specs["vmware:extra_config"] = '{"numa.nodeAffinity":"0"}'
-                                extra_specs["vmware:latency_sensitivity_level"] = "high"
-                            for numa in numas:
-                                #overwrite ram and vcpus
-                                #check if key 'memory' is present in numa else use ram value at flavor
-                                if 'memory' in numa:
-                                    ram = numa['memory']*1024
-                                #See for reference: https://specs.openstack.org/openstack/nova-specs/specs/mitaka/implemented/virt-driver-cpu-thread-pinning.html
-                                extra_specs["hw:cpu_sockets"] = 1
-                                if 'paired-threads' in numa:
-                                    vcpus = numa['paired-threads']*2
-                                    #cpu_thread_policy "require" implies that the compute node must have an STM architecture
-                                    extra_specs["hw:cpu_thread_policy"] = "require"
-                                    extra_specs["hw:cpu_policy"] = "dedicated"
-                                elif 'cores' in numa:
-                                    vcpus = numa['cores']
-                                    # cpu_thread_policy "prefer" implies that the host must not have an SMT architecture, or a non-SMT architecture will be emulated
-                                    extra_specs["hw:cpu_thread_policy"] = "isolate"
-                                    extra_specs["hw:cpu_policy"] = "dedicated"
-                                elif 'threads' in numa:
-                                    vcpus = numa['threads']
-                                    # cpu_thread_policy "prefer" implies that the host may or may not have an SMT architecture
-                                    extra_specs["hw:cpu_thread_policy"] = "prefer"
-                                    extra_specs["hw:cpu_policy"] = "dedicated"
-                                # for interface in numa.get("interfaces",() ):
-                                #     if interface["dedicated"]=="yes":
-                                #         raise vimconn.vimconnException("Passthrough interfaces are not supported for the openstack connector", http_code=vimconn.HTTP_Service_Unavailable)
-                                #     #TODO, add the key 'pci_passthrough:alias"="<label at config>:<number ifaces>"' when a way to connect it is available
-                        elif extended.get("cpu-quota"):
-                            self.process_resource_quota(extended.get("cpu-quota"), "cpu", extra_specs)
-                        if extended.get("mem-quota"):
-                            self.process_resource_quota(extended.get("mem-quota"), "memory", extra_specs)
-                        if extended.get("vif-quota"):
-                            self.process_resource_quota(extended.get("vif-quota"), "vif", extra_specs)
-                        if extended.get("disk-io-quota"):
-                            self.process_resource_quota(extended.get("disk-io-quota"), "disk_io", extra_specs)
+                    ram, vcpus, extra_specs = self._get_flavor_extra_specs(flavor_data)
                     #create flavor
                     new_flavor=self.nova.flavors.create(name,
                                     ram,
@@ -922,6 +978,12 @@ class vimconnector(vimconn.vimconnector):
                     #add metadata
                     if extra_specs:
                         new_flavor.set_keys(extra_specs)
+                    catalog = self.persistent_info.get("flavor_catalog")
+                    if catalog:
+                        epa_key = self._flavor_epa_key(extra_specs)
+                        catalog["flavors"][new_flavor.id] = (ram, vcpus, flavor_data.get('disk', 0), epa_key)
+                        bisect.insort(catalog["index"].setdefault(epa_key, []),
+                                      (ram, vcpus, flavor_data.get('disk', 0), new_flavor.id))
                     return new_flavor.id
                 except nvExceptions.Conflict as e:
                     if change_name_if_used and retry < max_retries:
@@ -931,17 +993,145 @@ class vimconnector(vimconn.vimconnector):
         except (ksExceptions.ClientException, nvExceptions.ClientException, ConnectionError, KeyError) as e:
             self._format_exception(e)
 
+    def _get_flavor_extra_specs(self, flavor_data):
+        """Compose the ram, vcpus and extra_specs of a flavor from its descriptor, where the 'extended' (EPA) content
+        can modify the ram and vcpus
+        :return: tuple with ram, vcpus, extra_specs
+        """
+        ram = flavor_data.get('ram',64)
+        vcpus = flavor_data.get('vcpus',1)
+        extra_specs={}
+
+        extended = flavor_data.get("extended")
+        if extended:
+            numas=extended.get("numas")
+            if numas:
+                numa_nodes = len(numas)
+                if numa_nodes > 1:
+                    raise vimconn.vimconnException("Can not add flavor with more than one numa")
+                extra_specs["hw:numa_nodes"] = str(numa_nodes)
+                extra_specs["hw:mem_page_size"] = "large"
+                extra_specs["hw:cpu_policy"] = "dedicated"
+                extra_specs["hw:numa_mempolicy"] = "strict"
+                if self.vim_type == "VIO":
+                    extra_specs["vmware:extra_config"] = '{"numa.nodeAffinity":"0"}'
+                    extra_specs["vmware:latency_sensitivity_level"] = "high"
+                for numa in numas:
+                    #overwrite ram and vcpus
+                    #check if key 'memory' is present in numa else use ram value at flavor
+                    if 'memory' in numa:
+                        ram = numa['memory']*1024
+                    #See for reference: https://specs.openstack.org/openstack/nova-specs/specs/mitaka/implemented/virt-driver-cpu-thread-pinning.html
+                    extra_specs["hw:cpu_sockets"] = 1
+                    if 'paired-threads' in numa:
+                        vcpus = numa['paired-threads']*2
+                        #cpu_thread_policy "require" implies that the compute node must have an STM architecture
+                        extra_specs["hw:cpu_thread_policy"] = "require"
+                        extra_specs["hw:cpu_policy"] = "dedicated"
+                    elif 'cores' in numa:
+                        vcpus = numa['cores']
+                        # cpu_thread_policy "prefer" implies that the host must not have an SMT architecture, or a non-SMT architecture will be emulated
+                        extra_specs["hw:cpu_thread_policy"] = "isolate"
+                        extra_specs["hw:cpu_policy"] = "dedicated"
+                    elif 'threads' in numa:
+                        vcpus = numa['threads']
+                        # cpu_thread_policy "prefer" implies that the host may or may not have an SMT architecture
+                        extra_specs["hw:cpu_thread_policy"] = "prefer"
+                        extra_specs["hw:cpu_policy"] = "dedicated"
+                    # for interface in numa.get("interfaces",() ):
+                    #     if interface["dedicated"]=="yes":
+                    #         raise vimconn.vimconnException("Passthrough interfaces are not supported for the openstack connector", http_code=vimconn.HTTP_Service_Unavailable)
+                    #     #TODO, add the key 'pci_passthrough:alias"="<label at config>:<number ifaces>"' when a way to connect it is available
+            elif extended.get("cpu-quota"):
+                self.process_resource_quota(extended.get("cpu-quota"), "cpu", extra_specs)
+            if extended.get("mem-quota"):
+                self.process_resource_quota(extended.get("mem-quota"), "memory", extra_specs)
+            if extended.get("vif-quota"):
+                self.process_resource_quota(extended.get("vif-quota"), "vif", extra_specs)
+            if extended.get("disk-io-quota"):
+                self.process_resource_quota(extended.get("disk-io-quota"), "disk_io", extra_specs)
+        return ram, vcpus, extra_specs
+
     def delete_flavor(self,flavor_id):
         '''Deletes a tenant flavor from openstack VIM. Returns the old flavor_id
         '''
         try:
             self._reload_connection()
             self.nova.flavors.delete(flavor_id)
+            catalog = self.persistent_info.get("flavor_catalog")
+            if catalog and flavor_id in catalog["flavors"]:
+                ram, vcpus, disk, epa_key = catalog["flavors"].pop(flavor_id)
+                catalog["index"][epa_key].remove((ram, vcpus, disk, flavor_id))
             return flavor_id
         #except nvExceptions.BadRequest as e:
         except (nvExceptions.NotFound, ksExceptions.ClientException, nvExceptions.ClientException, ConnectionError) as e:
             self._format_exception(e)
 
+    @staticmethod
+    def _image_location(image):
+        """Return the location metadata of a glance image, where new_image stores the origin path"""
+        return image.get("location") or image.get("upload_location") or (image.get("metadata") or {}).get("location")
+
+    @staticmethod
+    def _image_index_add(index, image):
+        """Add or replace an image at the index, updating the lookup tables by name, checksum and location"""
+        vimconnector._image_index_remove(index, image["id"])
+        image = image.copy()
+        index["images"][image["id"]] = image
+        for key, value in (("name", image.get("name")), ("checksum", image.get("checksum")),
+                           ("location", vimconnector._image_location(image))):
+            if value:
+                index[key].setdefault(value, set()).add(image["id"])
+        if image.get("updated_at") and image["updated_at"] > index["updated_at"]:
+            index["updated_at"] = image["updated_at"]
+
+    @staticmethod
+    def _image_index_remove(index, image_id):
+        image = index["images"].pop(image_id, None)
+        if not image:
+            return
+        for key, value in (("name", image.get("name")), ("checksum", image.get("checksum")),
+                           ("location", vimconnector._image_location(image))):
+            ids = index[key].get(value)
+            if ids:
+                ids.discard(image_id)
+                if not ids:
+                    del index[key][value]
+
+    def _get_image_index(self, refresh=False):
+        """Return the index of glance images kept at persistent_info, so that it is shared by the connectors of the same
+        vim account. It is fully loaded the first time and after image_index_reload_time. After image_index_time, or
+        if refresh is True, only the images changed since the last refresh are obtained, with an updated_at
+        server-side filter.
+        :return: dictionary with "images": {id: image}, "name", "checksum" and "location": {value: set of ids}
+        """
+        now = time.time()
+        index = self.persistent_info.get("image_index")
+        if not index or now - index["loaded_at"] > self.config.get("image_index_reload_time", image_index_reload_time):
+            new_index = {"images": {}, "name": {}, "checksum": {}, "location": {}, "updated_at": "",
+                         "loaded_at": now, "refreshed_at": now, "changes_since": index["changes_since"] if index else True}
+            for image in self.glance.images.list():
+                self._image_index_add(new_index, image)
+            self.logger.debug("Loaded image index with %d images", len(new_index["images"]))
+            self.persistent_info["image_index"] = new_index
+            return new_index
+        if refresh or now - index["refreshed_at"] > self.config.get("image_index_time", image_index_time):
+            if not index["changes_since"] or not index["updated_at"]:
+                # glance does not support the updated_at filter, or there were no images. Reload everything
+                index["loaded_at"] = 0
+                return self._get_image_index()
+            try:
+                changed_images = list(self.glance.images.list(filters={"updated_at": "gte:" + index["updated_at"]}))
+            except gl1Exceptions.HTTPBadRequest:
+                self.logger.debug("glance does not support updated_at filter. Image index will be fully reloaded")
+                index["changes_since"] = False
+                index["loaded_at"] = 0
+                return self._get_image_index()
+            for image in changed_images:
+                self._image_index_add(index, image)
+            index["refreshed_at"] = now
+        return index
+
     def new_image(self,image_dict):
         '''
         Adds a tenant image to VIM. imge_dict is a dictionary with:
@@ -1004,6 +1194,8 @@ class vimconnector(vimconn.vimconnector):
                 else:
                     metadata_to_load['location'] = image_dict['location']
                 self.glance.images.update(new_image.id, **metadata_to_load)
+                if self.persistent_info.get("image_index"):
+                    self.persistent_info["image_index"]["refreshed_at"] = 0  # get the new image at next lookup
                 return new_image.id
             except (nvExceptions.Conflict, ksExceptions.ClientException, nvExceptions.ClientException) as e:
                 self._format_exception(e)
@@ -1021,6 +1213,8 @@ class vimconnector(vimconn.vimconnector):
         try:
             self._reload_connection()
             self.glance.images.delete(image_id)
+            if self.persistent_info.get("image_index"):
+                self._image_index_remove(self.persistent_info["image_index"], image_id)
             return image_id
         except (nvExceptions.NotFound, ksExceptions.ClientException, nvExceptions.ClientException, gl1Exceptions.CommunicationError, gl1Exceptions.HTTPNotFound, ConnectionError) as e: #TODO remove
             self._format_exception(e)
@@ -1029,10 +1223,12 @@ class vimconnector(vimconn.vimconnector):
         '''Get the image id from image path in the VIM database. Returns the image_id'''
         try:
             self._reload_connection()
-            images = self.glance.images.list()
-            for image in images:
-                if image.metadata.get("location")==path:
-                    return image.id
+            index = self._get_image_index()
+            if path not in index["location"]:
+                # it can be a new image not at the index yet
+                index = self._get_image_index(refresh=True)
+            for image_id in index["location"].get(path, ()):
+                return image_id
             raise vimconn.vimconnNotFoundException("image with location '{}' not found".format( path))
         except (ksExceptions.ClientException, nvExceptions.ClientException, gl1Exceptions.CommunicationError, ConnectionError) as e:
             self._format_exception(e)
@@ -1046,26 +1242,48 @@ class vimconnector(vimconn.vimconnector):
         Returns the image list of dictionaries:
             [{<the fields at Filter_dict plus some VIM specific>}, ...]
             List can be empty
+        Images are taken from the image index. If not found there, they are requested to glance with a server-side
+        filter, as they can be new
         '''
         self.logger.debug("Getting image list from VIM filter: '%s'", str(filter_dict))
         try:
             self._reload_connection()
-            filter_dict_os = filter_dict.copy()
-            #First we filter by the available filter fields: name, id. The others are removed.
-            image_list = self.glance.images.list()
-            filtered_list = []
-            for image in image_list:
-                try:
-                    if filter_dict.get("name") and image["name"] != filter_dict["name"]:
+            index = self._get_image_index()
+
+            def lookup():
+                if filter_dict.get("id"):
+                    image_ids = (filter_dict["id"],) if filter_dict["id"] in index["images"] else ()
+                elif filter_dict.get("name"):
+                    image_ids = index["name"].get(filter_dict["name"], ())
+                elif filter_dict.get("checksum"):
+                    image_ids = index["checksum"].get(filter_dict["checksum"], ())
+                else:
+                    image_ids = index["images"].keys()
+                filtered_list = []
+                for image_id in list(image_ids):
+                    image = index["images"].get(image_id)
+                    if not image:
                         continue
-                    if filter_dict.get("id") and image["id"] != filter_dict["id"]:
+                    if filter_dict.get("name") and image["name"] != filter_dict["name"]:
                         continue
-                    if filter_dict.get("checksum") and image["checksum"] != filter_dict["checksum"]:
+                    if filter_dict.get("checksum") and image.get("checksum") != filter_dict["checksum"]:
                         continue
-
                     filtered_list.append(image.copy())
-                except gl1Exceptions.HTTPNotFound:
-                    pass
+                return filtered_list
+
+            filtered_list = lookup()
+            if not filtered_list and (filter_dict.get("id") or filter_dict.get("name") or filter_dict.get("checksum")):
+                if filter_dict.get("id"):
+                    try:
+                        images = (self.glance.images.get(filter_dict["id"]), )
+                    except gl1Exceptions.HTTPNotFound:
+                        images = ()
+                else:
+                    filters = {k: filter_dict[k] for k in ("name", "checksum") if filter_dict.get(k)}
+                    images = self.glance.images.list(filters=filters)
+                for image in images:
+                    self._image_index_add(index, image)
+                filtered_list = lookup()
             return filtered_list
         except (ksExceptions.ClientException, nvExceptions.ClientException, gl1Exceptions.CommunicationError, ConnectionError) as e:
             self._format_exception(e)
@@ -1590,83 +1808,130 @@ class vimconnector(vimconn.vimconnector):
                         compute_node:     #identification of compute node where PF,VF interface is allocated
                         pci:              #PCI address of the NIC that hosts the PF,VF
                         vlan:             #physical VLAN used for VF
+           The VMs are obtained one by one when there are at most REFRESH_VMS_GET_LIMIT of them, otherwise with a
+           listing of all the servers (a request per page of servers). Ports, networks and floating IPs are obtained with one request each
+           (neutron requests are split in chunks for very long lists)
         '''
         vm_dict={}
         self.logger.debug("refresh_vms status: Getting tenant VM instance information from VIM")
+        try:
+            self._reload_connection()
+            vm_ids = set(vm_list)
+            vm_vim_by_id = {}
+            if len(vm_ids) <= self.REFRESH_VMS_GET_LIMIT:
+                # nova cannot filter the list by several ids, so the few ones are requested one by one
+                for vm_id in vm_ids:
+                    try:
+                        vm_vim_by_id[vm_id] = self.nova.servers.get(vm_id).to_dict()
+                    except nvExceptions.NotFound:
+                        pass
+            else:
+                # limit=-1 makes novaclient follow the pages, otherwise only the first one (usually 1000 servers)
+                # would be obtained and the VMs of the next pages would be reported as DELETED
+                for server in self.nova.servers.list(detailed=True, limit=-1):
+                    if server.id in vm_ids:
+                        vm_vim_by_id[server.id] = server.to_dict()
+        except (ksExceptions.ClientException, nvExceptions.ClientException, ConnectionError) as e:
+            try:
+                self._format_exception(e)
+            except vimconn.vimconnException as e:
+                self.logger.error("Exception getting vm status: %s", str(e))
+                for vm_id in vm_list:
+                    vm_dict[vm_id] = {"status": "VIM_ERROR", "error_msg": str(e)}
+                return vm_dict
+
+        #get interfaces of all the VMs
+        ports_by_vm = {}
+        networks_by_id = {}
+        floating_ip_by_port = {}
+        try:
+            port_list = self._list_by_ids(self.neutron.list_ports, "ports", "device_id", vm_vim_by_id.keys())
+            for port in port_list:
+                ports_by_vm.setdefault(port["device_id"], []).append(port)
+            network_ids = set(port["network_id"] for port in port_list)
+            for network in self._list_by_ids(self.neutron.list_networks, "networks", "id", network_ids):
+                networks_by_id[network["id"]] = network
+            #look for floating ip addresses
+            try:
+                floating_ip_list = self._list_by_ids(self.neutron.list_floatingips, "floatingips", "port_id",
+                                                     [port["id"] for port in port_list])
+                for floating_ip in floating_ip_list:
+                    floating_ip_by_port.setdefault(floating_ip["port_id"], floating_ip.get("floating_ip_address"))
+            except Exception:
+                pass
+        except Exception as e:
+            self.logger.error("Error getting vm interface information {}: {}".format(type(e).__name__, e),
+                              exc_info=True)
+
         for vm_id in vm_list:
             vm={}
-            try:
-                vm_vim = self.get_vminstance(vm_id)
-                if vm_vim['status'] in vmStatus2manoFormat:
-                    vm['status']    =  vmStatus2manoFormat[ vm_vim['status'] ]
-                else:
-                    vm['status']    = "OTHER"
-                    vm['error_msg'] = "VIM status reported " + vm_vim['status']
+            vm_vim = vm_vim_by_id.get(vm_id)
+            if not vm_vim:
+                error_text = "NotFound: Server '{}' not found".format(vm_id)
+                self.logger.error("Exception getting vm status: %s", error_text)
+                vm['status'] = "DELETED"
+                vm['error_msg'] = error_text
+                vm_dict[vm_id] = vm
+                continue
+            if vm_vim['status'] in vmStatus2manoFormat:
+                vm['status']    =  vmStatus2manoFormat[ vm_vim['status'] ]
+            else:
+                vm['status']    = "OTHER"
+                vm['error_msg'] = "VIM status reported " + vm_vim['status']
 
-                vm['vim_info'] = self.serialize(vm_vim)
+            vm['vim_info'] = self.serialize(vm_vim)
 
-                vm["interfaces"] = []
-                if vm_vim.get('fault'):
-                    vm['error_msg'] = str(vm_vim['fault'])
-                #get interfaces
-                try:
-                    self._reload_connection()
-                    port_dict = self.neutron.list_ports(device_id=vm_id)
-                    for port in port_dict["ports"]:
-                        interface={}
-                        interface['vim_info'] = self.serialize(port)
-                        interface["mac_address"] = port.get("mac_address")
-                        interface["vim_net_id"] = port["network_id"]
-                        interface["vim_interface_id"] = port["id"]
-                        # check if OS-EXT-SRV-ATTR:host is there,
-                        # in case of non-admin credentials, it will be missing
-                        if vm_vim.get('OS-EXT-SRV-ATTR:host'):
-                            interface["compute_node"] = vm_vim['OS-EXT-SRV-ATTR:host']
-                        interface["pci"] = None
-
-                        # check if binding:profile is there,
-                        # in case of non-admin credentials, it will be missing
-                        if port.get('binding:profile'):
-                            if port['binding:profile'].get('pci_slot'):
-                                # TODO: At the moment sr-iov pci addresses are converted to PF pci addresses by setting the slot to 0x00
-                                # TODO: This is just a workaround valid for niantinc. Find a better way to do so
-                                #   CHANGE DDDD:BB:SS.F to DDDD:BB:00.(F%2)   assuming there are 2 ports per nic
-                                pci = port['binding:profile']['pci_slot']
-                                # interface["pci"] = pci[:-4] + "00." + str(int(pci[-1]) % 2)
-                                interface["pci"] = pci
-                        interface["vlan"] = None
-                        #if network is of type vlan and port is of type direct (sr-iov) then set vlan id
-                        network = self.neutron.show_network(port["network_id"])
-                        if network['network'].get('provider:network_type') == 'vlan' and \
-                            port.get("binding:vnic_type") == "direct":
-                            interface["vlan"] = network['network'].get('provider:segmentation_id')
-                        ips=[]
-                        #look for floating ip address
-                        try:
-                            floating_ip_dict = self.neutron.list_floatingips(port_id=port["id"])
-                            if floating_ip_dict.get("floatingips"):
-                                ips.append(floating_ip_dict["floatingips"][0].get("floating_ip_address") )
-                        except Exception:
-                            pass
-
-                        for subnet in port["fixed_ips"]:
-                            ips.append(subnet["ip_address"])
-                        interface["ip_address"] = ";".join(ips)
-                        vm["interfaces"].append(interface)
-                except Exception as e:
-                    self.logger.error("Error getting vm interface information {}: {}".format(type(e).__name__, e),
-                                      exc_info=True)
-            except vimconn.vimconnNotFoundException as e:
-                self.logger.error("Exception getting vm status: %s", str(e))
-                vm['status'] = "DELETED"
-                vm['error_msg'] = str(e)
-            except vimconn.vimconnException as e:
-                self.logger.error("Exception getting vm status: %s", str(e))
-                vm['status'] = "VIM_ERROR"
-                vm['error_msg'] = str(e)
+            vm["interfaces"] = []
+            if vm_vim.get('fault'):
+                vm['error_msg'] = str(vm_vim['fault'])
+            for port in ports_by_vm.get(vm_id, ()):
+                vm["interfaces"].append(self._port_os2mano(port, vm_vim, networks_by_id.get(port["network_id"], {}),
+                                                           floating_ip_by_port.get(port["id"])))
             vm_dict[vm_id] = vm
         return vm_dict
 
+    def _port_os2mano(self, port, vm_vim, network, floating_ip=None):
+        '''Transform an openstack port into the interface format returned by refresh_vms_status
+        :param port: port as returned by neutron
+        :param vm_vim: VM, as returned by nova, the port is attached to
+        :param network: network, as returned by neutron, the port is connected to
+        :param floating_ip: floating ip address associated to the port, if any
+        :return: interface dictionary
+        '''
+        interface={}
+        interface['vim_info'] = self.serialize(port)
+        interface["mac_address"] = port.get("mac_address")
+        interface["vim_net_id"] = port["network_id"]
+        interface["vim_interface_id"] = port["id"]
+        # check if OS-EXT-SRV-ATTR:host is there,
+        # in case of non-admin credentials, it will be missing
+        if vm_vim.get('OS-EXT-SRV-ATTR:host'):
+            interface["compute_node"] = vm_vim['OS-EXT-SRV-ATTR:host']
+        interface["pci"] = None
+
+        # check if binding:profile is there,
+        # in case of non-admin credentials, it will be missing
+        if port.get('binding:profile'):
+            if port['binding:profile'].get('pci_slot'):
+                # TODO: At the moment sr-iov pci addresses are converted to PF pci addresses by setting the slot to 0x00
+                # TODO: This is just a workaround valid for niantinc. Find a better way to do so
+                #   CHANGE DDDD:BB:SS.F to DDDD:BB:00.(F%2)   assuming there are 2 ports per nic
+                pci = port['binding:profile']['pci_slot']
+                # interface["pci"] = pci[:-4] + "00." + str(int(pci[-1]) % 2)
+                interface["pci"] = pci
+        interface["vlan"] = None
+        #if network is of type vlan and port is of type direct (sr-iov) then set vlan id
+        if network.get('provider:network_type') == 'vlan' and \
+            port.get("binding:vnic_type") == "direct":
+            interface["vlan"] = network.get('provider:segmentation_id')
+        ips=[]
+        if floating_ip:
+            ips.append(floating_ip)
+        for subnet in port["fixed_ips"]:
+            ips.append(subnet["ip_address"])
+        interface["ip_address"] = ";".join(ips)
+        return interface
+
     def action_vminstance(self, vm_id, action_dict, created_items={}):
         '''Send and action over a VM instance from VIM
         Returns None or the console dict if the action was successfully sent to the VIM'''
@@ -34,8 +34,8 @@ import yaml
 import logging
 import math
 from openmano_schemas import id_schema, name_schema, nameshort_schema, description_schema, \
-                            vlan1000_schema, integer0_schema
-from jsonschema import validate as js_v, exceptions as js_e
+                            vlan1000_schema, integer0_schema, validate as js_v
+from jsonschema import exceptions as js_e
 from urllib import quote
 
 '''contain the openvim virtual machine status to openmano status'''
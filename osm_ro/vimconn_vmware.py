@@ -34,6 +34,7 @@ import subprocess
 import tempfile
 import traceback
 import itertools
+import mmap
 import requests
 import ssl
 import atexit
@@ -63,6 +64,7 @@ import socket
 import struct
 import netaddr
 import random
+import threading
 
 # global variable for vcd connector type
 STANDALONE = 'standalone'
@@ -81,6 +83,14 @@ MAX_WAIT_TIME = 1800
 
 API_VERSION = '27.0'
 
+# time in seconds that a vCD login is reused. Lower than the default idle timeout of vCD sessions (30 minutes)
+VCD_SESSION_TTL = 1200
+
+# VMDK upload: size of each PUT request, attempts for each one, and time in seconds between progress logs
+UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024
+UPLOAD_RETRIES = 3
+UPLOAD_LOG_PERIOD = 30
+
 __author__ = "Mustafa Bayramov, Arpita Kate, Sachin Bhangare, Prakash Kasar"
 __date__ = "$09-Mar-2018 11:09:29$"
 __version__ = '0.2'
@@ -292,6 +302,70 @@ class vimconnector(vimconn.vimconnector):
         else:
             raise KeyError("Invalid key '%s'" % str(index))
 
+    def _get_client(self, admin=False, refresh=False):
+        """ Method to get a logged pyvcloud client. Clients are kept at persistent_info and reused during
+            VCD_SESSION_TTL seconds, so that each operation does not log into vCloud director again.
+
+            Args:
+                admin - log as pvdc admin user at 'System' organization instead of as normal user
+                refresh - log in again, even if there is a valid client (e.g. its session has expired)
+
+            Returns:
+                The logged client object
+        """
+        if admin:
+            credentials = (self.admin_user, 'System', self.admin_password)
+        else:
+            credentials = (self.user, self.org_name, self.passwd)
+        key = (self.url, ) + credentials
+        clients = self.persistent_info.setdefault("vcd_clients", {})
+        client, login_time = clients.get(key, (None, 0))
+        if client and not refresh and time.time() - login_time < VCD_SESSION_TTL:
+            return client
+
+        self.logger.debug("Logging into vCD {} as {}.".format(credentials[1], credentials[0]))
+        client = Client(self.url, verify_ssl_certs=False)
+        client.set_highest_supported_version()
+        client.set_credentials(BasicLoginCredentials(*credentials))
+        clients[key] = (client, time.time())
+        return client
+
+    def _login_again(self, token):
+        """ Method to log in again the client that uses an expired vCD token. The connector client is replaced
+            if it was this one.
+
+            Args:
+                token - the x-vcloud-authorization token rejected by vCloud director
+
+            Returns:
+                The new token
+        """
+        admin = False
+        for key, (client, _) in self.persistent_info.get("vcd_clients", {}).items():
+            if key[0] == self.url and client._session and \
+                    client._session.headers.get('x-vcloud-authorization') == token:
+                admin = key[2] == 'System'
+                break
+        client = self._get_client(admin=admin, refresh=True)
+        if not self.client or not self.client._session or \
+                self.client._session.headers.get('x-vcloud-authorization') == token:
+            self.client = client
+        return client._session.headers['x-vcloud-authorization']
+
+    def _get_http_session(self):
+        """ Method to get the requests session, kept at persistent_info, used for the REST calls to vCloud director
+            and NSX manager. It keeps the connections alive, so that the TLS handshake is not repeated at each call.
+        """
+        session = self.persistent_info.get("http_session")
+        if not session:
+            session = requests.Session()
+            session.verify = False
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=10)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self.persistent_info["http_session"] = session
+        return session
+
     def connect_as_admin(self):
         """ Method connect as pvdc admin user to vCloud director.
             There are certain action that can be done only by provider vdc admin user.
@@ -300,14 +374,8 @@ class vimconnector(vimconn.vimconnector):
             Returns:
                 The return client object that latter can be used to connect to vcloud director as admin for provider vdc
         """
-        self.logger.debug("Logging into vCD {} as admin.".format(self.org_name))
-
         try:
-            host = self.url
-            org = 'System'
-            client_as_admin = Client(host, verify_ssl_certs=False)
-            client_as_admin.set_highest_supported_version()
-            client_as_admin.set_credentials(BasicLoginCredentials(self.admin_user, org, self.admin_password))
+            client_as_admin = self._get_client(admin=True)
         except Exception as e:
             raise vimconn.vimconnException(
                   "Can't connect to a vCloud director as: {} with exception {}".format(self.admin_user, e))
@@ -321,13 +389,7 @@ class vimconnector(vimconn.vimconnector):
                 The return client object that latter can be used to connect to vCloud director as admin for VDC
         """
         try:
-            self.logger.debug("Logging into vCD {} as {} to datacenter {}.".format(self.org_name,
-                                                                                      self.user,
-                                                                                      self.org_name))
-            host = self.url
-            client = Client(host, verify_ssl_certs=False)
-            client.set_highest_supported_version()
-            client.set_credentials(BasicLoginCredentials(self.user, self.org_name, self.passwd))
+            client = self._get_client()
         except:
             raise vimconn.vimconnConnectionException("Can't connect to a vCloud director org: "
                                                      "{} as user: {}".format(self.org_name, self.user))
@@ -1064,7 +1126,7 @@ class vimconnector(vimconn.vimconnector):
 
     # noinspection PyIncorrectDocstring
     def upload_ovf(self, vca=None, catalog_name=None, image_name=None, media_file_name=None,
-                   description='', progress=False, chunk_bytes=128 * 1024):
+                   description='', progress=False, chunk_bytes=UPLOAD_CHUNK_BYTES):
         """
         Uploads a OVF file to a vCloud catalog
 
@@ -1158,38 +1220,9 @@ class vimconnector(vimconn.vimconnector):
                             return False
                         hrefvmdk = link_href
 
-                        if progress:
-                            widgets = ['Uploading file: ', Percentage(), ' ', Bar(), ' ', ETA(), ' ',
-                                           FileTransferSpeed()]
-                            progress_bar = ProgressBar(widgets=widgets, maxval=statinfo.st_size).start()
-
-                        bytes_transferred = 0
-                        f = open(file_vmdk, 'rb')
-                        while bytes_transferred < statinfo.st_size:
-                            my_bytes = f.read(chunk_bytes)
-                            if len(my_bytes) <= chunk_bytes:
-                                headers['Content-Range'] = 'bytes %s-%s/%s' % (
-                                    bytes_transferred, len(my_bytes) - 1, statinfo.st_size)
-                                headers['Content-Length'] = str(len(my_bytes))
-                                response = requests.put(url=hrefvmdk,
-                                                         headers=headers,
-                                                         data=my_bytes,
-                                                         verify=False)
-                                if response.status_code == requests.codes.ok:
-                                    bytes_transferred += len(my_bytes)
-                                    if progress:
-                                        progress_bar.update(bytes_transferred)
-                                else:
-                                    self.logger.debug(
-                                        'file upload failed with error: [%s] %s' % (response.status_code,
-                                                                                        response.content))
-
-                                    f.close()
-                                    return False
-                        f.close()
-                        if progress:
-                            progress_bar.finish()
-                            time.sleep(10)
+                        if not self.upload_vmdk(hrefvmdk, file_vmdk, headers, catalog_name=catalog_name,
+                                                chunk_bytes=chunk_bytes, progress=progress):
+                            return False
                     return True
                 else:
                     self.logger.debug("Failed retrieve vApp template for catalog name {} for OVF {}".
@@ -1205,6 +1238,134 @@ class vimconnector(vimconn.vimconnector):
         self.logger.debug("Failed retrieve catalog name {} for OVF file {}".format(catalog_name, media_file_name))
         return False
 
+    def upload_vmdk(self, href, file_vmdk, headers, catalog_name=None, chunk_bytes=UPLOAD_CHUNK_BYTES,
+                    progress=False):
+        """
+        Uploads a VMDK file to the vCD transfer service with ranged PUT requests. Chunks are sent from a mmap of the
+        file, without copying them, by 'vmdk_upload_threads' (VIM config, 1 by default) parallel threads, and each one
+        is tried UPLOAD_RETRIES times. The uploaded offset is kept at persistent_info, so that a failed upload is
+        resumed from there by a later call with the same href (see resume_vmdk_upload)
+
+        :param href: upload href of the file at the vApp template
+        :param file_vmdk: (str): path of the local file
+        :param headers: headers of the requests, with the vCD token
+        :param catalog_name: catalog of the vApp template, used to resume the upload
+        :param chunk_bytes: size of each request
+        :param progress: show a progress bar
+        :return: (bool) True if the file was uploaded, false otherwise.
+        """
+        statinfo = os.stat(file_vmdk)
+        size = statinfo.st_size
+        uploads = self.persistent_info.setdefault("vmdk_uploads", {})
+        upload = uploads.get(href)
+        if not upload or upload["size"] != size or upload["mtime"] != statinfo.st_mtime:
+            upload = {"catalog": catalog_name, "file": file_vmdk, "size": size, "mtime": statinfo.st_mtime,
+                      "offset": 0}
+            uploads[href] = upload
+        elif upload["offset"]:
+            self.logger.info("Resuming upload of {} at byte {} of {}".format(file_vmdk, upload["offset"], size))
+
+        headers = {k: v for k, v in headers.items() if k not in ('Content-Range', 'Content-Length')}
+        session = self._get_http_session()
+        chunks = iter(range(upload["offset"], size, chunk_bytes))
+        done = set()  # offsets of the chunks uploaded after other not finished yet
+        failed = []
+        lock = threading.Lock()
+        start = {"time": time.time(), "offset": upload["offset"], "logged": time.time()}
+        if progress:
+            widgets = ['Uploading file: ', Percentage(), ' ', Bar(), ' ', ETA(), ' ', FileTransferSpeed()]
+            progress_bar = ProgressBar(widgets=widgets, maxval=size).start()
+
+        def log_throughput(message):
+            elapsed = max(time.time() - start["time"], 0.001)
+            self.logger.info("{} {}: {} of {} MB, {:.1f} MB/s".format(
+                message, file_vmdk, upload["offset"] // 1048576, size // 1048576,
+                (upload["offset"] - start["offset"]) / elapsed / 1048576))
+
+        def put_chunk(file_map, offset):
+            length = min(chunk_bytes, size - offset)
+            chunk_headers = dict(headers)
+            chunk_headers['Content-Range'] = 'bytes {}-{}/{}'.format(offset, offset + length - 1, size)
+            chunk_headers['Content-Length'] = str(length)
+            for attempt in range(UPLOAD_RETRIES):
+                if attempt:
+                    time.sleep(2 ** attempt)
+                try:
+                    response = session.put(url=href, headers=chunk_headers, data=buffer(file_map, offset, length))
+                except requests.exceptions.RequestException as e:
+                    self.logger.debug("Upload of {} at byte {} failed: {}".format(file_vmdk, offset, e))
+                    continue
+                if response.status_code == requests.codes.ok:
+                    return True
+                self.logger.debug("Upload of {} at byte {} failed with error: [{}] {}".format(
+                    file_vmdk, offset, response.status_code, response.content))
+                token = chunk_headers.get('x-vcloud-authorization')
+                if response.status_code == 401 and token:
+                    with lock:
+                        if headers['x-vcloud-authorization'] == token:
+                            headers['x-vcloud-authorization'] = self._login_again(token)
+                        chunk_headers['x-vcloud-authorization'] = headers['x-vcloud-authorization']
+            return False
+
+        def upload_chunks(file_map):
+            while True:
+                with lock:
+                    offset = None if failed else next(chunks, None)
+                if offset is None:
+                    return
+                if not put_chunk(file_map, offset):
+                    failed.append(offset)
+                    return
+                with lock:
+                    done.add(offset)
+                    while upload["offset"] in done:
+                        done.remove(upload["offset"])
+                        upload["offset"] = min(upload["offset"] + chunk_bytes, size)
+                    if progress:
+                        progress_bar.update(upload["offset"])
+                    if time.time() - start["logged"] >= UPLOAD_LOG_PERIOD:
+                        start["logged"] = time.time()
+                        log_throughput("Uploading")
+
+        with open(file_vmdk, 'rb') as f:
+            file_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                threads = [threading.Thread(target=upload_chunks, args=(file_map, ))
+                           for _ in range(int(self.config.get("vmdk_upload_threads") or 1))]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            finally:
+                file_map.close()
+
+        if failed:
+            log_throughput("Failed upload, it can be resumed, of")
+            return False
+        del uploads[href]
+        log_throughput("Uploaded")
+        if progress:
+            progress_bar.finish()
+            time.sleep(10)
+        return True
+
+    def resume_vmdk_upload(self, catalog_name, progress=False):
+        """
+        Resumes the failed VMDK uploads of a catalog, if any
+
+        :param catalog_name: (str): The name of the catalog
+        :param progress: show a progress bar
+        :return: (bool) True if there is not any failed upload or all of them have finished now, false otherwise.
+        """
+        for href, upload in self.persistent_info.get("vmdk_uploads", {}).items():
+            if upload["catalog"] != catalog_name:
+                continue
+            headers = {'Accept': 'application/*+xml;version=' + API_VERSION,
+                       'x-vcloud-authorization': self.client._session.headers['x-vcloud-authorization']}
+            if not self.upload_vmdk(href, upload["file"], headers, catalog_name=catalog_name, progress=progress):
+                return False
+        return True
+
     def upload_vimimage(self, vca=None, catalog_name=None, media_name=None, medial_file_name=None, progress=False):
         """Upload media file"""
         # TODO add named parameters for readability
@@ -1345,6 +1506,9 @@ class vimconnector(vimconn.vimconnector):
                     self.logger.debug("Found existing catalog entry for {} "
                                       "catalog id {}".format(catalog_name,
                                                              self.get_catalogid(catalog_md5_name, catalogs)))
+                    if not self.resume_vmdk_upload(catalog_md5_name, progress=progress):
+                        raise vimconn.vimconnException("Failed to resume the upload of image for catalog {} "
+                                                       .format(catalog_md5_name))
                     return self.get_catalogid(catalog_md5_name, catalogs)
 
         # if we didn't find existing catalog we create a new one and upload image.
@@ -2128,7 +2292,7 @@ class vimconnector(vimconn.vimconnector):
                 self.logger.debug("new_vminstance(): Affinity rule created successfully. Added {} in Host group {}"\
                                     .format(name, vm_az))
             #Reset token to a normal user to perform other operations
-            self.get_token()
+            self.client = self.connect()
 
         if vapp_uuid is not None:
             return vapp_uuid, None
@@ -2656,7 +2820,7 @@ class vimconnector(vimconn.vimconnector):
 
         """
         #get token to connect vCD as a normal user
-        self.get_token()
+        self.client = self.connect()
         self.logger.debug(msg)
         raise vimconn.vimconnException(msg)
 
@@ -2971,9 +3135,9 @@ class vimconnector(vimconn.vimconnector):
         self.logger.debug("Get edge details from NSX Manager {} {}".format(self.nsx_manager, nsx_api_url))
 
         try:
-            resp = requests.get(self.nsx_manager + nsx_api_url,
-                                auth = (self.nsx_user, self.nsx_password),
-                                verify = False, headers = rheaders)
+            resp = self._get_http_session().get(self.nsx_manager + nsx_api_url,
+                                                auth = (self.nsx_user, self.nsx_password),
+                                                headers = rheaders)
             if resp.status_code == requests.codes.ok:
                 paged_Edge_List = XmlElementTree.fromstring(resp.text)
                 for edge_pages in paged_Edge_List:
@@ -3031,9 +3195,9 @@ class vimconnector(vimconn.vimconnector):
             for edge in nsx_edges:
                 nsx_api_url = '/api/4.0/edges/'+ edge +'/dhcp/leaseInfo'
 
-                resp = requests.get(self.nsx_manager + nsx_api_url,
-                                    auth = (self.nsx_user, self.nsx_password),
-                                    verify = False, headers = rheaders)
+                resp = self._get_http_session().get(self.nsx_manager + nsx_api_url,
+                                                    auth = (self.nsx_user, self.nsx_password),
+                                                    headers = rheaders)
 
                 if resp.status_code == requests.codes.ok:
                     dhcp_leases = XmlElementTree.fromstring(resp.text)
@@ -5753,7 +5917,8 @@ class vimconnector(vimconn.vimconnector):
 
     def get_vcenter_content(self):
         """
-         Get the vsphere content object
+         Get the vsphere content object. The vCenter connection is kept at persistent_info and reused while its
+         session is valid
         """
         try:
             vm_vcenter_info = self.get_vm_vcenter_info()
@@ -5762,6 +5927,17 @@ class vimconnector(vimconn.vimconnector):
                              " for VM : {}".format(exp))
             raise vimconn.vimconnException(message=exp)
 
+        key = (vm_vcenter_info["vm_vcenter_ip"], vm_vcenter_info["vm_vcenter_port"],
+               vm_vcenter_info["vm_vcenter_user"], vm_vcenter_info["vm_vcenter_password"])
+        cached = self.persistent_info.get("vcenter_connection")
+        if cached and cached[0] == key:
+            vcenter_conect, content = cached[1], cached[2]
+            try:
+                if content.sessionManager.currentSession:
+                    return vcenter_conect, content
+            except Exception as exp:
+                self.logger.debug("vCenter session not valid, connecting again: {}".format(exp))
+
         context = None
         if hasattr(ssl, '_create_unverified_context'):
             context = ssl._create_unverified_context()
@@ -5775,6 +5951,7 @@ class vimconnector(vimconn.vimconnector):
                 )
         atexit.register(Disconnect, vcenter_conect)
         content = vcenter_conect.RetrieveContent()
+        self.persistent_info["vcenter_connection"] = (key, vcenter_conect, content)
         return vcenter_conect, content
 
 
@@ -6483,9 +6660,7 @@ class vimconnector(vimconn.vimconnector):
             self.logger.debug("Generate token for vca {} as {} to datacenter {}.".format(self.org_name,
                                                                                       self.user,
                                                                                       self.org_name))
-            host = self.url
-            client = Client(host, verify_ssl_certs=False)
-            client.set_credentials(BasicLoginCredentials(self.user, self.org_name, self.passwd))
+            client = self._get_client(refresh=True)
             # connection object
             self.client = client
 
@@ -6525,24 +6700,14 @@ class vimconnector(vimconn.vimconnector):
         #Log REST request details
         self.log_request(req_type, url=url, headers=headers, data=data)
         # perform request and return its result
-        if req_type == 'GET':
-            response = requests.get(url=url,
-                                headers=headers,
-                                verify=False)
-        elif req_type == 'PUT':
-            response = requests.put(url=url,
-                                headers=headers,
-                                data=data,
-                                verify=False)
-        elif req_type == 'POST':
-            response = requests.post(url=url,
-                                 headers=headers,
-                                 data=data,
-                                 verify=False)
-        elif req_type == 'DELETE':
-            response = requests.delete(url=url,
-                                 headers=headers,
-                                 verify=False)
+        session = self._get_http_session()
+        response = session.request(req_type, url, headers=headers, data=data)
+        if response.status_code == 401 and headers and headers.get('x-vcloud-authorization'):
+            # vCD session expired. Log in again and repeat the request with the new token
+            self.logger.debug("vCD session expired, logging in again")
+            headers = dict(headers)
+            headers['x-vcloud-authorization'] = self._login_again(headers['x-vcloud-authorization'])
+            response = session.request(req_type, url, headers=headers, data=data)
         #Log the REST response
         self.log_response(response)
 
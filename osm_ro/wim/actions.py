@@ -40,8 +40,7 @@ from types import StringTypes
 
 from six.moves import range
 
-import yaml
-
+from .. import action_extra
 from ..utils import (
     filter_dict_keys,
     filter_out_dict_keys,
@@ -83,7 +82,7 @@ class Action(object):
         'vim_id',              # MD - internal ID used by the VIM to refer to
                                #      the item
         'status',              # MD - SCHEDULED,BUILD,DONE,FAILED,SUPERSEDED
-        'extra',               # MD - text with yaml format at database,
+        'extra',               # MD - text with json format at database,
         #                             dict at memory with:
         # `- params:     list with the params to be sent to the VIM for CREATE
         #                or FIND. For DELETE the vim_id is taken from other
@@ -252,7 +251,7 @@ class Action(object):
     def is_superseded(self):
         return self.status == 'SUPERSEDED'
 
-    def refresh(self, connector, persistence):
+    def refresh(self, connector, persistence, status=None):
         """Use the connector/persistence to refresh the status of the item.
 
         After the item status is refreshed any change in the task should be
@@ -262,6 +261,8 @@ class Action(object):
             connector: object containing the classes to access the WIM or VIM
             persistence: object containing the methods necessary to query the
                 database and to persist the updates
+            status: status of the item already obtained from the WIM or VIM,
+                so that the connector does not need to be asked (optional)
         """
         self.logger.debug(
             'Action `%s` has no refresh to be done',
@@ -413,7 +414,7 @@ class DeleteAction(Action):
 def _expand_extra(record):
     extra = record.pop('extra', None) or {}
     if isinstance(extra, StringTypes):
-        extra = yaml.safe_load(extra)
+        extra = action_extra.loads(extra) or {}
 
     record['params'] = extra.get('params')
     record['depends_on'] = extra.get('depends_on', [])
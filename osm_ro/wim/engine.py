@@ -43,20 +43,21 @@ on the `persistence` module.
 No http request handling/direct interaction with the database should be present
 in this file.
 """
-import json
 import logging
 from contextlib import contextmanager
-from itertools import groupby
+from itertools import chain, groupby
 from operator import itemgetter
 from sys import exc_info
 from uuid import uuid4
 
 from six import reraise
 
+from .. import action_extra
 from ..utils import remove_none_items
 from .actions import Action
 from .errors import (
     DbBaseException,
+    NoRecordFound,
     NoWimConnectedToDatacenters,
     UnexpectedDatabaseError,
     WimAccountNotActive
@@ -277,22 +278,17 @@ class WimEngine(object):
 
     def find_common_wims(self, datacenter_ids, tenant):
         """Find WIMs that are common to all datacenters listed"""
-        mappings = self.persist.get_wim_port_mappings(
-            datacenter=datacenter_ids, tenant=tenant, error_if_none=False)
-
-        wim_id_of = itemgetter('wim_id')
-        sorted_mappings = sorted(mappings, key=wim_id_of)  # needed by groupby
-        grouped_mappings = groupby(sorted_mappings, key=wim_id_of)
-        mapped_datacenters = {
-            wim_id: [m['datacenter_id'] for m in mappings]
-            for wim_id, mappings in grouped_mappings
-        }
+        wim_ids = self.persist.port_mapping_index.find_wims(datacenter_ids)
 
-        return [
-            wim_id
-            for wim_id, connected_datacenters in mapped_datacenters.items()
-            if set(connected_datacenters) >= set(datacenter_ids)
-        ]
+        if wim_ids and tenant:
+            datacenters = self.persist.filter_uuids_by_tenant(
+                'datacenters', datacenter_ids, tenant)
+            if datacenters < set(datacenter_ids):
+                return []
+            wim_ids = self.persist.filter_uuids_by_tenant(
+                'wims', wim_ids, tenant)
+
+        return sorted(wim_ids)
 
     def find_common_wim(self, datacenter_ids, tenant):
         """Find a single WIM that is able to connect all the datacenters
@@ -325,28 +321,84 @@ class WimEngine(object):
             object with the WIM account that is able to connect all the
                  datacenters.
         """
-        wim_id = self.find_common_wim(datacenter_ids, tenant)
-        return self.persist.get_wim_account_by(wim_id, tenant)
+        accounts = self.find_suitable_wim_accounts([datacenter_ids], tenant)
+        return accounts[frozenset(datacenter_ids)]
+
+    def find_suitable_wim_accounts(self, datacenter_sets, tenant):
+        """Similar to ``find_suitable_wim_account``, but resolving several
+        sets of datacenters at once.
+
+        The WIMs are found in the port mapping index and the number of
+        database queries does not depend on the number of sets.
+
+        Arguments:
+            datacenter_sets (list): each element is a list of UUIDs of
+                datacenters (vims) that need to be connected.
+            tenant (str): UUID of the OSM tenant
+
+        Returns:
+            dict: WIM account for each distinct set of datacenters (the keys
+                are frozensets of datacenter UUIDs)
+
+        Raises:
+            NoWimConnectedToDatacenters: if no WIM connected to all the
+                datacenters of a set is found
+        """
+        index = self.persist.port_mapping_index
+        candidates = {}
+        for datacenter_ids in datacenter_sets:
+            key = frozenset(datacenter_ids)
+            candidates[key] = index.find_wims(key)
+
+        wim_ids = sorted(set(chain.from_iterable(candidates.values())))
+        accounts = {}
+        if wim_ids:
+            # Just the WIMs with an account for the tenant are considered
+            for account in self.persist.get_wim_accounts_by(
+                    wim_ids, tenant, error_if_none=False):
+                accounts.setdefault(account['wim_id'], account)
+
+        tenant_datacenters = None
+        if tenant and accounts:
+            tenant_datacenters = self.persist.filter_uuids_by_tenant(
+                'datacenters', chain.from_iterable(candidates), tenant)
+
+        accounts_by_set = {}
+        for datacenter_ids, wims in candidates.items():
+            suitable_wim_ids = sorted(wim for wim in wims if wim in accounts)
+            if not suitable_wim_ids or (tenant_datacenters is not None and
+                                        datacenter_ids - tenant_datacenters):
+                raise NoWimConnectedToDatacenters(sorted(datacenter_ids))
+            # TODO: use a criteria to determine which WIM is going to be used
+            #       (see find_common_wim)
+            accounts_by_set[datacenter_ids] = accounts[suitable_wim_ids[0]]
+
+        return accounts_by_set
 
     def derive_wan_link(self,
                         wim_usage,
                         instance_scenario_id, sce_net_id,
-                        networks, tenant, related=None):
-        """Create a instance_wim_nets record for the given information"""
-        if sce_net_id in wim_usage:
-            account_id = wim_usage[sce_net_id]
-            account = self.persist.get_wim_account_by(uuid=account_id)
-            wim_id = account['wim_id']
-        else:
-            datacenters = [n['datacenter_id'] for n in networks]
-            wim_id = self.find_common_wim(datacenters, tenant)
-            account = self.persist.get_wim_account_by(wim_id, tenant)
+                        networks, tenant, related=None, account=None):
+        """Create a instance_wim_nets record for the given information
+
+        If ``account`` is not given, the WIM account is retrieved from
+        the database (according to ``wim_usage`` or to the datacenters of
+        the ``networks``).
+        """
+        if account is None:
+            if sce_net_id in wim_usage:
+                account_id = wim_usage[sce_net_id]
+                account = self.persist.get_wim_account_by(uuid=account_id)
+            else:
+                datacenters = [n['datacenter_id'] for n in networks]
+                wim_id = self.find_common_wim(datacenters, tenant)
+                account = self.persist.get_wim_account_by(wim_id, tenant)
 
         return {
             'uuid': str(uuid4()),
             'instance_scenario_id': instance_scenario_id,
             'sce_net_id': sce_net_id,
-            'wim_id': wim_id,
+            'wim_id': account['wim_id'],
             'wim_account_id': account['uuid'],
             'related': related
         }
@@ -356,6 +408,11 @@ class WimEngine(object):
         considering a set of networks (VLDs) required for a scenario instance
         (NSR).
 
+        The WIM accounts are resolved at once for all the wan_links: the ones
+        listed in ``wim_usage`` with a single query and the remaining ones
+        once per distinct set of datacenters (see
+        ``find_suitable_wim_accounts``).
+
         Arguments:
             wim_usage(dict): Mapping between sce_net_id and wim_id. If wim_id is False, means not create wam_links
             networks(list): Dicts containing the information about the networks
@@ -377,14 +434,54 @@ class WimEngine(object):
         # we have to create a wan link connecting them.
         wan_groups = [key
                       for key, counter in datacenters_per_group
-                      if counter > 1]
+                      if counter > 1 and wim_usage.get(key[1]) is not False]
         # Keys are tuples(instance_scenario_id, sce_net_id)
+        accounts = self._resolve_wan_link_accounts(
+            wim_usage, wan_groups, grouped_networks, tenant)
+
         return [
             self.derive_wan_link(wim_usage,
-                                 key[0], key[1], grouped_networks[key], tenant, related)
-            for key in wan_groups if wim_usage.get(key[1]) is not False
+                                 key[0], key[1], grouped_networks[key], tenant,
+                                 related, accounts[key])
+            for key in wan_groups
         ]
 
+    def _resolve_wan_link_accounts(self, wim_usage, wan_groups,
+                                   grouped_networks, tenant):
+        """Retrieve the WIM account of each group of networks that requires a
+        wan_link
+
+        Returns:
+            dict: WIM account for each group key
+        """
+        account_ids = sorted(set(wim_usage[key[1]] for key in wan_groups
+                                 if key[1] in wim_usage))
+        accounts_by_uuid = {}
+        if account_ids:
+            accounts_by_uuid = {
+                account['uuid']: account
+                for account in self.persist.get_wim_accounts_by(
+                    uuid=account_ids, error_if_none=False)}
+            missing = [uuid for uuid in account_ids
+                       if uuid not in accounts_by_uuid]
+            if missing:
+                raise NoRecordFound({'wim_account.uuid': missing},
+                                    'wim_accounts')
+
+        datacenter_sets = {
+            key: frozenset(n['datacenter_id'] for n in grouped_networks[key])
+            for key in wan_groups if key[1] not in wim_usage}
+        accounts_by_set = (
+            self.find_suitable_wim_accounts(datacenter_sets.values(), tenant)
+            if datacenter_sets else {})
+
+        return {
+            key: (accounts_by_set[datacenter_sets[key]]
+                  if key in datacenter_sets
+                  else accounts_by_uuid[wim_usage[key[1]]])
+            for key in wan_groups
+        }
+
     def create_action(self, wan_link):
         """For a single wan_link create the corresponding create action"""
         return {
@@ -407,7 +504,7 @@ class WimEngine(object):
             'item': 'instance_wim_nets',
             'item_id': wan_link['uuid'],
             'wim_account_id': wan_link['wim_account_id'],
-            'extra': json.dumps({'wan_link': wan_link})
+            'extra': action_extra.dumps({'wan_link': wan_link})
             # We serialize and cache the wan_link here, because it can be
             # deleted during the delete process
         }
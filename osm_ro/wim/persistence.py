@@ -40,18 +40,22 @@ No domain logic/architectural concern should be present in this file.
 """
 import json
 import logging
+from collections import defaultdict
 from contextlib import contextmanager
+from copy import deepcopy
 from hashlib import sha1
 from itertools import groupby
 from operator import itemgetter
 from sys import exc_info
-# from time import time
+from threading import Lock
+from time import time
 from uuid import uuid1 as generate_uuid
 
 from six import reraise
 
 import yaml
 
+from .. import action_extra
 from ..utils import (
     check_valid_uuid,
     convert_float_timestamp2str,
@@ -144,12 +148,84 @@ be connected to two different places using the same port)
 """
 
 
+class PortMappingIndex(object):
+    """In-memory index of the ``wim_port_mappings`` records.
+
+    The records are indexed by (wim_id, datacenter_id, pop_switch_dpid,
+    pop_switch_port), that is unique in the database, and by datacenter,
+    in order to find the WIMs that are common to a set of datacenters.
+    ``version`` is the version of the port mappings from which the index was
+    built and ``fingerprint`` summarizes the state of the database table at
+    that moment (see :obj:`WimPersistence.port_mapping_index`).
+    """
+
+    def __init__(self, mappings=(), version=0, fingerprint=None):
+        self.version = version
+        self.fingerprint = fingerprint
+        self.by_port = {}
+        self.wims_by_datacenter = defaultdict(set)
+        self._wims_by_datacenter_set = {}
+
+        for mapping in mappings:
+            self.by_port[self._key(**mapping)] = mapping
+            self.wims_by_datacenter[mapping['datacenter_id']].add(
+                mapping['wim_id'])
+
+    @staticmethod
+    def _key(wim_id, datacenter_id, pop_switch_dpid, pop_switch_port, **_):
+        # The database compares the values as strings
+        return (wim_id, datacenter_id, str(pop_switch_dpid),
+                str(pop_switch_port))
+
+    def get(self, wim_id, datacenter_id, pop_switch_dpid, pop_switch_port):
+        """Find the port mapping that connects a datacenter switch port to a
+        WIM
+
+        Returns:
+            dict: copy of the port mapping record or None if not found
+        """
+        mapping = self.by_port.get(self._key(
+            wim_id, datacenter_id, pop_switch_dpid, pop_switch_port))
+        return deepcopy(mapping) if mapping else None
+
+    def find_wims(self, datacenter_ids):
+        """Find the WIMs that have port mappings for all the datacenters
+        listed
+
+        Returns:
+            frozenset: ids of the WIMs. The result is cached for each set of
+                datacenters.
+        """
+        key = frozenset(datacenter_ids)
+        wim_ids = self._wims_by_datacenter_set.get(key)
+        if wim_ids is None:
+            wims_per_datacenter = [
+                frozenset(self.wims_by_datacenter.get(datacenter_id, ()))
+                for datacenter_id in key]
+            wim_ids = (frozenset.intersection(*wims_per_datacenter)
+                       if wims_per_datacenter else frozenset())
+            self._wims_by_datacenter_set[key] = wim_ids
+
+        return wim_ids
+
+    def __len__(self):
+        return len(self.by_port)
+
+
 class WimPersistence(object):
     """High level interactions with the WIM tables in the database"""
 
+    PORT_MAPPING_INDEX_CHECK = 1
+    """Time (seconds) the port mapping index is reused without checking if
+    the database was modified by other processes"""
+
     def __init__(self, db, logger=None):
         self.db = db
         self.logger = logger or logging.getLogger('openmano.wim.persistence')
+        self.port_mappings_version = 0
+        self._port_mapping_index = None
+        self._port_mapping_index_checked = 0
+        self._port_mapping_index_lock = Lock()
 
     def query(self,
               FROM=None,
@@ -337,6 +413,8 @@ class WimPersistence(object):
         wim = self.get_by_name_or_uuid('wims', wim)
 
         self.db.delete_row_by_id('wims', wim['uuid'])
+        # The port mappings are deleted in cascade
+        self.invalidate_port_mappings()
 
         return wim['uuid'] + ' ' + wim['name']
 
@@ -538,18 +616,100 @@ class WimPersistence(object):
         if not isinstance(wim, dict):
             wim = self.get_by_name_or_uuid('wims', wim)
 
-        for port_mapping in port_mappings:
-            port_mapping['wim_name'] = wim['name']
-            datacenter = self.get_datacenter_by(
-                port_mapping['datacenter_name'], tenant)
-            for pop_wan_port_mapping in port_mapping['pop_wan_mappings']:
-                element = merge_dicts(pop_wan_port_mapping, {
-                    'wim_id': wim['uuid'],
-                    'datacenter_id': datacenter['uuid']})
-                self._create_single_port_mapping(element)
+        try:
+            for port_mapping in port_mappings:
+                port_mapping['wim_name'] = wim['name']
+                datacenter = self.get_datacenter_by(
+                    port_mapping['datacenter_name'], tenant)
+                for pop_wan_port_mapping in port_mapping['pop_wan_mappings']:
+                    element = merge_dicts(pop_wan_port_mapping, {
+                        'wim_id': wim['uuid'],
+                        'datacenter_id': datacenter['uuid']})
+                    self._create_single_port_mapping(element)
+        finally:
+            # Even when failing, some of the mappings might have been created
+            self.invalidate_port_mappings()
 
         return port_mappings
 
+    def invalidate_port_mappings(self):
+        """Signal that the ``wim_port_mappings`` table was modified, so the
+        in-memory index is rebuilt the next time it is used.
+        """
+        with self._port_mapping_index_lock:
+            self.port_mappings_version += 1
+
+    def _get_port_mappings_fingerprint(self):
+        """Summarize the state of the ``wim_port_mappings`` table with a
+        cheap query: inserts increase the maximum id, deletions reduce the
+        count and updates increase the maximum modification time.
+        """
+        row = self.db.get_rows(
+            SELECT=('COUNT(*) AS count', 'MAX(id) AS max_id',
+                    'MAX(modified_at) AS modified_at'),
+            FROM='wim_port_mappings')[0]
+        return (row['count'], row['max_id'], row['modified_at'])
+
+    @property
+    def port_mapping_index(self):
+        """In-memory index of all the port mappings
+        (see :obj:`PortMappingIndex`).
+
+        The index is built with a single query. It is rebuilt when the port
+        mappings are modified through this object, or when the database
+        fingerprint changes (modifications by other processes, e.g. forked
+        HTTP workers or other RO instances sharing the database). The
+        fingerprint is checked at most every ``PORT_MAPPING_INDEX_CHECK``
+        seconds.
+        """
+        with self._port_mapping_index_lock:
+            index = self._port_mapping_index
+            now = time()
+            if index and index.version == self.port_mappings_version:
+                if (now - self._port_mapping_index_checked <
+                        self.PORT_MAPPING_INDEX_CHECK):
+                    return index
+                fingerprint = self._get_port_mappings_fingerprint()
+                self._port_mapping_index_checked = now
+                if fingerprint == index.fingerprint:
+                    return index
+            else:
+                fingerprint = self._get_port_mappings_fingerprint()
+
+            version = self.port_mappings_version
+            mappings = self.query('wim_port_mappings',
+                                  postprocess=_postprocess_wim_port_mapping,
+                                  error_if_none=False)
+            index = self._port_mapping_index = PortMappingIndex(
+                mappings, version, fingerprint)
+            self._port_mapping_index_checked = now
+            self.logger.debug('Port mapping index (version %d) rebuilt with '
+                              '%d records', version, len(index))
+            return index
+
+    def filter_uuids_by_tenant(self, table, uuids, tenant):
+        """Select the WIMs or datacenters that are associated to a tenant
+
+        Arguments:
+            table (str): ``wims`` or ``datacenters``
+            uuids (list): uuids of the records to be checked
+            tenant (str): uuid or name of the NFVO tenant
+
+        Returns:
+            set: the uuids that belong to the tenant
+        """
+        uuids = sorted(set(uuids))
+        if not uuids:
+            return set()
+
+        from_, kind = {'wims': (_WIM_JOIN, 'wim'),
+                       'datacenters': (_DATACENTER_JOIN, 'datacenter')}[table]
+        records = self.query(from_, SELECT=('{}.uuid AS uuid'.format(kind),),
+                             tenant=tenant, error_if_none=False,
+                             **{kind: uuids})
+
+        return {record['uuid'] for record in records}
+
     def _filter_port_mappings_by_tenant(self, mappings, tenant):
         """Make sure all the datacenters and wims listed in the port mapping
         belong to an specific tenant
@@ -563,27 +723,18 @@ class WimPersistence(object):
         #       for `get_wim_port_mappings` we can have any combination of
         #       (wim, datacenter, tenant), not all of them having the 3 values
         #       so we have combinatorial trouble to write the 'FROM' statement.
+        #       Instead, a single query per table is used for all the mappings
 
-        kwargs = {'tenant': tenant, 'error_if_none': False}
-        # Cache results to speedup things
-        datacenters = {}
-        wims = {}
-
-        def _get_datacenter(uuid):
-            return (
-                datacenters.get(uuid) or
-                datacenters.setdefault(
-                    uuid, self.get_datacenters_by(uuid, **kwargs)))
-
-        def _get_wims(uuid):
-            return (wims.get(uuid) or
-                    wims.setdefault(uuid, self.get_wims(uuid, **kwargs)))
+        datacenters = self.filter_uuids_by_tenant(
+            'datacenters', (m['datacenter_id'] for m in mappings), tenant)
+        wims = self.filter_uuids_by_tenant(
+            'wims', (m['wim_id'] for m in mappings), tenant)
 
         return [
             mapping
             for mapping in mappings
-            if (_get_datacenter(mapping['datacenter_id']) and
-                _get_wims(mapping['wim_id']))
+            if mapping['datacenter_id'] in datacenters and
+            mapping['wim_id'] in wims
         ]
 
     def get_wim_port_mappings(self, wim=None, datacenter=None, tenant=None,
@@ -624,6 +775,7 @@ class WimPersistence(object):
 
     def delete_wim_port_mappings(self, wim_id):
         self.db.delete_row(FROM='wim_port_mappings', WHERE={"wim_id": wim_id})
+        self.invalidate_port_mappings()
         return "port mapping for wim {} deleted.".format(wim_id)
 
     def update_wim_port_mapping(self, id, properties):
@@ -639,6 +791,7 @@ class WimPersistence(object):
 
         num_changes = self.db.update_rows('wim_port_mappings',
                                           UPDATE=updates, WHERE={'id': id})
+        self.invalidate_port_mappings()
 
         if num_changes is None:
             raise UnexpectedDatabaseError(
@@ -842,11 +995,21 @@ def _serialize(value):
     return yaml.safe_dump(value, default_flow_style=True, width=256)
 
 
+def _serialize_field(field, value):
+    """Serialize the value of a field. The ``extra`` field of the actions
+    has its own encoding (see ``action_extra``)
+    """
+    if field == 'extra' or field.endswith('.extra'):
+        return action_extra.dumps(value)
+    return _serialize(value)
+
+
 def _unserialize(text):
     """Unserialize text representation into an arbitrary value,
-    so it can be loaded from the database
+    so it can be loaded from the database (both YAML and the ``extra``
+    encoding of the actions are accepted)
     """
-    return yaml.safe_load(text)
+    return action_extra.loads(text)
 
 
 def preprocess_record(record):
@@ -955,7 +1118,7 @@ def serialize_fields(record, fields=_SERIALIZED_FIELDS):
     keys = (k for k in keys for f in fields if k == f or k.endswith('.'+f))
 
     return merge_dicts(record, {
-        key: _serialize(record[key])
+        key: _serialize_field(key, record[key])
         for key in keys if record[key] is not None
     })
 
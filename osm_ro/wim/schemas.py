@@ -117,7 +117,12 @@ wim_schema_properties = {
     "config": {
         "type": "object",
         "properties": {
-            "wim_port_mapping": wim_port_mapping_desc
+            "wim_port_mapping": wim_port_mapping_desc,
+            "http_connect_timeout": {"type": "number", "minimum": 0,
+                                     "exclusiveMinimum": True},
+            "http_timeout": {"type": "number", "minimum": 0,
+                             "exclusiveMinimum": True},
+            "http_retries": {"type": "integer", "minimum": 0}
         }
     }
 }
@@ -42,7 +42,7 @@ from . import fixtures as eg
 from ...tests.db_helpers import TestCaseWithDatabasePerTest, uuid
 from ..errors import NoWimConnectedToDatacenters
 from ..engine import WimEngine
-from ..persistence import WimPersistence
+from ..persistence import PortMappingIndex, WimPersistence
 
 
 class TestWimEngineDbMethods(TestCaseWithDatabasePerTest):
@@ -147,15 +147,52 @@ class TestWimEngineDbMethods(TestCaseWithDatabasePerTest):
             self.engine.find_common_wim(
                 [uuid('dc0'), uuid('dc1')], tenant='tenant1')
 
+    def test_find_suitable_wim_accounts(self):
+        # Given we have 2 WIMs, one connecting dc0 and dc1 and the other
+        # connecting dc1 and dc2
+        self.populate([{'nfvo_tenants': [eg.tenant(0)]}] +
+                      eg.wim_set(0, 0) +
+                      eg.wim_set(1, 0) +
+                      eg.datacenter_set(0, 0) +
+                      eg.datacenter_set(1, 0) +
+                      eg.datacenter_set(2, 0) +
+                      [{'wim_port_mappings': [
+                          eg.wim_port_mapping(0, 0),
+                          eg.wim_port_mapping(0, 1),
+                          eg.wim_port_mapping(1, 1),
+                          eg.wim_port_mapping(1, 2)]}])
+
+        # When we retrieve the accounts for several sets of datacenters
+        accounts = self.engine.find_suitable_wim_accounts(
+            [[uuid('dc0'), uuid('dc1')], [uuid('dc2'), uuid('dc1')],
+             [uuid('dc1'), uuid('dc0')]], uuid('tenant0'))
+
+        # Then we should have one account for each distinct set
+        self.assertEqual(len(accounts), 2)
+        account = accounts[frozenset([uuid('dc0'), uuid('dc1')])]
+        self.assertEqual(account['uuid'], uuid('wim-account00'))
+        account = accounts[frozenset([uuid('dc1'), uuid('dc2')])]
+        self.assertEqual(account['uuid'], uuid('wim-account01'))
+
+        # When one of the sets cannot be connected by a single WIM
+        # Then a NoWimConnectedToDatacenters exception should be raised
+        with self.assertRaises(NoWimConnectedToDatacenters):
+            self.engine.find_suitable_wim_accounts(
+                [[uuid('dc0'), uuid('dc1')], [uuid('dc0'), uuid('dc2')]],
+                uuid('tenant0'))
+
 
 class TestWimEngine(unittest.TestCase):
     def test_derive_wan_link(self):
         # Given we have 2 datacenters connected by the same WIM, with port
         # mappings registered
-        mappings = [eg.processed_port_mapping(0, 0),
-                    eg.processed_port_mapping(0, 1)]
+        mappings = [eg.wim_port_mapping(0, 0),
+                    eg.wim_port_mapping(0, 1)]
+        account = {'uuid': uuid('wim-account00'), 'wim_id': uuid('wim0')}
         persist = MagicMock(
-            get_wim_port_mappings=MagicMock(return_value=mappings))
+            port_mapping_index=PortMappingIndex(mappings),
+            filter_uuids_by_tenant=lambda _, uuids, __: set(uuids),
+            get_wim_accounts_by=MagicMock(return_value=[account]))
 
         engine = WimEngine(persistence=persist)
         self.addCleanup(engine.stop_threads)
@@ -174,6 +211,35 @@ class TestWimEngine(unittest.TestCase):
         self.assertItemsEqual([l['sce_net_id'] for l in wan_links],
                               [uuid('vld0'), uuid('vld1')])
 
+    def test_derive_wan_links__constant_queries(self):
+        # Given we have 6 datacenters connected by the same WIM
+        mappings = [eg.wim_port_mapping(0, i) for i in range(6)]
+        account = {'uuid': uuid('wim-account00'), 'wim_id': uuid('wim0')}
+        persist = MagicMock(
+            port_mapping_index=PortMappingIndex(mappings),
+            filter_uuids_by_tenant=MagicMock(
+                side_effect=lambda _, uuids, __: set(uuids)),
+            get_wim_accounts_by=MagicMock(return_value=[account]))
+        engine = WimEngine(persistence=persist)
+
+        # When we receive the instance nets of 40 VLDs spanning the 6
+        # datacenters, with the WIM account of one of them already chosen
+        # and another one not using WIMs
+        instance_nets = eg.instance_nets(6, 40)
+        wim_usage = {uuid('vld0'): uuid('wim-account00'),
+                     uuid('vld1'): False}
+        wan_links = engine.derive_wan_links(
+            wim_usage, instance_nets, uuid('tenant0'))
+
+        # Then we should derive a wan_link for each VLD using WIMs
+        self.assertEqual(len(wan_links), 39)
+        for link in wan_links:
+            self.assertEqual(link['wim_account_id'], uuid('wim-account00'))
+        # And the number of queries should not depend on the number of VLDs
+        self.assertEqual(persist.get_wim_accounts_by.call_count, 2)
+        self.assertEqual(persist.filter_uuids_by_tenant.call_count, 1)
+        self.assertFalse(persist.get_wim_account_by.called)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -35,9 +35,11 @@
 from __future__ import unicode_literals
 
 import unittest
+from copy import deepcopy
 from itertools import chain
 from types import StringType
 
+from mock import MagicMock
 from six.moves import range
 
 from . import fixtures as eg
@@ -47,6 +49,7 @@ from ...tests.db_helpers import (
     uuid
 )
 from ..persistence import (
+    PortMappingIndex,
     WimPersistence,
     hide_confidential_fields,
     serialize_fields,
@@ -93,6 +96,68 @@ class TestPersistenceUtils(unittest.TestCase):
         assert result['confidential.info']['password'].startswith('***')
 
 
+class TestPortMappingIndex(unittest.TestCase):
+    def test_find_wims(self):
+        # Given wim0 is connected to dc0, dc1 and dc2, but wim1 just to dc0
+        index = PortMappingIndex([eg.wim_port_mapping(0, 0),
+                                  eg.wim_port_mapping(0, 1),
+                                  eg.wim_port_mapping(0, 2),
+                                  eg.wim_port_mapping(1, 0)])
+
+        # When we look for the wims common to a set of datacenters
+        # Then only the wims connected to all of them should be found
+        self.assertEqual(index.find_wims([uuid('dc0')]),
+                         {uuid('wim0'), uuid('wim1')})
+        self.assertEqual(index.find_wims([uuid('dc0'), uuid('dc2')]),
+                         {uuid('wim0')})
+        self.assertEqual(index.find_wims([uuid('dc0'), uuid('dc3')]), set())
+        # And the result should be reused for the same set of datacenters
+        self.assertIs(index.find_wims([uuid('dc2'), uuid('dc0')]),
+                      index.find_wims([uuid('dc0'), uuid('dc2')]))
+
+    def test_get(self):
+        # Given a port mapping between dc1 and wim0 at the port 2
+        mapping = eg.wim_port_mapping(0, 1, pop_port=2)
+        index = PortMappingIndex([mapping])
+
+        # When we look for it, using a numeric port
+        result = index.get(uuid('wim0'), uuid('dc1'),
+                           'AA:AA:AA:AA:AA:AA:AA:AA', 2)
+
+        # Then we should get a copy of the record
+        self.assertEqual(result, mapping)
+        self.assertIsNot(result, mapping)
+        self.assertIsNone(index.get(uuid('wim0'), uuid('dc1'),
+                                    'AA:AA:AA:AA:AA:AA:AA:AA', 3))
+
+    def test_rebuilt_when_modified_by_other_process(self):
+        # Given the port mappings of the database are summarized by a
+        # fingerprint
+        mappings = [eg.wim_port_mapping(0, 0)]
+        fingerprint = {'count': 1, 'max_id': 1, 'modified_at': None}
+
+        def get_rows(FROM, SELECT=(), **_):
+            if 'COUNT(*) AS count' in SELECT:
+                return [dict(fingerprint)]
+            return deepcopy(mappings)
+
+        persist = WimPersistence(MagicMock(get_rows=get_rows))
+        persist.PORT_MAPPING_INDEX_CHECK = 0
+        index = persist.port_mapping_index
+        # And the index is reused while the fingerprint does not change
+        self.assertIs(persist.port_mapping_index, index)
+
+        # When another process inserts a port mapping
+        mappings.append(eg.wim_port_mapping(0, 1))
+        fingerprint.update(count=2, max_id=2)
+
+        # Then the index should be rebuilt
+        self.assertIsNot(persist.port_mapping_index, index)
+        self.assertEqual(
+            persist.port_mapping_index.find_wims([uuid('dc0'), uuid('dc1')]),
+            {uuid('wim0')})
+
+
 class TestWimPersistence(TestCaseWithDatabasePerTest):
     def setUp(self):
         super(TestWimPersistence, self).setUp()
@@ -112,6 +177,39 @@ class TestWimPersistence(TestCaseWithDatabasePerTest):
         names = [r['name'] for r in results]
         self.assertItemsEqual(names, ['wim1', 'wim2'])
 
+    def test_port_mapping_index(self):
+        # Given a WIM and a datacenter without port mappings
+        self.populate([{'nfvo_tenants': [eg.tenant(0)]}] +
+                      eg.wim_set(0, 0) + eg.datacenter_set(0, 0))
+        self.assertEqual(len(self.persist.port_mapping_index), 0)
+
+        # When port mappings are created
+        self.persist.create_wim_port_mappings(uuid('wim0'), [{
+            'datacenter_name': 'dc0',
+            'pop_wan_mappings': [
+                {'pop_switch_dpid': 'AA:AA:AA:AA:AA:AA:AA:AA',
+                 'pop_switch_port': 1,
+                 'wan_service_mapping_info': {
+                     'mapping_type': 'dpid-port',
+                     'wan_switch_dpid': 'BB:BB:BB:BB:BB:BB:BB:BB',
+                     'wan_switch_port': 1}}]}])
+
+        # Then the index should be rebuilt with a new version
+        index = self.persist.port_mapping_index
+        self.assertEqual(index.version, self.persist.port_mappings_version)
+        mapping = index.get(uuid('wim0'), uuid('dc0'),
+                            'AA:AA:AA:AA:AA:AA:AA:AA', 1)
+        mapping_info = mapping['wan_service_mapping_info']
+        self.assertEqual(mapping_info['wan_switch_port'], 1)
+        # and reused while the port mappings are not modified
+        self.assertIs(self.persist.port_mapping_index, index)
+
+        # When the port mappings are deleted
+        self.persist.delete_wim_port_mappings(uuid('wim0'))
+
+        # Then they should disappear from the index
+        self.assertEqual(len(self.persist.port_mapping_index), 0)
+
     def test_get_wim_account_by_wim_tenant(self):
         # Given a database contains WIM accounts associated to Tenants
         self.populate()
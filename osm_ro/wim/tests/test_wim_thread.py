@@ -51,7 +51,7 @@ from ...tests.db_helpers import (
 )
 from ..engine import WimEngine
 from ..persistence import WimPersistence
-from ..wim_thread import WimThread
+from ..wim_thread import TaskQueue, WimThread
 
 
 ignore_connector = patch('osm_ro.wim.wim_thread.CONNECTORS', MagicMock())
@@ -314,18 +314,104 @@ class TestWimThread(unittest.TestCase):
         # When we call the refresh_elements
         processed = self.thread.process_list('refresh')
 
-        # Then we should have 25 updates (since SUPERSEDED updates are cheap,
+        # Then we should have 20 updates (since SUPERSEDED updates are cheap,
         # they are not counted for the limits)
-        self.assertEqual(processed, 25)
+        self.assertEqual(processed, 20)
 
-        # The SUPERSEDED tasks should be removed, 5 tasks should be untouched,
-        # and 10 tasks should be rescheduled
+        # The SUPERSEDED tasks found until completing the batch should be
+        # removed, the other ones are removed lazily when reached. 10 tasks
+        # should be untouched (5 of them superseded), and 10 tasks should be
+        # rescheduled
         refresh_tasks = self.thread.refresh_tasks
         old = [t for t in refresh_tasks if t.process_at <= now]
         new = [t for t in refresh_tasks if t.process_at > now]
-        self.assertEqual(len(old), 5)
+        self.assertEqual(len(old), 10)
+        self.assertEqual(len([t for t in old if t.is_superseded]), 5)
         self.assertEqual(len(new), 10)
-        self.assertEqual(len(self.thread.refresh_tasks), 15)
+        self.assertEqual(len(self.thread.refresh_tasks), 20)
+
+        # And the remaining SUPERSEDED tasks are removed at the next round
+        self.assertEqual(self.thread.process_list('refresh'), 10)
+        self.assertFalse([t for t in refresh_tasks if t.is_superseded])
+
+    def test_process_refresh__all_services_at_once(self):
+        # Given we have 10 tasks in the refresh queue, and the WIM knows
+        # about the services of 8 of them
+        kwargs = {'action_id': uuid('action0')}
+        actions = eg.wim_actions('FIND', 'DONE', num_links=10, **kwargs)
+        self.thread.insert_pending_tasks(actions)
+        connector = self.thread.connector
+        connector.get_all_active_connectivity_services.return_value = {
+            a['wim_internal_id']: {'wim_status': 'ACTIVE'}
+            for a in actions[:8]}
+        connector.get_connectivity_service_status.return_value = {
+            'wim_status': 'DOWN'}
+
+        # When we process the refresh list
+        self.thread.process_list('refresh')
+
+        # Then the WIM should be asked once for all the services, and once
+        # for each one of the services not found
+        self.assertEqual(
+            connector.get_all_active_connectivity_services.call_count, 1)
+        self.assertEqual(
+            connector.get_connectivity_service_status.call_count, 2)
+        wan_link_statuses = [
+            call[0][1]['status']
+            for call in self.persist.update_wan_link.call_args_list]
+        self.assertEqual(wan_link_statuses, ['ACTIVE'] * 8 + ['DOWN'] * 2)
+
+    def test_process_refresh__one_by_one_if_not_implemented(self):
+        # Given a connector that cannot provide all the services at once
+        kwargs = {'action_id': uuid('action0')}
+        actions = eg.wim_actions('FIND', 'DONE', num_links=10, **kwargs)
+        self.thread.insert_pending_tasks(actions)
+        connector = self.thread.connector
+        connector.get_all_active_connectivity_services.side_effect = (
+            NotImplementedError)
+        connector.get_connectivity_service_status.return_value = {
+            'wim_status': 'ACTIVE'}
+
+        # When we process the refresh list
+        self.thread.process_list('refresh')
+
+        # Then the status of each service should be asked
+        self.assertEqual(
+            connector.get_connectivity_service_status.call_count, 10)
+
+        # And the WIM should not be asked again for all of them
+        self.assertIsNone(self.thread.get_service_statuses(
+            time() + self.thread.REFRESH_ALL))
+        self.assertEqual(
+            connector.get_all_active_connectivity_services.call_count, 1)
+
+
+class TestTaskQueue(unittest.TestCase):
+    def test_pop_in_time_order(self):
+        # Given tasks inserted out of order, two of them at the same time
+        queue = TaskQueue()
+        for name, when in (('c', 30), ('a', 10), ('b1', 20), ('b2', 20)):
+            queue.push(name, when)
+
+        # Then just the due ones are popped, in time and insertion order
+        popped = []
+        entry = queue.pop(25)
+        while entry:
+            popped.append(entry[TaskQueue.TASK])
+            entry = queue.pop(25)
+        self.assertEqual(popped, ['a', 'b1', 'b2'])
+        self.assertEqual(list(queue), ['c'])
+
+    def test_restore_keeps_position(self):
+        queue = TaskQueue(tasks=[])
+        for name in ('a', 'b', 'c'):
+            queue.push(name, 10)
+
+        entry = queue.pop(10)
+        queue.restore(entry)
+
+        self.assertEqual(len(queue), 3)
+        self.assertEqual(queue, ['a', 'b', 'c'])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+import unittest
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+import requests
+from mock import patch
+
+from ..wimconn_ietfl2vpn import WimconnectorIETFL2VPN
+
+
+class _StandInServer(ThreadingMixIn, HTTPServer):
+    """IETF L2VPN WIM stand-in that counts the connections and the requests,
+    and answers 503 to the first ``unavailable`` requests"""
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _StandInHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = []
+        self.unavailable = 0
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def handle(self):
+        with self.server.lock:
+            self.server.connections += 1
+        BaseHTTPRequestHandler.handle(self)
+
+    def _answer(self):
+        length = int(self.headers.getheader('content-length') or 0)
+        if length:
+            self.rfile.read(length)
+        with self.server.lock:
+            self.server.requests.append(self.command)
+            unavailable = self.server.unavailable > 0
+            self.server.unavailable -= 1
+        if unavailable:
+            code, body = 503, ''
+        elif self.command == 'POST':
+            code, body = 201, ''
+        elif self.command == 'DELETE':
+            code, body = 204, ''
+        else:
+            code, body = 200, json.dumps({})
+        self.send_response(code)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _answer
+
+
+class TestWimConnectorTransport(unittest.TestCase):
+    def setUp(self):
+        self.server = _StandInServer()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        wim = {'wim_url': 'http://127.0.0.1:{}'.format(
+            self.server.server_address[1])}
+        mapping = [{'wan_service_endpoint_id': 'endpoint{}'.format(i),
+                    'wan_service_mapping_info': {'site-id': 'site{}'.format(i)}}
+                   for i in range(2)]
+        self.connector = WimconnectorIETFL2VPN(
+            wim, {'user': 'user', 'passwd': 'passwd'},
+            {'service_endpoint_mapping': mapping})
+        self.connector.BACKOFF = 0.001
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_reused_for_100_links(self):
+        connection_points = [
+            {'service_endpoint_id': 'endpoint{}'.format(i),
+             'service_endpoint_encapsulation_type': 'dot1q',
+             'service_endpoint_encapsulation_info': {'vlan': 100 + i}}
+            for i in range(2)]
+
+        # When 100 links are created and their status is checked
+        for _ in range(100):
+            service_uuid, _ = self.connector.create_connectivity_service(
+                'ELINE', connection_points)
+            status = self.connector.get_connectivity_service_status(
+                service_uuid)
+            self.assertEqual(status['wim_status'], 'ACTIVE')
+
+        # Then all the requests are sent through the same connection
+        self.assertEqual(len(self.server.requests), 400)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_idempotent_request_retried(self):
+        self.server.unavailable = 2
+
+        status = self.connector.get_connectivity_service_status('service')
+
+        self.assertEqual(status['wim_status'], 'ACTIVE')
+        self.assertEqual(self.server.requests, ['GET'] * 3)
+
+    def test_post_not_retried_once_sent(self):
+        self.server.unavailable = 1
+
+        response = self.connector.request(
+            'POST', self.connector.wim['wim_url'] + '/services', json={})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.server.requests, ['POST'])
+
+    @patch('osm_ro.wim.wimconn.time.sleep')
+    def test_post_retried_if_not_connected(self, sleep):
+        url = self.connector.wim['wim_url']
+        self.server.shutdown()
+        self.server.server_close()
+
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.connector.request('POST', url + '/services', json={})
+
+        # The connection was refused, so the request was not sent
+        self.assertEqual(sleep.call_count, self.connector.RETRIES)
+        delays = [call[0][0] for call in sleep.call_args_list]
+        self.assertTrue(all(delay <= self.connector.BACKOFF * 2 ** i
+                            for i, delay in enumerate(delays)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -57,7 +57,7 @@ INSTANCE_VM_STATUS_ERROR = ('ERROR', 'VIM_ERROR',
 
 
 class RefreshMixin(object):
-    def refresh(self, connector, persistence):
+    def refresh(self, connector, persistence, status=None):
         """Ask the external WAN Infrastructure Manager system for updates on
         the status of the task.
 
@@ -65,12 +65,16 @@ class RefreshMixin(object):
             connector: object with API for accessing the WAN
                 Infrastructure Manager system
             persistence: abstraction layer for the database
+            status (dict): status of the connectivity service, as returned by
+                ``connector.get_connectivity_service_status``, when it is
+                already obtained for all the services at once (optional)
         """
         fields = ('wim_status', 'wim_info', 'error_msg')
         result = dict.fromkeys(fields)
 
         try:
             result.update(
+                status or
                 connector
                 .get_connectivity_service_status(self.wim_internal_id))
         except WimConnectorError as ex:
@@ -145,7 +149,8 @@ class WanLinkCreate(RefreshMixin, CreateAction):
 
         return self.execute(connector, persistence, ovim, instance_nets)
 
-    def _get_connection_point_info(self, persistence, ovim, instance_net):
+    def _get_connection_point_info(self, persistence, ovim, instance_net,
+                                   wim_id, datacenter):
         """Retrieve information about the connection PoP <> WAN
 
         Arguments:
@@ -157,6 +162,8 @@ class WanLinkCreate(RefreshMixin, CreateAction):
                 to a different network in a distinct VIM.
                 This method is used to trace what would be the way this network
                 can be accessed from the outside world.
+            wim_id: uuid of the WIM associated to the WIM account of the action
+            datacenter: record of the datacenter where ``instance_net`` is
 
         Returns:
             dict: Record representing the wan_port_mapping associated to the
@@ -170,7 +177,9 @@ class WanLinkCreate(RefreshMixin, CreateAction):
         # world. For that, we can use the rules given in the datacenter
         # configuration:
         datacenter_id = instance_net['datacenter_id']
-        datacenter = persistence.get_datacenter_by(datacenter_id)
+        if not datacenter:
+            raise InconsistentState('Datacenter not found: {}'.format(
+                datacenter_id))
         rules = safe_get(datacenter, 'config.external_connections', {}) or {}
         vim_info = instance_net.get('vim_info', {}) or {}
         # Alternatively, we can look for it, using the SDN assist
@@ -181,24 +190,18 @@ class WanLinkCreate(RefreshMixin, CreateAction):
             raise NoExternalPortFound(instance_net)
 
         # Then, we find the WAN switch that is connected to this external port
-        try:
-            wim_account = persistence.get_wim_account_by(
-                uuid=self.wim_account_id)
-
-            criteria = {
-                'wim_id': wim_account['wim_id'],
-                'pop_switch_dpid': external_port[0],
-                'pop_switch_port': external_port[1],
-                'datacenter_id': datacenter_id}
-
-            wan_port_mapping = persistence.query_one(
-                FROM='wim_port_mappings',
-                WHERE=criteria)
-        except NoRecordFound:
-            ex = InconsistentState('No WIM port mapping found:'
-                                   'wim_account: {}\ncriteria:\n{}'.format(
-                                       self.wim_account_id, pformat(criteria)))
-            reraise(ex.__class__, ex, exc_info()[2])
+        criteria = {
+            'wim_id': wim_id,
+            'pop_switch_dpid': external_port[0],
+            'pop_switch_port': external_port[1],
+            'datacenter_id': datacenter_id}
+
+        wan_port_mapping = persistence.port_mapping_index.get(**criteria)
+        if not wan_port_mapping:
+            raise InconsistentState(
+                'No WIM port mapping found:'
+                'wim_account: {}\ncriteria:\n{}'.format(
+                    self.wim_account_id, pformat(criteria)))
 
         # It is important to return encapsulation information if present
         mapping = merge_dicts(
@@ -333,6 +336,29 @@ class WanLinkCreate(RefreshMixin, CreateAction):
             raise NotImplementedError('Multipoint connectivity is not '
                                       'supported yet.')
 
+    def _get_wim_and_datacenters(self, persistence, instance_nets):
+        """Retrieve, once for all the ``instance_nets``, the records needed
+        to find their connection points
+
+        Returns:
+            tuple: uuid of the WIM of the action and dict with the datacenter
+                records by uuid
+        """
+        try:
+            wim_account = persistence.get_wim_account_by(
+                uuid=self.wim_account_id)
+        except NoRecordFound:
+            ex = InconsistentState('WIM account not found: {}'.format(
+                self.wim_account_id))
+            reraise(ex.__class__, ex, exc_info()[2])
+
+        datacenter_ids = sorted(set(n['datacenter_id'] for n in instance_nets))
+        datacenters = persistence.query(
+            'datacenters', WHERE={'uuid': datacenter_ids},
+            error_if_none=False) if datacenter_ids else []
+
+        return wim_account['wim_id'], {d['uuid']: d for d in datacenters}
+
     def _update_persistent_data(self, persistence, service_uuid, conn_info):
         """Store plugin/connector specific information in the database"""
         persistence.update_wan_link(self.item_id, {
@@ -345,8 +371,12 @@ class WanLinkCreate(RefreshMixin, CreateAction):
         dependencies are solved
         """
         try:
-            wan_info = (self._get_connection_point_info(persistence, ovim, net)
-                        for net in instance_nets)
+            wim_id, datacenters = self._get_wim_and_datacenters(
+                persistence, instance_nets)
+            wan_info = (self._get_connection_point_info(
+                persistence, ovim, net, wim_id,
+                datacenters.get(net['datacenter_id']))
+                for net in instance_nets)
             connection_points = [self._derive_connection_point(w)
                                  for w in wan_info]
 
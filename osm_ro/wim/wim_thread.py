@@ -39,20 +39,22 @@ database (vim_wim_actions table) and processed sequentially
 Please check the Action class for information about the content of each action.
 """
 
+import heapq
 import logging
+import os
 import threading
 from contextlib import contextmanager
 from functools import partial
-from itertools import islice, chain, takewhile
-from operator import itemgetter, attrgetter
+from itertools import count
 from sys import exc_info
 from time import time, sleep
 
 from six import reraise
 from six.moves import queue
 
+from .. import task_relay
 from . import wan_link_actions
-from ..utils import ensure, partition, pipe
+from ..utils import ensure
 from .actions import IGNORE, PENDING, REFRESH
 from .errors import (
     DbBaseException,
@@ -79,6 +81,55 @@ CONNECTORS = {
 }
 
 
+class TaskQueue(object):
+    """Priority queue of actions ordered by ``process_at`` (actions with
+    the same time keep the insertion order), implemented as a binary heap.
+
+    Iterating (or indexing) the queue gives the actions in time order. It is
+    intended for inspection only, since it needs to sort the entries.
+    """
+    TIME, TASK = 0, 2
+    """Fields of each heap entry"""
+
+    def __init__(self, tasks=()):
+        self._heap = []
+        self._sequence = count()
+        for task in tasks:
+            self.push(task, task.process_at or 0)  # None: process now
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __iter__(self):
+        return (entry[self.TASK] for entry in sorted(self._heap))
+
+    def __getitem__(self, index):
+        return list(self)[index]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def push(self, task, when):
+        """Insert a task to be processed at ``when``, in O(log n)"""
+        entry = [when, next(self._sequence), task]
+        heapq.heappush(self._heap, entry)
+        return entry
+
+    def pop(self, now):
+        """Remove and return the heap entry of the first task that should be
+        processed before ``now``, in O(log n). None if there is no one"""
+        if self._heap and self._heap[0][self.TIME] <= now:
+            return heapq.heappop(self._heap)
+        return None
+
+    def restore(self, entry):
+        """Insert again an entry returned by ``pop``, keeping its position"""
+        heapq.heappush(self._heap, entry)
+
+
 class WimThread(threading.Thread):
     """Specialized task queue implementation that runs in an isolated thread.
 
@@ -96,6 +147,8 @@ class WimThread(threading.Thread):
     RETRY_SCHEDULED = 10  # 10 seconds
     REFRESH_BUILD = 10    # 10 seconds
     REFRESH_ACTIVE = 60   # 1 minute
+    REFRESH_ALL = 10      # 10 seconds reusing the status of all the services
+    BULK_REFRESH = True   # Obtain the status of all the services at once
     BATCH = 10            # 10 actions per round
     QUEUE_SIZE = 2000
     RECOVERY_TIME = 5     # Sleep 5s to leave the system some time to recover
@@ -123,12 +176,19 @@ class WimThread(threading.Thread):
         self.ovim = ovim
 
         self.task_queue = queue.Queue(self.QUEUE_SIZE)
+        self.pid = os.getpid()
+        """Process where the thread runs. Other processes use task_relay"""
 
-        self.refresh_tasks = []
-        """Time ordered task list for refreshing the status of WIM nets"""
+        self.task_queues = {'refresh': TaskQueue(), 'pending': TaskQueue()}
+        """Time ordered task queues for refreshing the status of WIM nets
+        ('refresh') and for creation, deletion of WIM nets ('pending')"""
 
-        self.pending_tasks = []
-        """Time ordered task list for creation, deletion of WIM nets"""
+        self.service_statuses = None
+        """Status of all the connectivity services of the WIM, obtained with
+        a single request, by service uuid"""
+
+        self.service_statuses_at = 0
+        self.bulk_refresh = self.BULK_REFRESH
 
         self.grouped_tasks = {}
         """ It contains all the creation/deletion pending tasks grouped by
@@ -145,9 +205,28 @@ class WimThread(threading.Thread):
             IGNORE: lambda task, *_, **__: task.save(self.persist)}
         """Send the task to the right processing queue"""
 
+    @property
+    def refresh_tasks(self):
+        return self.task_queues['refresh']
+
+    @refresh_tasks.setter
+    def refresh_tasks(self, tasks):
+        self.task_queues['refresh'] = TaskQueue(tasks)
+
+    @property
+    def pending_tasks(self):
+        return self.task_queues['pending']
+
+    @pending_tasks.setter
+    def pending_tasks(self, tasks):
+        self.task_queues['pending'] = TaskQueue(tasks)
+
     def on_start(self):
         """Run a series of procedures every time the thread (re)starts"""
         self.connector = self.get_connector()
+        self.service_statuses = None
+        self.service_statuses_at = 0
+        self.bulk_refresh = self.BULK_REFRESH
         self.reload_actions()
 
     def get_connector(self):
@@ -254,8 +333,8 @@ class WimThread(threading.Thread):
                               task.id, task.status, task.action, task.item)
 
     def schedule(self, task, when=None, list_name='pending'):
-        """Insert a task in the correct list, respecting the schedule.
-        The refreshing list is ordered by threshold_time (task.process_at)
+        """Insert a task in the correct queue, respecting the schedule.
+        The queues are ordered by threshold_time (task.process_at)
         It is assumed that this is called inside this thread
 
         Arguments:
@@ -265,48 +344,56 @@ class WimThread(threading.Thread):
             list_name: either 'refresh' or 'pending'
             when (float): unix time in seconds since as a float number
         """
-        processing_list = {'refresh': self.refresh_tasks,
-                           'pending': self.pending_tasks}[list_name]
+        processing_queue = self.task_queues[list_name]
 
         when = when or time()
         task.process_at = when
 
-        schedule = (t.process_at for t in processing_list)
-        index = len(list(takewhile(lambda moment: moment <= when, schedule)))
-
-        processing_list.insert(index, task)
+        processing_queue.push(task, when)
         self.logger.debug(
-            'Schedule of %s in "%s" - waiting position: %d (%f)',
-            task.id, list_name, index, task.process_at)
+            'Schedule of %s in "%s" - waiting tasks: %d (%f)',
+            task.id, list_name, len(processing_queue), task.process_at)
 
         return task
 
     def process_list(self, list_name='pending'):
-        """Process actions in batches and reschedule them if necessary"""
-        task_list, handler = {
-            'refresh': (self.refresh_tasks, self._refresh_single),
-            'pending': (self.pending_tasks, self._process_single)}[list_name]
+        """Process actions in batches and reschedule them if necessary.
 
-        now = time()
-        waiting = ((i, task) for i, task in enumerate(task_list)
-                   if task.process_at is None or task.process_at <= now)
-
-        is_superseded = pipe(itemgetter(1), attrgetter('is_superseded'))
-        superseded, active = partition(is_superseded, waiting)
-        superseded = [(i, t.save(self.persist)) for i, t in superseded]
-
-        batch = islice(active, self.BATCH)
-        refreshed = [(i, handler(t)) for i, t in batch]
+        Superseded actions are removed lazily: they are just saved when they
+        reach the head of the queue, without counting for the batch limit.
+        """
+        handler = {'refresh': self._refresh_single,
+                   'pending': self._process_single}[list_name]
+        processing_queue = self.task_queues[list_name]
 
-        # Since pop changes the indexes in the list, we need to do it backwards
-        remove = sorted([i for i, _ in chain(refreshed, superseded)])
-        return len([task_list.pop(i) for i in reversed(remove)])
+        now = time()
+        processed = batch = 0
+        while batch < self.BATCH:
+            entry = processing_queue.pop(now)
+            if not entry:
+                break
+            task = entry[TaskQueue.TASK]
+            if task.is_superseded:
+                task.save(self.persist)
+            else:
+                try:
+                    handler(task)
+                except Exception:
+                    # keep the task, as it would be if it was not processed
+                    processing_queue.restore(entry)
+                    raise
+                batch += 1
+            processed += 1
+
+        return processed
 
     def _refresh_single(self, task):
         """Refresh just a single task, and reschedule it if necessary"""
         now = time()
 
-        result = task.refresh(self.connector, self.persist)
+        statuses = self.get_service_statuses(now) or {}
+        result = task.refresh(self.connector, self.persist,
+                              statuses.get(task.wim_internal_id))
         self.logger.debug('Refreshing WIM task: %s (%s): %s %s => %r',
                           task.id, task.status, task.action, task.item, result)
 
@@ -315,6 +402,38 @@ class WimThread(threading.Thread):
 
         return result
 
+    def get_service_statuses(self, now=None):
+        """Obtain the status of all the connectivity services of the WIM
+        with a single request, reused during ``REFRESH_ALL`` seconds
+
+        Returns:
+            dict: service uuid as key, status as value. None if the connector
+                cannot provide it, and then each service is refreshed with a
+                separated request
+        """
+        if not self.bulk_refresh:
+            return None
+
+        now = now or time()
+        if now - self.service_statuses_at < self.REFRESH_ALL:
+            return self.service_statuses
+
+        self.service_statuses_at = now
+        try:
+            self.service_statuses = (
+                self.connector.get_all_active_connectivity_services())
+        except NotImplementedError:
+            self.logger.debug('WIM connector cannot provide the status of all '
+                              'the services. Refreshing them one by one')
+            self.bulk_refresh = False
+            self.service_statuses = None
+        except WimConnectorError as ex:
+            self.logger.error('Unable to obtain the status of all the '
+                              'services: %s', ex)
+            self.service_statuses = None
+
+        return self.service_statuses
+
     def _process_single(self, task):
         """Process just a single task, and reschedule it if necessary"""
         now = time()
@@ -340,6 +459,9 @@ class WimThread(threading.Thread):
                 task. For more information about the fields in task, please
                 check the Action class.
         """
+        if self.pid != os.getpid():
+            # called at a forked http worker process
+            return task_relay.send('wim', self.wim_account['uuid'], task)
         try:
             self.task_queue.put(task, False)
             return None
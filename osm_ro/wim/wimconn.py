@@ -38,6 +38,12 @@ It receives information from the WimThread/WAN Actions about the endpoints of
 a link that spans across multiple datacenters and stablish a path between them.
 """
 import logging
+import random
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.exceptions import NewConnectionError
 
 from ..http_tools.errors import HttpMappedError
 
@@ -61,7 +67,20 @@ class WimConnector(object):
 
     The arguments of the constructor are converted to object attributes.
     An extra property, ``service_endpoint_mapping`` is created from ``config``.
+
+    The HTTP requests to the WIM should be sent with :meth:`~.request`, that
+    keeps the connections open between requests. The timeouts and retries can
+    be changed at the WIM config with the keys ``http_connect_timeout``,
+    ``http_timeout`` (seconds) and ``http_retries``.
     """
+    CONNECT_TIMEOUT = 10  # seconds to establish a connection
+    TIMEOUT = 60          # seconds waiting for the WIM answer
+    RETRIES = 3           # retries of a request upon connection errors
+    BACKOFF = 0.5         # seconds before the first retry, doubled each time
+    POOL_SIZE = 4         # connections kept open with the WIM
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+    RETRY_STATUS = (502, 503, 504)
+
     def __init__(self, wim, wim_account, config=None, logger=None):
         self.logger = logger or logging.getLogger('openmano.wim.wimconn')
 
@@ -69,7 +88,76 @@ class WimConnector(object):
         self.wim_account = wim_account
         self.config = config or {}
         self.service_endpoint_mapping = (
-            config.get('service_endpoint_mapping', []))
+            self.config.get('service_endpoint_mapping', []))
+
+        wim_config = wim.get('config') or {}
+        if not isinstance(wim_config, dict):
+            wim_config = {}
+        self.timeout = (wim_config.get('http_connect_timeout',
+                                       self.CONNECT_TIMEOUT),
+                        wim_config.get('http_timeout', self.TIMEOUT))
+        self.retries = wim_config.get('http_retries', self.RETRIES)
+        self._session = None
+
+    @property
+    def session(self):
+        """``requests.Session`` used for all the requests to the WIM, so that
+        the connections are reused"""
+        if self._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1,
+                                  pool_maxsize=self.POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._session = session
+        return self._session
+
+    def request(self, method, url, **kwargs):
+        """Send an HTTP request to the WIM through the connector session.
+
+        Requests that fail because of the connection, or that are answered
+        with ``RETRY_STATUS``, are retried up to ``retries`` times, waiting
+        an exponential backoff with random jitter between them. Requests with
+        non idempotent methods (e.g. POST) are only retried when they could
+        not be sent.
+
+        Arguments:
+            method (str): HTTP method
+            url (str): full URL
+            **kwargs: other arguments of ``requests.Session.request``. By
+                default ``timeout`` is the connector one
+
+        Returns:
+            requests.Response: response of the last attempt
+
+        Raises:
+            requests.exceptions.RequestException: upon errors of the last
+                attempt
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        idempotent = method.upper() in self.IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, **kwargs)
+                if (not idempotent or attempt >= self.retries or
+                        response.status_code not in self.RETRY_STATUS):
+                    return response
+                cause = 'HTTP {}'.format(response.status_code)
+                response.close()
+            except requests.exceptions.RequestException as ex:
+                if attempt >= self.retries or not (
+                        _not_sent(ex) or idempotent and isinstance(
+                            ex, (requests.exceptions.ConnectionError,
+                                 requests.exceptions.Timeout))):
+                    raise
+                cause = ex
+            delay = self.BACKOFF * (2 ** attempt)
+            delay = random.uniform(delay / 2, delay)
+            attempt += 1
+            self.logger.warning('%s %s failed (%s). Retry %d in %.2fs',
+                                method, url, cause, attempt, delay)
+            time.sleep(delay)
 
     def check_credentials(self):
         """Check if the connector itself can access the WIM.
@@ -230,7 +318,27 @@ class WimConnector(object):
         """Provide information about all active connections provisioned by a
         WIM.
 
+        It is used to refresh the status of all the connectivity services
+        with a single request to the WIM. Services not included are refreshed
+        with :meth:`~.get_connectivity_service_status`.
+
+        Returns:
+            dict: service UUID as key, and the status of the connectivity
+                service as value, with the same format returned by
+                :meth:`~.get_connectivity_service_status`
+
         Raises:
             WimConnectorException: In case of error.
         """
         raise NotImplementedError
+
+
+def _not_sent(ex):
+    """Check if a request exception happened before sending the request, so
+    that it can be retried even if it is not idempotent"""
+    if isinstance(ex, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(ex, requests.exceptions.ConnectionError) and ex.args:
+        return isinstance(getattr(ex.args[0], 'reason', None),
+                          NewConnectionError)
+    return False
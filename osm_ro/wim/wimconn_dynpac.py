@@ -73,6 +73,8 @@ class DynpacConnector(WimConnector):
     # Public functions exposed to the Resource Orchestrator
     def __init__(self, wim, wim_account, config):
         self.logger = logging.getLogger(self.__WIM_LOGGER)
+        super(DynpacConnector, self).__init__(wim, wim_account, config,
+                                              self.logger)
         self.__wim = wim
         self.__wim_account = wim_account
         self.__config = config
@@ -93,7 +95,8 @@ class DynpacConnector(WimConnector):
         endpoint = "{}/service/create".format(self.__wim_url)
 
         try:
-            response = requests.post(endpoint, data=body, headers=headers)
+            response = self.request("POST", endpoint, data=body,
+                                    headers=headers)
         except requests.exceptions.RequestException as e:
             self.__exception(e.message, http_code=503)
 
@@ -115,7 +118,7 @@ class DynpacConnector(WimConnector):
     def get_connectivity_service_status(self, service_uuid):
         endpoint = "{}/service/status/{}".format(self.__wim_url, service_uuid)
         try:
-            response = requests.get(endpoint)
+            response = self.request("GET", endpoint)
         except requests.exceptions.RequestException as e:
             self.__exception(e.message, http_code=503)
 
@@ -128,7 +131,7 @@ class DynpacConnector(WimConnector):
     def delete_connectivity_service(self, service_uuid, conn_info):
         endpoint = "{}/service/delete/{}".format(self.__wim_url, service_uuid)
         try:
-            response = requests.delete(endpoint)
+            response = self.request("DELETE", endpoint)
         except requests.exceptions.RequestException as e:
             self.__exception(e.message, http_code=503)
         if response.status_code != 200:
@@ -139,7 +142,7 @@ class DynpacConnector(WimConnector):
     def clear_all_connectivity_services(self):
         endpoint = "{}/service/clearAll".format(self.__wim_url)
         try:
-            response = requests.delete(endpoint)
+            response = self.request("DELETE", endpoint)
             http_code = response.status_code
         except requests.exceptions.RequestException as e:
             self.__exception(e.message, http_code=503)
@@ -153,7 +156,7 @@ class DynpacConnector(WimConnector):
         endpoint = "{}/checkConnectivity".format(self.__wim_url)
 
         try:
-            response = requests.get(endpoint)
+            response = self.request("GET", endpoint)
             http_code = response.status_code
         except requests.exceptions.RequestException as e:
             self.__exception(e.message, http_code=503)
@@ -167,7 +170,7 @@ class DynpacConnector(WimConnector):
         auth = (self.__user, self.__passwd)
 
         try:
-            response = requests.get(endpoint, auth=auth)
+            response = self.request("GET", endpoint, auth=auth)
             http_code = response.status_code
         except requests.exceptions.RequestException as e:
             self.__exception(e.message, http_code=503)
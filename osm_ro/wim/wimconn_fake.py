@@ -47,7 +47,7 @@ class FakeConnector(WimConnector):
         self.logger = logging.getLogger('openmano.wimconn.fake')
         super(FakeConnector, self).__init__(wim, wim_account, config, logger)
         self.logger.debug("__init: wim='{}' wim_account='{}'".format(wim, wim_account))
-        self.connections = {}
+        self.connectivity = {}
         self.counter = 0
 
     def check_credentials(self):
@@ -134,4 +134,5 @@ class FakeConnector(WimConnector):
             WimConnectorException: In case of error.
         """
         self.logger.debug("get_all_active_connectivity_services")
-        return self.connectivity
+        return {service_uuid: {'wim_status': 'ACTIVE', 'wim_info': info}
+                for service_uuid, info in self.connectivity.items()}
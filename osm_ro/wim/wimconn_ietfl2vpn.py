@@ -62,7 +62,7 @@ class WimconnectorIETFL2VPN(WimConnector):
     def check_credentials(self):
         endpoint = "{}/restconf/data/ietf-l2vpn-svc:l2vpn-svc/vpn-services".format(self.wim["wim_url"])
         try:
-            response = requests.get(endpoint, auth=self.auth)    
+            response = self.request("GET", endpoint, auth=self.auth)    
             http_code = response.status_code
         except requests.exceptions.RequestException as e:
             raise WimConnectorError(e.message, http_code=503)
@@ -88,12 +88,12 @@ class WimconnectorIETFL2VPN(WimConnector):
             self.logger.info("Sending get connectivity service stuatus")
             servicepoint = "{}/restconf/data/ietf-l2vpn-svc:l2vpn-svc/vpn-services/vpn-service={}/".format(
                 self.wim["wim_url"], service_uuid)
-            response = requests.get(servicepoint, auth=self.auth)
+            response = self.request("GET", servicepoint, auth=self.auth)
             if response.status_code != requests.codes.ok:
                 raise WimConnectorError("Unable to obtain connectivity servcice status", http_code=response.status_code)
             service_status = {'wim_status': 'ACTIVE'}
             return service_status
-        except requests.exceptions.ConnectionError:
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
             raise WimConnectorError("Request Timeout", http_code=408)
                
     def search_mapp(self, connection_point):
@@ -170,9 +170,9 @@ class WimconnectorIETFL2VPN(WimConnector):
             try:
                 endpoint_service_creation = "{}/restconf/data/ietf-l2vpn-svc:l2vpn-svc/vpn-services".format(
                     self.wim["wim_url"])
-                response_service_creation = requests.post(endpoint_service_creation, headers=self.headers,
-                                                          json=vpn_service_l, auth=self.auth)
-            except requests.exceptions.ConnectionError:
+                response_service_creation = self.request("POST", endpoint_service_creation, headers=self.headers,
+                                                         json=vpn_service_l, auth=self.auth)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
                 raise WimConnectorError("Request to create service Timeout", http_code=408)
             if response_service_creation.status_code == 409:
                 raise WimConnectorError("Service already exists", http_code=response_service_creation.status_code)
@@ -220,8 +220,8 @@ class WimconnectorIETFL2VPN(WimConnector):
                     endpoint_site_network_access_creation = \
                         "{}/restconf/data/ietf-l2vpn-svc:l2vpn-svc/sites/site={}/site-network-accesses/".format(
                             self.wim["wim_url"], connection_point_wan_info["wan_service_mapping_info"]["site-id"])
-                    response_endpoint_site_network_access_creation = requests.post(
-                        endpoint_site_network_access_creation,
+                    response_endpoint_site_network_access_creation = self.request(
+                        "POST", endpoint_site_network_access_creation,
                         headers=self.headers,
                         json=site_network_accesses,
                         auth=self.auth)
@@ -244,7 +244,7 @@ class WimconnectorIETFL2VPN(WimConnector):
                         raise WimConnectorError("Request no accepted",
                                                 http_code=response_endpoint_site_network_access_creation.status_code)
                 
-                except requests.exceptions.ConnectionError:
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
                     self.delete_connectivity_service(vpn_service["vpn-id"])
                     raise WimConnectorError("Request Timeout", http_code=408)
             return uuid_l2vpn, conn_info
@@ -262,10 +262,10 @@ class WimconnectorIETFL2VPN(WimConnector):
             self.logger.info("Sending delete")
             servicepoint = "{}/restconf/data/ietf-l2vpn-svc:l2vpn-svc/vpn-services/vpn-service={}/".format(
                 self.wim["wim_url"], service_uuid)
-            response = requests.delete(servicepoint, auth=self.auth)
+            response = self.request("DELETE", servicepoint, auth=self.auth)
             if response.status_code != requests.codes.no_content:
                 raise WimConnectorError("Error in the request", http_code=response.status_code)
-        except requests.exceptions.ConnectionError:
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
             raise WimConnectorError("Request Timeout", http_code=408)
 
     def edit_connectivity_service(self, service_uuid, conn_info=None,
@@ -318,10 +318,9 @@ class WimconnectorIETFL2VPN(WimConnector):
                 endpoint_site_network_access_edit = \
                     "{}/restconf/data/ietf-l2vpn-svc:l2vpn-svc/sites/site={}/site-network-accesses/".format(
                         self.wim["wim_url"], connection_point_wan_info["wan_service_mapping_info"]["site-id"])
-                response_endpoint_site_network_access_creation = requests.put(endpoint_site_network_access_edit,
-                                                                              headers=self.headers,
-                                                                              json=site_network_accesses,
-                                                                              auth=self.auth)
+                response_endpoint_site_network_access_creation = self.request(
+                    "PUT", endpoint_site_network_access_edit, headers=self.headers, json=site_network_accesses,
+                    auth=self.auth)
                 if response_endpoint_site_network_access_creation.status_code == 400:
                     raise WimConnectorError("Service does not exist",
                                             http_code=response_endpoint_site_network_access_creation.status_code)
@@ -329,7 +328,7 @@ class WimconnectorIETFL2VPN(WimConnector):
                         response_endpoint_site_network_access_creation.status_code != 204:
                     raise WimConnectorError("Request no accepted",
                                             http_code=response_endpoint_site_network_access_creation.status_code)
-            except requests.exceptions.ConnectionError:
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
                 raise WimConnectorError("Request Timeout", http_code=408)
             counter += 1
         return None
@@ -339,10 +338,10 @@ class WimconnectorIETFL2VPN(WimConnector):
         try:
             self.logger.info("Sending clear all connectivity services")
             servicepoint = "{}/restconf/data/ietf-l2vpn-svc:l2vpn-svc/vpn-services".format(self.wim["wim_url"])
-            response = requests.delete(servicepoint, auth=self.auth)
+            response = self.request("DELETE", servicepoint, auth=self.auth)
             if response.status_code != requests.codes.no_content:
                 raise WimConnectorError("Unable to clear all connectivity services", http_code=response.status_code)
-        except requests.exceptions.ConnectionError:
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
             raise WimConnectorError("Request Timeout", http_code=408)
 
     def get_all_active_connectivity_services(self):
@@ -352,9 +351,15 @@ class WimconnectorIETFL2VPN(WimConnector):
         try:
             self.logger.info("Sending get all connectivity services")
             servicepoint = "{}/restconf/data/ietf-l2vpn-svc:l2vpn-svc/vpn-services".format(self.wim["wim_url"])
-            response = requests.get(servicepoint, auth=self.auth)
+            response = self.request("GET", servicepoint, auth=self.auth)
             if response.status_code != requests.codes.ok:
                 raise WimConnectorError("Unable to get all connectivity services", http_code=response.status_code)
-            return response
-        except requests.exceptions.ConnectionError:
+            content = response.json() or {}
+            vpn_services = content.get("ietf-l2vpn-svc:vpn-services") or content.get("vpn-services") or {}
+            # as get_connectivity_service_status, a service found is considered active
+            return {vpn_service["vpn-id"]: {'wim_status': 'ACTIVE'}
+                    for vpn_service in vpn_services.get("vpn-service") or ()}
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
             raise WimConnectorError("Request Timeout", http_code=408)
+        except (ValueError, KeyError, AttributeError) as e:
+            raise WimConnectorError("Unexpected content of connectivity services: {}".format(e))
@@ -0,0 +1,750 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2019
+# This file is part of openmano
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+##
+
+"""
+Module for measuring the performance of openmano. Each set of benchmarks is a subcommand. Some of them need a running
+openmano server (e.g. 'instance'), the others are executed locally against the osm_ro modules
+"""
+
+import logging
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+import requests
+import yaml
+
+__author__ = "Alfonso Tierno"
+__date__ = "$18-Mar-2019 10:15:02$"
+__version__ = "0.1.0"
+version_date = "Mar 2019"
+
+# make osm_ro importable both as package and as top-level modules (as test_RO.py does for openmanoclient)
+ro_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ro_path)
+sys.path.append(ro_path + "/osm_ro")
+
+
+def report(name, samples, unit="ms", scale=1000.0):
+    """Log a summary (number of samples, min, mean, p50, p99, max) of a list of measurements in seconds"""
+    if not samples:
+        logger.warning("{}: no samples".format(name))
+        return
+    samples = sorted(samples)
+
+    def percentile(p):
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100.0))] * scale
+
+    logger.info("{}: n={} min={:.3f}{unit} mean={:.3f}{unit} p50={:.3f}{unit} p99={:.3f}{unit} max={:.3f}{unit}"
+                .format(name, len(samples), samples[0] * scale, sum(samples) / len(samples) * scale,
+                        percentile(50), percentile(99), samples[-1] * scale, unit=unit))
+
+
+def benchmark_instance(args):
+    """Measure the time from POST /instances to the first VIM call done by the vim_thread. The first VIM call is
+    detected when the status of any task of the instance creation action leaves SCHEDULED, that vim_thread writes
+    once the VIM has answered. The time until any task is taken (locked) by a vim_thread, before calling the VIM, is
+    reported as task pickup"""
+    import openmanoclient
+    client = openmanoclient.openmanoclient(endpoint_url=args.endpoint_url, tenant_name=args.tenant_name,
+                                           datacenter_name=args.datacenter, debug=args.debug,
+                                           logger=logger.name)
+    tenant_id = client._get_tenant()
+    post_latency = []
+    pickup_latency = []
+    first_vim_call_latency = []
+    for index in range(args.repeat):
+        instance_descriptor = {"instance": {"name": "benchmark-{}".format(index), "scenario": args.scenario}}
+        if args.mgmt_net:
+            instance_descriptor["instance"]["networks"] = {"mgmt": {"sites": [{"netmap-use": args.mgmt_net}]}}
+        start = time.time()
+        instance = client.create_instance(instance_descriptor)
+        post_latency.append(time.time() - start)
+        try:
+            url = "{}/{}/instances/{}/action/{}".format(args.endpoint_url, tenant_id, instance["uuid"],
+                                                        instance["action_id"])
+            picked_up = False
+            while time.time() - start < args.timeout:
+                response = requests.get(url, headers=client.headers_req)
+                action = yaml.load(response.text)["actions"][0]
+                if not picked_up and any(task["worker"] or task["status"] != "SCHEDULED"
+                                         for task in action["vim_wim_actions"]):
+                    pickup_latency.append(time.time() - start)
+                    picked_up = True
+                if any(task["status"] != "SCHEDULED" for task in action["vim_wim_actions"]):
+                    first_vim_call_latency.append(time.time() - start)
+                    break
+                time.sleep(args.poll_interval)
+            else:
+                logger.error("Instance {}: no task processed after {} seconds".format(instance["uuid"],
+                                                                                      args.timeout))
+        finally:
+            client.delete_instance(uuid=instance["uuid"])
+    report("POST /instances", post_latency)
+    report("POST /instances to task pickup", pickup_latency)
+    report("POST /instances to first VIM call", first_vim_call_latency)
+
+
+def _instance_db_tables(vdus):
+    """Compose the rows that nfvo.create_instance stores for an instance of one VNF with 'vdus' VDUs, each one with a
+    management and a data interface"""
+    from uuid import uuid4
+    instance_id = str(uuid4())
+    action_id = str(uuid4())
+    datacenter_id = str(uuid4())
+    vnf_id = str(uuid4())
+    nets = [{"uuid": str(uuid4()), "instance_scenario_id": instance_id, "vim_name": "net{}".format(index),
+             "datacenter_id": datacenter_id, "datacenter_tenant_id": datacenter_id, "status": "BUILD",
+             "created": True, "multipoint": "true", "created_at": index} for index in range(2)]
+    vms = []
+    interfaces = []
+    vim_actions = [{"instance_action_id": action_id, "task_index": index, "datacenter_vim_id": datacenter_id,
+                    "action": "CREATE", "status": "SCHEDULED", "item": "instance_nets", "item_id": net["uuid"],
+                    "extra": "{params: [net, bridge, null, null, null]}"} for index, net in enumerate(nets)]
+    for index in range(vdus):
+        vm = {"uuid": str(uuid4()), "instance_vnf_id": vnf_id, "vm_id": str(uuid4()), "status": "BUILD",
+              "vim_name": "benchmark-vdu-{}".format(index)}
+        vms.append(vm)
+        for net in nets:
+            interfaces.append({"uuid": str(uuid4()), "instance_vm_id": vm["uuid"], "instance_net_id": net["uuid"],
+                               "type": "external", "floating_ip": 0, "port_security": 1})
+        vim_actions.append({"instance_action_id": action_id, "task_index": len(vim_actions),
+                            "datacenter_vim_id": datacenter_id, "action": "CREATE", "status": "SCHEDULED",
+                            "item": "instance_vms", "item_id": vm["uuid"],
+                            "extra": "{params: [vdu, image, flavor, true, null], depends_on: [0, 1]}"})
+    return [
+        {"instance_scenarios": {"uuid": instance_id, "name": "benchmark", "datacenter_id": datacenter_id,
+                                "datacenter_tenant_id": datacenter_id}},
+        {"instance_nets": nets},
+        {"instance_vnfs": {"uuid": vnf_id, "instance_scenario_id": instance_id, "vnf_id": str(uuid4()),
+                           "datacenter_id": datacenter_id, "datacenter_tenant_id": datacenter_id}},
+        {"instance_vms": vms},
+        {"instance_interfaces": interfaces},
+        {"instance_actions": {"uuid": action_id, "instance_id": instance_id, "description": "CREATE",
+                              "number_tasks": len(vim_actions)}},
+        {"vim_wim_actions": vim_actions},
+    ]
+
+
+def benchmark_insert(args):
+    """Measure the time of storing at database a new instance of many VDUs with nfvo_db.new_rows (rows inserted in
+    bulk) and with one INSERT per row. The database must have the openmano schema. Foreign key checks are disabled, and
+    the transaction is rolled back, so nothing is stored"""
+    from osm_ro import nfvo_db
+
+    class Rollback(Exception):
+        pass
+
+    def insert_row_by_row(tables):
+        created_time = time.time()
+        for table in tables:
+            for table_name, row_list in table.items():
+                if isinstance(row_list, dict):
+                    row_list = (row_list,)
+                for index, row in enumerate(row_list):
+                    if table_name in db.tables_with_created_field:
+                        created_time_param = created_time + (index + row.pop("created_at", 0)) * 0.00001
+                    else:
+                        created_time_param = 0
+                    db._new_row_internal(table_name, row, created_time=created_time_param)
+
+    db = nfvo_db.nfvo_db(args.db_host, args.db_user, args.db_passwd, args.db_name)
+    db.connect()
+    for name, function in (("one INSERT per row", insert_row_by_row), ("new_rows", db.new_rows)):
+        samples = []
+        for _ in range(args.repeat):
+            tables = _instance_db_tables(args.vdus)
+            try:
+                with db.transaction():
+                    db.cur.execute("SET FOREIGN_KEY_CHECKS=0")
+                    try:
+                        start = time.time()
+                        function(tables)
+                        samples.append(time.time() - start)
+                    finally:
+                        db.cur.execute("SET FOREIGN_KEY_CHECKS=1")
+                    raise Rollback()
+            except Rollback:
+                pass
+        report("insert instance of {} VDUs, {}".format(args.vdus, name), samples)
+    db.disconnect()
+
+
+def benchmark_query(args):
+    """Measure the python side cost of composing the query used by the vim_threads for polling their pending tasks.
+    It compares the legacy composition of the SQL text with the query builder of db_base, with and without the
+    template at the statement cache"""
+    from osm_ro import db_base
+    db = db_base.db_base()
+    where = {"datacenter_vim_id": "5286a274-8a1b-4b8d-a667-9c94261ad855", "status": ['SCHEDULED', 'BUILD', 'DONE'],
+             "worker": None}
+
+    def legacy():
+        return "SELECT instance_action_id FROM vim_wim_actions WHERE " + db._db_base__create_where(where)
+
+    def builder():
+        return db_base.build_select(SELECT=("instance_action_id",), FROM="vim_wim_actions", WHERE=where)
+
+    def builder_uncached():
+        db_base._statement_cache.clear()
+        return builder()
+
+    for name, function in (("legacy text", legacy), ("query builder, cached template", builder),
+                           ("query builder, new template", builder_uncached)):
+        samples = []
+        for _ in range(args.repeat):
+            start = time.time()
+            for _ in range(args.iterations):
+                function()
+            samples.append((time.time() - start) / args.iterations)
+        report("polling query, " + name, samples, unit="us", scale=1000000.0)
+
+
+def _instance_document(size):
+    """Compose a document like the one returned by GET /instances/<id>, with VNFs added until its json encoding has
+    at least 'size' bytes"""
+    import json
+    from uuid import uuid4
+    instance = {"uuid": str(uuid4()), "name": "benchmark", "description": "benchmark instance",
+                "datacenter_id": str(uuid4()), "scenario_id": str(uuid4()), "created_at": 1552900000.123456,
+                "nets": [], "vnfs": []}
+    while len(instance["vnfs"]) % 10 or len(json.dumps(instance)) < size:
+        vnf_index = len(instance["vnfs"])
+        net = {"uuid": str(uuid4()), "vim_net_id": str(uuid4()), "status": "ACTIVE", "created": True,
+               "sce_net_id": str(uuid4()), "error_msg": None, "vim_info": "{status: ACTIVE, mtu: 1500}"}
+        instance["nets"].append(net)
+        vms = []
+        for vm_index in range(4):
+            vms.append({"uuid": str(uuid4()), "vim_vm_id": str(uuid4()), "name": "vdu{}".format(vm_index),
+                        "status": "ACTIVE", "ip_address": "10.0.{}.{}".format(vnf_index % 256, vm_index),
+                        "vim_info": "{status: ACTIVE, OS-EXT-STS:vm_state: active, flavor: {id: " + str(uuid4()) +
+                                    "}, hostId: " + uuid4().hex + "}",
+                        "interfaces": [{"uuid": str(uuid4()), "vim_interface_id": str(uuid4()),
+                                        "mac_address": "fa:16:3e:00:{:02x}:{:02x}".format(vnf_index % 256, index),
+                                        "ip_address": "10.{}.0.{}".format(index, vm_index), "type": "external",
+                                        "sdn_port_id": None, "vim_net_id": net["vim_net_id"]}
+                                       for index in range(3)]})
+        instance["vnfs"].append({"uuid": str(uuid4()), "vnf_id": str(uuid4()), "member_vnf_index": str(vnf_index),
+                                 "vnf_name": "vnf{}".format(vnf_index), "vms": vms})
+    return instance
+
+
+def benchmark_format_out(args):
+    """Measure the throughput of http_tools.request_processing.format_out for a big instance document, with http
+    logging at INFO (bodies are not serialized) and at DEBUG (serialized and truncated), compared with the previous
+    behaviour that serialized the body to yaml at any log level and indented the json output"""
+    import bottle
+    import json
+    from osm_ro.http_tools import request_processing
+    data = _instance_document(args.size)
+    http_logger = logging.getLogger("openmano.http")
+    http_logger.addHandler(logging.StreamHandler(open(os.devnull, "w")))
+    http_logger.propagate = False
+
+    def legacy():
+        request_processing.logger.debug("OUT: " + yaml.safe_dump(data, explicit_start=True, indent=4,
+                                                                 default_flow_style=False, tags=False,
+                                                                 encoding='utf-8', allow_unicode=True))
+        return json.dumps(data, indent=4) + "\n"
+
+    bottle.request.bind({})
+    document_size = len(request_processing.format_out(data))
+    logger.info("document of {} bytes".format(document_size))
+    for name, log_level, query_string, function in (
+            ("legacy, log INFO", "INFO", "", legacy),
+            ("log INFO", "INFO", "", lambda: request_processing.format_out(data)),
+            ("log INFO, pretty", "INFO", "pretty", lambda: request_processing.format_out(data)),
+            ("log DEBUG", "DEBUG", "", lambda: request_processing.format_out(data))):
+        http_logger.setLevel(log_level)
+        bottle.request.bind({"QUERY_STRING": query_string, "HTTP_ACCEPT": "application/json"})
+        samples = []
+        for _ in range(args.repeat):
+            start = time.time()
+            function()
+            samples.append(time.time() - start)
+        report("format_out, " + name, samples)
+        mean = sum(samples) / len(samples)
+        logger.info("format_out, {}: {:.1f} MB/s".format(name, document_size / mean / 1e6))
+
+
+def benchmark_validate(args):
+    """Measure the validation throughput of the example descriptors with jsonschema.validate, that checks the schema
+    and builds a validator at each call, compared with the validators cached at openmano_schemas"""
+    import jsonschema
+    from osm_ro import openmano_schemas
+    documents = (
+        ("vnfd v02", "vnfs/examples/dataplaneVNF_2VMs_v02.yaml", openmano_schemas.vnfd_schema_v02),
+        ("nsd v03", "scenarios/examples/complex4.yaml", openmano_schemas.nsd_schema_v03),
+        ("instance create", "instance-scenarios/examples/instance-creation-complex4.yaml",
+         openmano_schemas.instance_scenario_create_schema_v01),
+    )
+    for name, file_name, schema in documents:
+        with open(os.path.join(ro_path, file_name)) as f:
+            data = yaml.safe_load(f)
+        for method, function in (("jsonschema.validate", jsonschema.validate),
+                                 ("cached validator", openmano_schemas.validate)):
+            samples = []
+            for _ in range(args.repeat):
+                start = time.time()
+                for _ in range(args.count):
+                    function(data, schema)
+                samples.append((time.time() - start) / args.count)
+            report("validate {}, {}".format(name, method), samples, unit="us", scale=1e6)
+            logger.info("validate {}, {}: {:.0f} documents/s".format(name, method, len(samples) / sum(samples)))
+
+
+def _vm_task_extra(interfaces):
+    """content of vim_wim_actions.extra for a created VM, as stored by vim_thread"""
+    vim_info = yaml.safe_dump({"status": "ACTIVE", "OS-EXT-SRV-ATTR:host": "compute-1", "flavor": {"id": "f" * 36},
+                               "addresses": {"net{}".format(i): [{"addr": "10.0.{}.5".format(i)}]
+                                             for i in range(interfaces)}},
+                              default_flow_style=True, width=256)
+    return {
+        "params": ["vm-name", "description", True, "i" * 36, "f" * 36, None,
+                   [{"name": "eth{}".format(i), "net_id": "TASK-{}".format(i), "type": "virtual", "model": "virtio",
+                     "mac_address": None, "ip_address": None, "port_security": True, "floating_ip": False,
+                     "use": "data", "vpci": None} for i in range(interfaces)],
+                   None, None, None],
+        "depends_on": list(range(interfaces)),
+        "created": True,
+        "created_items": {"port:{}".format(i) * 4: True for i in range(interfaces)},
+        "interfaces": {"p{}".format(i) * 9: {"iface_id": "u" * 36, "vim_info": "port info " * 20,
+                                              "mac_address": "fa:16:3e:00:00:{:02x}".format(i),
+                                              "ip_address": "10.0.{}.5".format(i)}
+                       for i in range(interfaces)},
+        "vim_status": "ACTIVE",
+        "vim_info": vim_info,
+        "critical_path": 12.345,
+    }
+
+
+def benchmark_extra(args):
+    """Measure the encoding and decoding of vim_wim_actions.extra for each task, as done by vim_thread, with yaml (the
+    previous encoding, and the one of the rows not migrated) and with action_extra"""
+    from osm_ro import action_extra
+    extra = _vm_task_extra(args.interfaces)
+    yaml_text = yaml.safe_dump(extra, default_flow_style=True, width=256)
+    json_text = action_extra.dumps(extra)
+    assert action_extra.loads(json_text) == yaml.load(yaml_text, Loader=yaml.SafeLoader)
+    logger.info("extra of {} bytes as yaml, {} bytes as json".format(len(yaml_text), len(json_text)))
+    for name, function in (
+            ("encode yaml", lambda: yaml.safe_dump(extra, default_flow_style=True, width=256)),
+            ("encode json", lambda: action_extra.dumps(extra)),
+            ("decode yaml (pure python)", lambda: yaml.load(yaml_text, Loader=yaml.SafeLoader)),
+            ("decode yaml (libyaml fallback)", lambda: action_extra.loads(yaml_text)),
+            ("decode json", lambda: action_extra.loads(json_text))):
+        samples = []
+        for _ in range(args.repeat):
+            start = time.time()
+            for _ in range(args.count):
+                function()
+            samples.append((time.time() - start) / args.count)
+        report("extra, " + name, samples, unit="us", scale=1e6)
+
+
+class _StandInDb(object):
+    """In-memory stand-in of nfvo_db for the http load test, where each query waits a fixed latency as a MySQL server
+    would do. It implements the methods used by the tenant requests"""
+    def __init__(self, latency):
+        import threading
+        self.latency = latency
+        self.tenants = {}
+        self.lock = threading.Lock()
+
+    def get_rows(self, FROM=None, SELECT=None, WHERE=None, LIMIT=None, **kwargs):
+        time.sleep(self.latency)
+        with self.lock:
+            rows = [dict(row) for row in self.tenants.values()
+                    if all(row.get(k) == v for k, v in (WHERE or {}).items())]
+        return rows[:LIMIT] if LIMIT else rows
+
+    def new_row(self, table, INSERT, **kwargs):
+        time.sleep(self.latency)
+        with self.lock:
+            self.tenants[INSERT["uuid"]] = dict(INSERT, created_at=time.time())
+        return INSERT["uuid"]
+
+    def reset_after_fork(self):
+        pass
+
+
+def benchmark_http(args):
+    """Replay a mix of GET and POST /tenants requests from several concurrent clients against an openmano http server
+    started at this process with the selected server mode, using a database stand-in. POST /tenants generates a RSA
+    key pair, so it is a slow request"""
+    import random
+    import threading
+    from osm_ro import httpserver
+    from uuid import uuid4
+    db = _StandInDb(args.db_latency / 1000.0)
+    # tenant read by the GET requests, inserted before starting the server so that prefork workers also have it
+    tenant_id = str(uuid4())
+    db.tenants[tenant_id] = {"uuid": tenant_id, "name": "benchmark", "created_at": time.time()}
+    httpserver.mydb = db
+    server = httpserver.httpserver(db, host="127.0.0.1", port=args.port, server_mode=args.mode, workers=args.workers,
+                                   worker_threads=args.worker_threads)
+    server.start()
+    url = "http://127.0.0.1:{}/openmano/tenants".format(args.port)
+    for _ in range(50):
+        try:
+            requests.get(url + "/" + tenant_id)
+            break
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    else:
+        logger.error("http server is not ready")
+        return
+
+    samples = {"GET": [], "POST": []}
+    errors = []
+
+    def client():
+        session = requests.Session()
+        for _ in range(args.requests):
+            start = time.time()
+            if random.random() < args.post_ratio:
+                method = "POST"
+                response = session.post(url, json={"tenant": {"name": "benchmark"}})
+            else:
+                method = "GET"
+                response = session.get(url + "/" + tenant_id)
+            samples[method].append(time.time() - start)
+            if not response.ok:
+                errors.append(response.status_code)
+
+    start = time.time()
+    clients = [threading.Thread(target=client) for _ in range(args.clients)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.time() - start
+    logger.info("{} mode, {} workers: {} requests in {:.3f}s, {:.1f} requests/s, {} errors".format(
+        args.mode, args.workers, args.clients * args.requests, elapsed, args.clients * args.requests / elapsed,
+        len(errors)))
+    report("GET /tenants/<id>", samples["GET"])
+    report("POST /tenants", samples["POST"])
+    report("all", samples["GET"] + samples["POST"])
+
+
+class _StandInWimPersistence(object):
+    """WimPersistence stand-in that does not store anything, so that only the processing of the WimThread is measured"""
+    def update_action(self, *args, **kwargs):
+        return 1
+
+    def update_wan_link(self, *args, **kwargs):
+        return 1
+
+    def update_instance_action_counters(self, *args, **kwargs):
+        return 1
+
+
+def benchmark_wim_schedule(args):
+    """Schedule a number of WAN link actions at a WimThread refresh queue, with a fraction of them superseded, and
+    process them in batches until all of them are refreshed once"""
+    from osm_ro.wim.wim_thread import WimThread
+    from osm_ro.wim.wimconn import WimConnector
+
+    class StandInConnector(WimConnector):
+        # get_all_active_connectivity_services is not implemented, so that each service is refreshed separately
+        def get_connectivity_service_status(self, service_uuid, conn_info=None):
+            return {"wim_status": "ACTIVE"}
+
+    account = {"uuid": "wim-account", "name": "benchmark", "wim": {"name": "benchmark"}}
+    for _ in range(args.repeat):
+        thread = WimThread(_StandInWimPersistence(), account)
+        thread.connector = StandInConnector(account["wim"], account)
+        records = [{"action": "FIND", "status": "DONE", "item": "instance_wim_nets", "item_id": "net-{}".format(i),
+                    "wim_internal_id": "service-{}".format(i), "wim_account_id": "wim-account",
+                    "instance_action_id": "action", "task_index": i, "extra": None}
+                   for i in range(args.count)]
+        start = time.time()
+        thread.insert_pending_tasks(records)
+        scheduled = time.time()
+        for index, task in enumerate(thread.refresh_tasks):
+            if index % args.superseded_period == 0:
+                task.status = "SUPERSEDED"
+        process_start = time.time()
+        processed = calls = 0
+        while processed < args.count:
+            processed += thread.process_list("refresh")
+            calls += 1
+        end = time.time()
+        logger.info("wim_schedule, {} actions: schedule {:.3f}s, process {:.3f}s in {} batches".format(
+            args.count, scheduled - start, end - process_start, calls))
+
+
+def benchmark_wim_refresh(args):
+    """Count the requests sent to the WIM (a wimconn_fake connector) by a WimThread that refreshes the status of a
+    number of WAN links during some simulated time, refreshing each link separately and all of them at once"""
+    from osm_ro.wim import wim_thread
+    from osm_ro.wim.wimconn_fake import FakeConnector
+
+    class CountingConnector(FakeConnector):
+        requests = 0
+
+        def get_connectivity_service_status(self, *args, **kwargs):
+            self.requests += 1
+            return FakeConnector.get_connectivity_service_status(self, *args, **kwargs)
+
+        def get_all_active_connectivity_services(self):
+            self.requests += 1
+            return FakeConnector.get_all_active_connectivity_services(self)
+
+    account = {"uuid": "wim-account", "name": "benchmark", "wim": {"name": "benchmark"}}
+    real_time = wim_thread.time
+    try:
+        for bulk_refresh in (False, True):
+            clock = [real_time()]
+            wim_thread.time = lambda: clock[0]
+            thread = wim_thread.WimThread(_StandInWimPersistence(), account)
+            thread.connector = CountingConnector(account["wim"], account, {})
+            thread.bulk_refresh = bulk_refresh
+            records = []
+            for i in range(args.count):
+                service_uuid, _ = thread.connector.create_connectivity_service("ELINE", [])
+                records.append({"action": "FIND", "status": "DONE", "item": "instance_wim_nets",
+                                "item_id": "net-{}".format(i), "wim_internal_id": service_uuid,
+                                "wim_account_id": "wim-account", "instance_action_id": "action", "task_index": i,
+                                "extra": None})
+            thread.insert_pending_tasks(records)
+            start = real_time()
+            end = clock[0] + args.minutes * 60
+            while clock[0] < end:
+                while thread.process_list("refresh"):
+                    pass
+                clock[0] += 1
+            logger.info("wim_refresh, {} links during {} minutes, {}: {} WIM requests, {:.3f}s".format(
+                args.count, args.minutes, "all at once" if bulk_refresh else "one by one",
+                thread.connector.requests, real_time() - start))
+    finally:
+        wim_thread.time = real_time
+
+
+class _StandInWimDb(object):
+    """Database stand-in with a WIM connecting a number of datacenters. It counts the queries and delays each one
+    with the given latency"""
+    def __init__(self, datacenters, latency):
+        self.datacenters = datacenters
+        self.latency = latency
+        self.queries = 0
+
+    def get_rows(self, FROM, **kwargs):
+        self.queries += 1
+        time.sleep(self.latency)
+        if "COUNT(*) AS count" in kwargs.get("SELECT", ()):
+            return [{"count": len(self.datacenters), "max_id": len(self.datacenters), "modified_at": None}]
+        elif FROM.startswith("wim_port_mappings"):
+            return [{"id": i, "wim_id": "wim0", "datacenter_id": datacenter, "pop_switch_dpid": "AA:AA:AA:AA",
+                     "pop_switch_port": str(i), "wan_service_endpoint_id": "endpoint-{}".format(i),
+                     "wan_service_mapping_info": None} for i, datacenter in enumerate(self.datacenters)]
+        elif FROM.startswith("wim_accounts"):
+            return [{"uuid": "wim-account", "name": "benchmark", "wim_id": "wim0", "nfvo_tenant_id": "tenant",
+                     "created": "false"}]
+        elif FROM.startswith("datacenters"):
+            return [{"uuid": datacenter} for datacenter in self.datacenters]
+        return [{"uuid": "wim0"}]
+
+
+def benchmark_wim_derive(args):
+    """Count the database queries and the time of planning the WAN links of a NS stretched over a number of sites, when
+    the WIM account of each VLD is resolved separately and when they are resolved at once"""
+    from osm_ro.wim.engine import WimEngine
+    from osm_ro.wim.persistence import WimPersistence
+    datacenters = ["dc{}".format(i) for i in range(args.sites)]
+    # each VLD connects 2 consecutive sites
+    vld_datacenters = [(datacenters[i % args.sites], datacenters[(i + 1) % args.sites]) for i in range(args.vlds)]
+    networks = [{"uuid": "net-{}-{}".format(i, datacenter), "datacenter_id": datacenter, "instance_scenario_id": "ns",
+                 "sce_net_id": "vld-{}".format(i)}
+                for i, vld in enumerate(vld_datacenters) for datacenter in vld]
+    for _ in range(args.repeat):
+        for batch in (False, True):
+            db = _StandInWimDb(datacenters, args.latency / 1000.0)
+            engine = WimEngine(WimPersistence(db))
+            start = time.time()
+            if batch:
+                accounts = engine.find_suitable_wim_accounts(vld_datacenters, "tenant")
+                wim_usage = {"vld-{}".format(i): accounts[frozenset(vld)]["uuid"]
+                             for i, vld in enumerate(vld_datacenters)}
+                wan_links = engine.derive_wan_links(wim_usage, networks, "tenant")
+            else:
+                wim_usage = {"vld-{}".format(i): engine.find_suitable_wim_account(vld, "tenant")["uuid"]
+                             for i, vld in enumerate(vld_datacenters)}
+                wan_links = [engine.derive_wan_link(wim_usage, "ns", "vld-{}".format(i),
+                                                    [n for n in networks if n["sce_net_id"] == "vld-{}".format(i)],
+                                                    "tenant")
+                             for i in range(args.vlds)]
+            logger.info("wim_derive, {} sites, {} VLDs, {}: {} wan links, {} queries, {:.3f}s".format(
+                args.sites, args.vlds, "at once" if batch else "one by one", len(wan_links), db.queries,
+                time.time() - start))
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description='Benchmark RO module')
+    parser.add_argument('-v', '--version', action='version', help="Show current version",
+                        version='%(prog)s version ' + __version__ + ' ' + version_date)
+
+    # Common parameters
+    parent_parser = ArgumentParser(add_help=False)
+    parent_parser.add_argument('--debug', help='Set logs to debug level', dest='debug', action="store_true")
+    parent_parser.add_argument('-r', '--repeat', help='Number of repetitions. By default 10', dest='repeat',
+                               type=int, default=10)
+
+    subparsers = parser.add_subparsers(help='benchmark sets')
+
+    # Instance benchmark set
+    # -------------------
+    instance_parser = subparsers.add_parser('instance', parents=[parent_parser],
+                                            help="measure the time from POST /instances to the first VIM call. It "
+                                                 "needs a running openmano server")
+    instance_parser.set_defaults(func=benchmark_instance)
+    # Mandatory arguments
+    mandatory_arguments = instance_parser.add_argument_group('mandatory arguments')
+    mandatory_arguments.add_argument('-d', '--datacenter', required=True, help='Set the datacenter to deploy at')
+    mandatory_arguments.add_argument('-s', '--scenario', required=True, help='Scenario uuid to instantiate')
+    # Optional arguments
+    instance_parser.add_argument("-n", '--mgmt-net-name', dest='mgmt_net',
+                                 help='vim management network used for the mgmt network of the scenario')
+    instance_parser.add_argument("-t", '--tenant', dest='tenant_name', default="osm",
+                                 help="Set the openmano tenant to use. By default 'osm'")
+    instance_parser.add_argument('-u', '--url', dest='endpoint_url', default='http://localhost:9090/openmano',
+                                 help="Set the openmano server url. By default 'http://localhost:9090/openmano'")
+    instance_parser.add_argument('--timeout', help='Maximum time waiting for the first VIM call. By default 60',
+                                 dest='timeout', type=int, default=60)
+    instance_parser.add_argument('--poll-interval', help='Time between checks of the action. By default 0.05',
+                                 dest='poll_interval', type=float, default=0.05)
+
+    # Query benchmark set
+    # -------------------
+    query_parser = subparsers.add_parser('query', parents=[parent_parser],
+                                         help="measure the cost of composing the SQL query of the vim_thread polling")
+    query_parser.set_defaults(func=benchmark_query)
+    query_parser.add_argument('-i', '--iterations', help='Queries composed at each repetition. By default 10000',
+                              dest='iterations', type=int, default=10000)
+
+    # Insert benchmark set
+    # -------------------
+    insert_parser = subparsers.add_parser('insert', parents=[parent_parser],
+                                          help="measure the database insertion of a big instance. It needs a mysql "
+                                               "database with the openmano schema")
+    insert_parser.set_defaults(func=benchmark_insert)
+    insert_parser.add_argument('--vdus', help='Number of VDUs of the instance. By default 500', dest='vdus', type=int,
+                               default=500)
+    insert_parser.add_argument('--db-host', help='Database host. By default localhost', dest='db_host',
+                               default='localhost')
+    insert_parser.add_argument('--db-user', help='Database user. By default mano', dest='db_user', default='mano')
+    insert_parser.add_argument('--db-passwd', help='Database password. By default manopw', dest='db_passwd',
+                               default='manopw')
+    insert_parser.add_argument('--db-name', help='Database name. By default mano_db', dest='db_name',
+                               default='mano_db')
+
+    # Format_out benchmark set
+    # -------------------
+    format_out_parser = subparsers.add_parser('format_out', parents=[parent_parser],
+                                              help="measure the throughput of the http response encoding")
+    format_out_parser.set_defaults(func=benchmark_format_out)
+    format_out_parser.add_argument('--size', help='Approximate size in bytes of the instance document. By default '
+                                                  '1000000', dest='size', type=int, default=1000000)
+
+    # Validate benchmark set
+    # -------------------
+    validate_parser = subparsers.add_parser('validate', parents=[parent_parser],
+                                            help="measure the throughput of the json schema validation")
+    validate_parser.set_defaults(func=benchmark_validate)
+    validate_parser.add_argument('--count', help='Validations of each sample. By default 200', dest='count', type=int,
+                                 default=200)
+
+    # Extra benchmark set
+    # -------------------
+    extra_parser = subparsers.add_parser('extra', parents=[parent_parser],
+                                         help="measure the encoding and decoding of the tasks content")
+    extra_parser.set_defaults(func=benchmark_extra)
+    extra_parser.add_argument('--interfaces', help='Interfaces of the VM task. By default 4', dest='interfaces',
+                              type=int, default=4)
+    extra_parser.add_argument('--count', help='Encodings of each sample. By default 500', dest='count', type=int,
+                              default=500)
+
+    # Http benchmark set
+    # -------------------
+    http_parser = subparsers.add_parser('http', parents=[parent_parser],
+                                        help="load test of the http server with a database stand-in")
+    http_parser.set_defaults(func=benchmark_http)
+    http_parser.add_argument('--mode', help='http server mode. By default threaded', dest='mode',
+                             choices=("single", "threaded", "prefork"), default="threaded")
+    http_parser.add_argument('--workers', help='Number of http workers. By default 10', dest='workers', type=int,
+                             default=10)
+    http_parser.add_argument('--worker-threads', help='Threads of each worker at prefork mode. By default 1',
+                             dest='worker_threads', type=int, default=1)
+    http_parser.add_argument('--clients', help='Number of concurrent clients. By default 20', dest='clients', type=int,
+                             default=20)
+    http_parser.add_argument('--requests', help='Requests sent by each client. By default 50', dest='requests',
+                             type=int, default=50)
+    http_parser.add_argument('--post-ratio', help='Fraction of POST requests. By default 0.1', dest='post_ratio',
+                             type=float, default=0.1)
+    http_parser.add_argument('--db-latency', help='Latency in ms of each database query. By default 5',
+                             dest='db_latency', type=float, default=5)
+    http_parser.add_argument('--port', help='Port of the http server. By default 19090', dest='port', type=int,
+                             default=19090)
+
+    # Wim_schedule benchmark set
+    # -------------------
+    wim_schedule_parser = subparsers.add_parser('wim_schedule', parents=[parent_parser],
+                                                help="measure the scheduling and processing of the WIM actions")
+    wim_schedule_parser.set_defaults(func=benchmark_wim_schedule)
+    wim_schedule_parser.add_argument('--count', help='Number of actions. By default 50000', dest='count', type=int,
+                                     default=50000)
+    wim_schedule_parser.add_argument('--superseded-period', help='One of each this number of actions is superseded. '
+                                                                 'By default 4', dest='superseded_period', type=int,
+                                     default=4)
+
+    # Wim_refresh benchmark set
+    # -------------------
+    wim_refresh_parser = subparsers.add_parser('wim_refresh', parents=[parent_parser],
+                                               help="count the WIM requests for refreshing the WAN links status")
+    wim_refresh_parser.set_defaults(func=benchmark_wim_refresh)
+    wim_refresh_parser.add_argument('--count', help='Number of WAN links. By default 1000', dest='count', type=int,
+                                    default=1000)
+    wim_refresh_parser.add_argument('--minutes', help='Simulated minutes. By default 10', dest='minutes', type=int,
+                                    default=10)
+
+    # Wim_derive benchmark set
+    # -------------------
+    wim_derive_parser = subparsers.add_parser('wim_derive', parents=[parent_parser],
+                                              help="count the database queries for planning the WAN links of a NS")
+    wim_derive_parser.set_defaults(func=benchmark_wim_derive)
+    wim_derive_parser.add_argument('--sites', help='Number of datacenters. By default 6', dest='sites', type=int,
+                                   default=6)
+    wim_derive_parser.add_argument('--vlds', help='Number of VLDs. By default 40', dest='vlds', type=int, default=40)
+    wim_derive_parser.add_argument('--latency', help='Latency of each database query in milliseconds. By default 5',
+                                   dest='latency', type=float, default=5)
+
+    args = parser.parse_args()
+
+    logger = logging.getLogger(os.path.basename(__file__))
+    logger.setLevel('DEBUG' if args.debug else 'INFO')
+    consoleHandler = logging.StreamHandler(sys.stdout)
+    consoleHandler.setFormatter(logging.Formatter('%(asctime)s %(name)s %(levelname)s: %(message)s'))
+    logger.addHandler(consoleHandler)
+
+    args.func(args)